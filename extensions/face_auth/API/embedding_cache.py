@@ -0,0 +1,287 @@
+import os
+import json
+import atexit
+import threading
+import numpy as np
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
+
+EMBEDDING_DIM = 512
+
+class DiskEmbeddingStore:
+    """
+    Fixed-capacity embedding store on disk: a memory-mapped (capacity, 512)
+    float32 file, a JSON snapshot of content hash -> slot, and a log of the
+    slots assigned since the snapshot. Slots are reused in ring order once the
+    file is full. Puts are appended to the log in batches of flush_every; the
+    snapshot is only rewritten once the log holds as many entries as there are
+    slots, so a flush costs the batch rather than the whole index. Reusing a
+    slot first logs that it is free, so a row overwritten on disk is never
+    read back under the key that owned it before.
+    """
+
+    def __init__(self, directory: str, capacity: int = 100000, namespace: str = ""):
+        self.directory = directory
+        self.capacity = max(1, int(capacity))
+        self.namespace = namespace
+        self.data_path = os.path.join(directory, 'embeddings.f32')
+        self.index_path = os.path.join(directory, 'index.json')
+        self.log_path = os.path.join(directory, 'index.log')
+        self.flush_every = 32
+
+        os.makedirs(directory, exist_ok=True)
+        self._slots: Dict[str, int] = {}
+        self._slot_keys: Dict[int, str] = {}
+        self._next_slot = 0
+        self._pending: List[Tuple[int, Optional[str]]] = []
+        self._log_entries = 0
+        self._log_offset = 0
+
+        if not self._load_index():
+            self._reset()
+
+    def _load_index(self) -> bool:
+        if not (os.path.exists(self.index_path) and os.path.exists(self.data_path)):
+            return False
+        try:
+            with open(self.index_path, 'r') as f:
+                index = json.load(f)
+            if index.get('capacity') != self.capacity or index.get('dim') != EMBEDDING_DIM:
+                return False
+            if index.get('namespace', '') != self.namespace:
+                return False
+
+            self._data = np.memmap(self.data_path, dtype=np.float32, mode='r+', shape=(self.capacity, EMBEDDING_DIM))
+            self._slots = {key: int(slot) for key, slot in index['slots'].items()}
+            self._slot_keys = {slot: key for key, slot in self._slots.items()}
+            self._next_slot = int(index.get('next_slot', 0)) % self.capacity
+            self._replay_log()
+            return True
+        except Exception as e:
+            print(f"⚠️ Embedding cache index unreadable, starting empty: {e}")
+            return False
+
+    def _replay_log(self):
+        if not os.path.exists(self.log_path):
+            return
+        with open(self.log_path, 'rb') as f:
+            data = f.read()
+        # A partial last line (interrupted append) is ignored and overwritten by the next append
+        complete = data[:data.rfind(b'\n') + 1]
+        for line in complete.splitlines():
+            slot, key = json.loads(line)
+            if key is None:
+                self._release(slot)
+            else:
+                self._assign(key, slot)
+            self._next_slot = (slot + 1) % self.capacity
+            self._log_entries += 1
+        self._log_offset = len(complete)
+
+    def _reset(self):
+        self._data = np.memmap(self.data_path, dtype=np.float32, mode='w+', shape=(self.capacity, EMBEDDING_DIM))
+        self._slots = {}
+        self._slot_keys = {}
+        self._next_slot = 0
+        self._pending = []
+        self._write_snapshot()
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def _release(self, slot: int) -> bool:
+        old_key = self._slot_keys.pop(slot, None)
+        if old_key is None:
+            return False
+        del self._slots[old_key]
+        return True
+
+    def _assign(self, key: str, slot: int):
+        old_slot = self._slots.get(key)
+        if old_slot is not None and old_slot != slot:
+            del self._slot_keys[old_slot]
+        self._release(slot)
+        self._slots[key] = slot
+        self._slot_keys[slot] = key
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        slot = self._slots.get(key)
+        if slot is None:
+            return None
+        return np.array(self._data[slot])
+
+    def put(self, key: str, embedding: np.ndarray):
+        slot = self._slots.get(key)
+        if slot is None:
+            slot = self._next_slot
+            self._next_slot = (self._next_slot + 1) % self.capacity
+            if self._release(slot):
+                # The memmap is shared, so the new row can reach the file even if this
+                # process dies before the next flush; the slot's previous key must
+                # already be gone from the log by then
+                self._pending.append((slot, None))
+                self.flush()
+            self._assign(key, slot)
+
+        self._data[slot] = embedding
+        self._pending.append((slot, key))
+        if len(self._pending) >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        if not self._pending:
+            return
+        # Embeddings reach the file before the log entries pointing at them
+        self._data.flush()
+        if self._log_entries + len(self._pending) >= self.capacity:
+            self._write_snapshot()
+            return
+
+        data = ''.join(json.dumps([slot, key]) + '\n' for slot, key in self._pending).encode()
+        with open(self.log_path, 'ab') as f:
+            f.truncate(self._log_offset)
+            f.write(data)
+        self._log_offset += len(data)
+        self._log_entries += len(self._pending)
+        self._pending = []
+
+    def _write_snapshot(self):
+        self._data.flush()
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({
+                "capacity": self.capacity,
+                "dim": EMBEDDING_DIM,
+                "namespace": self.namespace,
+                "next_slot": self._next_slot,
+                "slots": self._slots
+            }, f)
+        os.replace(tmp_path, self.index_path)
+        # Replaying a log the snapshot already covers is harmless, so it is emptied afterwards
+        open(self.log_path, 'wb').close()
+        self._log_entries = 0
+        self._log_offset = 0
+        self._pending = []
+
+class EmbeddingCache:
+    """
+    Content-addressed LRU cache of image embeddings.
+    Bounded by entry count and by bytes held in memory; when disk_dir is set,
+    entries are also written through to a DiskEmbeddingStore so they survive
+    restarts and memory evictions.
+    """
+
+    def __init__(self, max_entries: int = 10000, max_bytes: int = 64 * 1024 * 1024,
+                 disk_dir: Optional[str] = None, disk_capacity: int = 100000, namespace: str = ""):
+        self.max_entries = max(1, int(max_entries))
+        self.max_bytes = max(1, int(max_bytes))
+        self.disk_dir = disk_dir
+        self.disk_capacity = disk_capacity
+        self.namespace = namespace
+
+        self._entries: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._disk = None
+        self._disk_opened = False
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        atexit.register(self.flush)
+
+    def _open_disk(self):
+        # Opened on first use so a namespace set after construction does not
+        # wipe a store written by the same model on a previous run
+        self._disk = None
+        self._disk_opened = True
+        if not self.disk_dir:
+            return
+        try:
+            self._disk = DiskEmbeddingStore(self.disk_dir, self.disk_capacity, self.namespace)
+        except Exception as e:
+            print(f"⚠️ Embedding cache disk spill unavailable, using memory only: {e}")
+
+    def set_namespace(self, namespace: str):
+        """Drop all cached embeddings when the model producing them changes"""
+        with self._lock:
+            if namespace == self.namespace:
+                return
+            self.namespace = namespace
+            self._entries.clear()
+            self._bytes = 0
+            self._disk = None
+            self._disk_opened = False
+
+    def set_disk_dir(self, disk_dir: Optional[str]):
+        """Point the write-through store at another directory (e.g. one per worker process)"""
+        with self._lock:
+            if self._disk is not None:
+                self._disk.flush()
+            self.disk_dir = disk_dir
+            self._disk = None
+            self._disk_opened = False
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        with self._lock:
+            embedding = self._entries.get(key)
+            if embedding is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return embedding
+
+            if not self._disk_opened:
+                self._open_disk()
+            if self._disk is not None:
+                embedding = self._disk.get(key)
+                if embedding is not None:
+                    self.disk_hits += 1
+                    self._insert(key, embedding)
+                    return embedding
+
+            self.misses += 1
+            return None
+
+    def put(self, key: str, embedding: np.ndarray):
+        embedding = np.array(embedding, dtype=np.float32).reshape(EMBEDDING_DIM)
+        with self._lock:
+            self._insert(key, embedding)
+            if not self._disk_opened:
+                self._open_disk()
+            if self._disk is not None:
+                self._disk.put(key, embedding)
+
+    def _insert(self, key: str, embedding: np.ndarray):
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._bytes -= previous.nbytes
+        self._entries[key] = embedding
+        self._bytes += embedding.nbytes
+
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.nbytes
+            self.evictions += 1
+
+    def flush(self):
+        with self._lock:
+            if self._disk is not None:
+                self._disk.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round((self.hits + self.disk_hits) / lookups, 4) if lookups else 0,
+                "disk_entries": len(self._disk) if self._disk is not None else None
+            }
@@ -0,0 +1,231 @@
+"""
+Bulk offline enrollment: pre-embed every user folder in the images bucket.
+
+Usage:
+    python enroll_all.py --checkpoint /app/config/enroll_all.json
+    python enroll_all.py --users alice bob --batch_size 256 --concurrency 8
+    python enroll_all.py --select --max_references 10 --checkpoint /app/config/enroll_select.json
+
+Each user's references are resolved, downloaded and stored exactly as
+/verify_user would do it: same gallery entries, same vector index rows. Users
+are prepared concurrently (downloads bounded by concurrency x download_workers),
+and their new images are embedded together in batches of about batch_size, so
+a rollout does not start with every user paying for cold embeddings. With
+--select, users are scored and enrolled like POST /enroll instead. Finished
+users are recorded in the checkpoint file, so an interrupted run resumes where
+it stopped.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# The job sizes its own batches; the serving micro-batcher would only add latency
+os.environ.setdefault('FACE_AUTH_MICRO_BATCHING', '0')
+
+from requests.adapters import HTTPAdapter
+import face_auth_api as api
+
+BUCKET_NAME = "images"
+
+def list_user_folders(bucket_name: str = BUCKET_NAME, page_size: int = 1000):
+    """Every top-level folder in the bucket; folders are the entries without an object id"""
+    folders = []
+    offset = 0
+    while True:
+        page = api.supabase.storage.from_(bucket_name).list('', {
+            "limit": page_size,
+            "offset": offset,
+            "sortBy": {"column": "name", "order": "asc"}
+        })
+        folders.extend(entry['name'] for entry in page
+                       if isinstance(entry, dict) and entry.get('name') and entry.get('id') is None)
+        if len(page) < page_size:
+            return folders
+        offset += page_size
+
+class EnrollmentCheckpoint:
+    """JSON file recording the outcome of every processed user"""
+
+    def __init__(self, path, mode, save_every=50):
+        self.path = path
+        self.mode = mode
+        self.save_every = save_every
+        self.users = {}
+        self._unsaved = 0
+
+        if path and os.path.exists(path):
+            try:
+                with open(path, 'r') as f:
+                    state = json.load(f)
+                if state.get('mode') == mode:
+                    self.users = state['users']
+                else:
+                    print(f"⚠️ Checkpoint {path} was written in '{state.get('mode')}' mode, starting over")
+            except (OSError, ValueError, KeyError) as e:
+                print(f"⚠️ Ignoring unreadable checkpoint {path}: {e}")
+
+    def is_finished(self, user_id, retry_failed=False):
+        entry = self.users.get(user_id)
+        return entry is not None and not (retry_failed and entry['status'] == 'failed')
+
+    def record(self, user_id, status, references=0, error=None):
+        self.users[user_id] = {"status": status, "references": references, "error": error, "at": time.time()}
+        self._unsaved += 1
+        if self._unsaved >= self.save_every:
+            self.save()
+
+    def save(self):
+        if not self.path or not self._unsaved:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({"mode": self.mode, "users": self.users}, f)
+        os.replace(tmp_path, self.path)
+        self._unsaved = 0
+
+    def counts(self):
+        counts = {}
+        for entry in self.users.values():
+            counts[entry['status']] = counts.get(entry['status'], 0) + 1
+        return counts
+
+def iter_bounded(executor, fn, items, window):
+    """executor.map that keeps at most window calls in flight, yielding (item, result) in order"""
+    items = iter(items)
+    in_flight = deque()
+    for item in items:
+        in_flight.append((item, executor.submit(fn, item)))
+        if len(in_flight) >= window:
+            break
+    while in_flight:
+        item, future = in_flight.popleft()
+        for next_item in items:
+            in_flight.append((next_item, executor.submit(fn, next_item)))
+            break
+        yield item, future.result()
+
+def embed_prepared(batch, checkpoint, min_images):
+    """Embed the downloaded references of several users in one pass and store their gallery entries"""
+    images, owners = [], []
+    for prepared in batch:
+        for filename, image_data in prepared["downloaded"].items():
+            images.append(image_data)
+            owners.append((prepared["user_id"], filename))
+
+    embeddings, valid_indices, errors = api.embed_images(api.model, images, detect_faces=api.FACE_DETECTION)
+    for i, error in errors.items():
+        print(f"⚠️ Could not embed {owners[i][0]}/{owners[i][1]}: {error}")
+
+    new_embeddings = {prepared["user_id"]: {} for prepared in batch}
+    for row, i in enumerate(valid_indices):
+        user_id, filename = owners[i]
+        new_embeddings[user_id][filename] = embeddings[row].numpy()
+
+    # One vector index write for the whole batch
+    with api.vector_index.bulk():
+        for prepared in batch:
+            finalize_prepared(prepared, new_embeddings[prepared["user_id"]], checkpoint, min_images)
+    return len(valid_indices)
+
+def finalize_prepared(prepared, new_embeddings, checkpoint, min_images):
+    """Store a user's gallery entry from cached and new embeddings and record the outcome"""
+    result = api.finalize_user_references(prepared, new_embeddings, min_images)
+    if "error" in result:
+        checkpoint.record(prepared["user_id"], "failed", error=result["error"])
+    else:
+        checkpoint.record(prepared["user_id"], "enrolled", references=len(result["files_used"]))
+
+def pre_embed_users(user_ids, checkpoint, min_images=4, max_images=10, batch_size=128, concurrency=4):
+    """Pre-embed each user's verification references, batching embeddings across users"""
+    prepare = lambda user_id: api.prepare_user_references(user_id, min_images, max_images)
+    batch, batch_images, embedded = [], 0, 0
+    started = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for done, (user_id, prepared) in enumerate(iter_bounded(executor, prepare, user_ids, 2 * concurrency), 1):
+            if "error" in prepared:
+                checkpoint.record(user_id, "failed", error=prepared["error"])
+            elif len(prepared["cached"]) == len(prepared["selected_infos"]):
+                checkpoint.record(user_id, "current", references=len(prepared["cached"]))
+            elif not prepared["downloaded"]:
+                # Every missing reference failed to download; enrolled if the cached ones suffice, else failed
+                finalize_prepared(prepared, {}, checkpoint, min_images)
+            else:
+                batch.append(prepared)
+                batch_images += len(prepared["downloaded"])
+
+            if batch and (batch_images >= batch_size or done == len(user_ids)):
+                embedded += embed_prepared(batch, checkpoint, min_images)
+                batch, batch_images = [], 0
+                elapsed = time.perf_counter() - started
+                print(f"[{done}/{len(user_ids)}] {embedded} images embedded ({embedded / elapsed:.1f} images/s)")
+    return embedded
+
+def select_users(user_ids, checkpoint, max_references=10, min_references=4, concurrency=4):
+    """Score and enroll every user like POST /enroll"""
+    enroll = lambda user_id: api.enroll_user_references(user_id, max_references, min_references)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for done, (user_id, result) in enumerate(iter_bounded(executor, enroll, user_ids, concurrency), 1):
+            if "error" in result:
+                checkpoint.record(user_id, "failed", error=result["error"])
+            else:
+                checkpoint.record(user_id, "enrolled", references=len(result["selected"]))
+            if done % 10 == 0 or done == len(user_ids):
+                print(f"[{done}/{len(user_ids)}] users enrolled")
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-embed every user folder in the images bucket")
+    parser.add_argument("--users", nargs='+', help="Only these user folders (default: every folder in the bucket)")
+    parser.add_argument("--checkpoint", help="Checkpoint file for resuming (default: no checkpoint)")
+    parser.add_argument("--retry_failed", action="store_true", help="Retry users that failed in an earlier run")
+    parser.add_argument("--select", action="store_true", help="Score and select references like POST /enroll")
+    parser.add_argument("--min_images", type=int, default=4, help="Minimum usable references per user (default: 4)")
+    parser.add_argument("--max_images", type=int, default=10, help="References per user (default: 10)")
+    parser.add_argument("--batch_size", type=int, default=128, help="Images per embedding batch (default: 128)")
+    parser.add_argument("--concurrency", type=int, default=4, help="Users downloaded in parallel (default: 4)")
+    parser.add_argument("--download_workers", type=int, default=api.STORAGE_DOWNLOAD_WORKERS,
+                        help=f"Download threads per user (default: {api.STORAGE_DOWNLOAD_WORKERS})")
+    args = parser.parse_args()
+
+    if api.supabase is None:
+        print("Error: Supabase client not initialized")
+        sys.exit(1)
+
+    api.initialize_model()
+    if api.model is None:
+        sys.exit(1)
+
+    # Size the connection pool for every download thread of every user in flight
+    api.STORAGE_DOWNLOAD_WORKERS = max(1, args.download_workers)
+    pool_size = max(1, args.concurrency) * api.STORAGE_DOWNLOAD_WORKERS
+    api.storage_session.mount('http://', HTTPAdapter(pool_connections=4, pool_maxsize=pool_size))
+    api.storage_session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=pool_size))
+
+    user_ids = args.users or list_user_folders()
+    checkpoint = EnrollmentCheckpoint(args.checkpoint, 'select' if args.select else 'references')
+    pending = [user_id for user_id in user_ids if not checkpoint.is_finished(user_id, args.retry_failed)]
+    print(f"Users: {len(user_ids)}, already processed: {len(user_ids) - len(pending)}, to process: {len(pending)}")
+
+    started = time.perf_counter()
+    try:
+        if args.select:
+            select_users(pending, checkpoint, args.max_images, args.min_images, max(1, args.concurrency))
+        else:
+            pre_embed_users(pending, checkpoint, args.min_images, args.max_images, max(1, args.batch_size),
+                            max(1, args.concurrency))
+    finally:
+        checkpoint.save()
+
+    counts = checkpoint.counts()
+    print(f"✅ Processed {len(pending)} users in {time.perf_counter() - started:.1f}s")
+    print(f"Enrolled: {counts.get('enrolled', 0)}, already current: {counts.get('current', 0)}, failed: {counts.get('failed', 0)}")
+    print(f"Vector index: {api.vector_index.stats()}")
+
+if __name__ == "__main__":
+    main()
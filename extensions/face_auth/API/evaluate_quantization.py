@@ -0,0 +1,134 @@
+"""
+Compare a quantized embedding model against the fp32 checkpoint on a labeled pair set.
+
+Usage:
+    python evaluate_quantization.py --quantized /app/models/face_ver_v3.int8-dynamic.torchscript.pt --pairs pairs.csv
+
+pairs.csv has the columns image1,image2,label (label 1 = same person, 0 = different);
+image paths are relative to the CSV file. Exits with status 1 when the quantized
+model's threshold decisions or accuracy drift past the configured gates.
+"""
+import os
+import sys
+import csv
+import json
+import argparse
+import numpy as np
+import torch
+
+from face_auth_api import load_vggface2_model, preprocess_image_from_data, MODEL_PATH
+from inference_backends import TorchScriptBackend
+
+def load_pairs(pairs_path):
+    base_dir = os.path.dirname(os.path.abspath(pairs_path))
+    pairs = []
+    with open(pairs_path, newline='') as f:
+        for row in csv.DictReader(f):
+            pairs.append((
+                os.path.join(base_dir, row['image1']),
+                os.path.join(base_dir, row['image2']),
+                int(row['label'])
+            ))
+    return pairs
+
+def embed_paths(embed_fn, image_paths, batch_size=32):
+    """Embed image files in batches and return an (N, 512) float32 array"""
+    embeddings = []
+    for start in range(0, len(image_paths), batch_size):
+        batch = torch.cat([
+            preprocess_image_from_data(open(path, 'rb').read())
+            for path in image_paths[start:start + batch_size]
+        ])
+        with torch.no_grad():
+            embeddings.append(embed_fn(batch).float().cpu().numpy())
+    return np.concatenate(embeddings)
+
+def normalize_rows(embeddings):
+    return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True).clip(min=1e-12)
+
+def evaluate(fp32_embeddings, quantized_embeddings, index_pairs, labels, threshold):
+    fp32_embeddings = normalize_rows(fp32_embeddings)
+    quantized_embeddings = normalize_rows(quantized_embeddings)
+
+    # Per-image drift: how far each quantized embedding rotated from its fp32 counterpart
+    drift = 1.0 - (fp32_embeddings * quantized_embeddings).sum(axis=1)
+
+    rows1, rows2 = index_pairs[:, 0], index_pairs[:, 1]
+    fp32_scores = (fp32_embeddings[rows1] * fp32_embeddings[rows2]).sum(axis=1)
+    quantized_scores = (quantized_embeddings[rows1] * quantized_embeddings[rows2]).sum(axis=1)
+
+    fp32_decisions = fp32_scores > threshold
+    quantized_decisions = quantized_scores > threshold
+    score_diff = np.abs(fp32_scores - quantized_scores)
+
+    return {
+        "pairs": int(len(labels)),
+        "images": int(len(fp32_embeddings)),
+        "threshold": threshold,
+        "embedding_cosine_drift": {
+            "mean": float(drift.mean()),
+            "p95": float(np.percentile(drift, 95)),
+            "max": float(drift.max())
+        },
+        "pair_score_abs_diff": {
+            "mean": float(score_diff.mean()),
+            "max": float(score_diff.max())
+        },
+        "fp32_accuracy": float((fp32_decisions == labels).mean()),
+        "quantized_accuracy": float((quantized_decisions == labels).mean()),
+        "decision_agreement": float((fp32_decisions == quantized_decisions).mean()),
+        "flipped_pairs": int((fp32_decisions != quantized_decisions).sum())
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate a quantized face embedding model against fp32")
+    parser.add_argument("--checkpoint", default=MODEL_PATH, help=f"fp32 .pth checkpoint (default: {MODEL_PATH})")
+    parser.add_argument("--quantized", required=True, help="Quantized TorchScript artifact from quantize_model.py")
+    parser.add_argument("--pairs", required=True, help="CSV with image1,image2,label columns")
+    parser.add_argument("--threshold", type=float, default=0.6, help="Verification threshold (default: 0.6)")
+    parser.add_argument("--min_agreement", type=float, default=0.99,
+                        help="Minimum fraction of pairs whose match decision must agree with fp32 (default: 0.99)")
+    parser.add_argument("--max_accuracy_drop", type=float, default=0.01,
+                        help="Maximum allowed accuracy drop versus fp32 (default: 0.01)")
+    parser.add_argument("--report", help="Write the evaluation report as JSON to this path")
+    args = parser.parse_args()
+
+    pairs = load_pairs(args.pairs)
+    if not pairs:
+        print(f"Error: no pairs found in {args.pairs}")
+        sys.exit(1)
+
+    image_paths = sorted({path for pair in pairs for path in pair[:2]})
+    image_rows = {path: i for i, path in enumerate(image_paths)}
+    index_pairs = np.array([(image_rows[a], image_rows[b]) for a, b, _ in pairs])
+    labels = np.array([label == 1 for _, _, label in pairs])
+
+    fp32_model, _ = load_vggface2_model(args.checkpoint)
+    if fp32_model is None:
+        sys.exit(1)
+    fp32_model = fp32_model.cpu().eval()
+    quantized_model = TorchScriptBackend(args.quantized, torch.device('cpu'))
+
+    print(f"Embedding {len(image_paths)} images for {len(pairs)} pairs...")
+    fp32_embeddings = embed_paths(fp32_model.get_embeddings, image_paths)
+    quantized_embeddings = embed_paths(quantized_model.get_embeddings, image_paths)
+
+    report = evaluate(fp32_embeddings, quantized_embeddings, index_pairs, labels, args.threshold)
+    accuracy_drop = report["fp32_accuracy"] - report["quantized_accuracy"]
+    report["passed"] = bool(report["decision_agreement"] >= args.min_agreement and accuracy_drop <= args.max_accuracy_drop)
+
+    print(json.dumps(report, indent=2))
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if report["passed"]:
+        print("✅ Quantized model matches fp32 decisions within the accuracy gate")
+    else:
+        print(f"❌ Quantized model failed the gate "
+              f"(agreement {report['decision_agreement']:.4f} < {args.min_agreement} "
+              f"or accuracy drop {accuracy_drop:.4f} > {args.max_accuracy_drop})")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
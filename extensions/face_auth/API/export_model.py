@@ -0,0 +1,147 @@
+"""
+Export the face verification checkpoint to TorchScript and ONNX.
+
+Usage:
+    python export_model.py --checkpoint /app/models/face_ver_v3.pth --output_dir /app/models
+
+Writes <name>.torchscript.pt and <name>.onnx, each with a <artifact>.json
+metadata sidecar, for use with FACE_AUTH_BACKEND=torchscript|onnxruntime.
+The safetensors format writes <name>.safetensors, a memory-mappable copy of the
+eager checkpoint (FACE_AUTH_MODEL_ARTIFACT=<name>.safetensors).
+"""
+import os
+import sys
+import json
+import inspect
+import argparse
+import torch
+import torch.nn as nn
+
+from face_auth_api import load_vggface2_model, MODEL_PATH
+
+class EmbeddingExportWrapper(nn.Module):
+    """Backbone + classifier returning (embeddings, logits) from one forward pass"""
+
+    def __init__(self, model):
+        super(EmbeddingExportWrapper, self).__init__()
+        self.backbone = model.backbone
+        self.classifier = model.classifier
+
+    def forward(self, x):
+        embeddings = self.backbone(x)
+        logits = self.classifier(embeddings)
+        return embeddings, logits
+
+def write_metadata(artifact_path, model, class_names, backend, extra=None):
+    metadata = {
+        "backend": backend,
+        "num_classes": len(class_names) if class_names else 0,
+        "class_names": class_names if class_names else [],
+        "total_parameters": int(sum(p.numel() for p in model.parameters())),
+        "input_size": [3, 160, 160],
+        "embedding_size": 512
+    }
+    metadata.update(extra or {})
+    with open(artifact_path + '.json', 'w') as f:
+        json.dump(metadata, f, indent=2)
+
+def export_torchscript(wrapper, example, output_path):
+    with torch.no_grad():
+        traced = torch.jit.trace(wrapper, example)
+        # optimize_for_inference output cannot be reloaded; TorchScriptBackend applies it after loading
+        frozen = torch.jit.freeze(traced)
+    frozen.save(output_path)
+    print(f"✅ TorchScript model saved to: {output_path}")
+
+def export_onnx(wrapper, example, output_path, opset_version=17):
+    # Newer torch releases default to the dynamo exporter, which needs onnxscript and
+    # rejects dynamic_axes; keep the TorchScript-based exporter everywhere
+    options = {'dynamo': False} if 'dynamo' in inspect.signature(torch.onnx.export).parameters else {}
+    with torch.no_grad():
+        torch.onnx.export(
+            wrapper,
+            example,
+            output_path,
+            input_names=['input'],
+            output_names=['embeddings', 'logits'],
+            dynamic_axes={
+                'input': {0: 'batch'},
+                'embeddings': {0: 'batch'},
+                'logits': {0: 'batch'}
+            },
+            opset_version=opset_version,
+            do_constant_folding=True,
+            **options
+        )
+    print(f"✅ ONNX model saved to: {output_path}")
+
+def export_safetensors(model, output_path):
+    from safetensors.torch import save_file
+    
+    state_dict = {name: tensor.contiguous() for name, tensor in model.state_dict().items()}
+    save_file(state_dict, output_path)
+    print(f"✅ safetensors checkpoint saved to: {output_path}")
+
+def verify_export(wrapper, example, torchscript_path=None, onnx_path=None):
+    """Compare exported embeddings against the eager model"""
+    with torch.no_grad():
+        reference, _ = wrapper(example)
+
+    if torchscript_path:
+        exported, _ = torch.jit.load(torchscript_path)(example)
+        print(f"   TorchScript max abs diff: {(exported - reference).abs().max().item():.2e}")
+
+    if onnx_path:
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            print("⚠️ onnxruntime not installed, skipping ONNX verification")
+            return
+        session = ort.InferenceSession(onnx_path, providers=['CPUExecutionProvider'])
+        exported = session.run(['embeddings'], {'input': example.numpy()})[0]
+        print(f"   ONNX max abs diff: {abs(exported - reference.numpy()).max():.2e}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the face verification model to TorchScript and ONNX")
+    parser.add_argument("--checkpoint", default=MODEL_PATH, help=f"Path to the .pth checkpoint (default: {MODEL_PATH})")
+    parser.add_argument("--output_dir", help="Output directory (default: checkpoint directory)")
+    parser.add_argument("--formats", nargs='+', choices=['torchscript', 'onnx', 'safetensors'], default=['torchscript', 'onnx'],
+                        help="Formats to export (default: both)")
+    parser.add_argument("--opset", type=int, default=17, help="ONNX opset version (default: 17)")
+    parser.add_argument("--batch_size", type=int, default=4, help="Example batch size used for tracing (default: 4)")
+    args = parser.parse_args()
+
+    model, class_names = load_vggface2_model(args.checkpoint)
+    if model is None:
+        sys.exit(1)
+
+    model = model.cpu().eval()
+    wrapper = EmbeddingExportWrapper(model).eval()
+    example = torch.randn(args.batch_size, 3, 160, 160)
+
+    output_dir = args.output_dir or os.path.dirname(os.path.abspath(args.checkpoint))
+    os.makedirs(output_dir, exist_ok=True)
+    base_name = os.path.splitext(os.path.basename(args.checkpoint))[0]
+
+    torchscript_path = None
+    onnx_path = None
+
+    if 'torchscript' in args.formats:
+        torchscript_path = os.path.join(output_dir, f"{base_name}.torchscript.pt")
+        export_torchscript(wrapper, example, torchscript_path)
+        write_metadata(torchscript_path, model, class_names, 'torchscript')
+
+    if 'onnx' in args.formats:
+        onnx_path = os.path.join(output_dir, f"{base_name}.onnx")
+        export_onnx(wrapper, example, onnx_path, args.opset)
+        write_metadata(onnx_path, model, class_names, 'onnxruntime')
+
+    if 'safetensors' in args.formats:
+        safetensors_path = os.path.join(output_dir, f"{base_name}.safetensors")
+        export_safetensors(model, safetensors_path)
+        write_metadata(safetensors_path, model, class_names, 'eager')
+
+    verify_export(wrapper, example, torchscript_path, onnx_path)
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,32 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, g
 import torch
 import torch.nn as nn
 import numpy as np
 from io import BytesIO
 import base64
+import hashlib
 from PIL import Image
 import os
+import json
+import time
 import requests
+from urllib.parse import quote
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
 from supabase import create_client, Client
 from torchvision import transforms
 from facenet_pytorch import InceptionResnetV1
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
+from gallery import EmbeddingGallery
+from inference_batcher import MicroBatcher
+from embedding_cache import EmbeddingCache
+from inference_backends import TorchScriptBackend, OnnxRuntimeBackend
+from reference_selection import score_references, select_top_references
+from face_detection import get_face_aligner, face_aligner_stats, DETECT_SIZE
+from vector_index import VectorIndex
+import metrics
+import tracing
+from metrics import stage_timer, record_error, record_cache_lookups
 
 app = Flask(__name__)
 
@@ -57,9 +73,71 @@ class RealVGGFace2Model(nn.Module):
             param.requires_grad = True
 
 MODEL_PATH = '/app/models/face_ver_v3.pth'
+INFERENCE_BACKEND = os.environ.get('FACE_AUTH_BACKEND', 'eager').lower()
+BACKEND_ARTIFACTS = {
+    'eager': MODEL_PATH,
+    'torchscript': os.path.splitext(MODEL_PATH)[0] + '.torchscript.pt',
+    'onnxruntime': os.path.splitext(MODEL_PATH)[0] + '.onnx'
+}
+MODEL_ARTIFACT = os.environ.get('FACE_AUTH_MODEL_ARTIFACT', BACKEND_ARTIFACTS.get(INFERENCE_BACKEND, MODEL_PATH))
+GALLERY_DIR = os.environ.get('FACE_AUTH_GALLERY_DIR', '/app/config/gallery')
+GALLERY_MAX_USERS = int(os.environ.get('FACE_AUTH_GALLERY_MAX_USERS', 2000))
+VECTOR_INDEX_DIR = os.environ.get('FACE_AUTH_INDEX_DIR', '/app/config/vector_index')
+VECTOR_INDEX_IVF_MIN_ROWS = int(os.environ.get('FACE_AUTH_INDEX_IVF_MIN_ROWS', 20000))
+VECTOR_INDEX_NPROBE = int(os.environ.get('FACE_AUTH_INDEX_NPROBE', 16))
+MAX_IDENTIFY_TOP_K = int(os.environ.get('FACE_AUTH_MAX_IDENTIFY_TOP_K', 50))
+TRACE_ON_REQUEST = os.environ.get('FACE_AUTH_TRACE_ON_REQUEST', '0') == '1'
+# When set, a per-request trace also needs this value in the X-Face-Auth-Trace-Token header
+TRACE_TOKEN = os.environ.get('FACE_AUTH_TRACE_TOKEN')
+TRACE_SAMPLE_RATE = float(os.environ.get('FACE_AUTH_TRACE_SAMPLE_RATE', 0.0))
+TRACE_DIR = os.environ.get('FACE_AUTH_TRACE_DIR')
+TRACE_MAX_FILES = int(os.environ.get('FACE_AUTH_TRACE_MAX_FILES', 200))
+MICRO_BATCHING = os.environ.get('FACE_AUTH_MICRO_BATCHING', '1') == '1'
+MAX_BATCH_SIZE = int(os.environ.get('FACE_AUTH_MAX_BATCH_SIZE', 32))
+MAX_BATCH_WAIT_MS = float(os.environ.get('FACE_AUTH_MAX_BATCH_WAIT_MS', 5))
+MAX_BATCH_PAIRS = int(os.environ.get('FACE_AUTH_MAX_BATCH_PAIRS', 5000))
+EMBED_CHUNK_SIZE = int(os.environ.get('FACE_AUTH_EMBED_CHUNK_SIZE', 64))
+STORAGE_DOWNLOAD_WORKERS = int(os.environ.get('FACE_AUTH_DOWNLOAD_WORKERS', 8))
+STORAGE_DOWNLOAD_TIMEOUT = float(os.environ.get('FACE_AUTH_DOWNLOAD_TIMEOUT', 10))
+DOWNLOAD_EARLY_EXIT = os.environ.get('FACE_AUTH_DOWNLOAD_EARLY_EXIT', '0') == '1'
+JPEG_DRAFT_DECODE = os.environ.get('FACE_AUTH_JPEG_DRAFT', '1') == '1'
+INPUT_SIZE = (160, 160)
+FACE_DETECTION = os.environ.get('FACE_AUTH_FACE_DETECTION', '0') == '1'
+REQUIRE_FACE = os.environ.get('FACE_AUTH_REQUIRE_FACE', '0') == '1'
+ENROLL_MAX_CANDIDATES = int(os.environ.get('FACE_AUTH_ENROLL_MAX_CANDIDATES', 50))
+ENROLL_FACE_CHECK = os.environ.get('FACE_AUTH_ENROLL_FACE_CHECK', '1') == '1'
+EMBEDDING_CACHE_ENABLED = os.environ.get('FACE_AUTH_EMBEDDING_CACHE', '1') == '1'
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.environ.get('FACE_AUTH_CACHE_MAX_ENTRIES', 10000))
+EMBEDDING_CACHE_MAX_BYTES = int(os.environ.get('FACE_AUTH_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+EMBEDDING_CACHE_DIR = os.environ.get('FACE_AUTH_CACHE_DIR')
+EMBEDDING_CACHE_DISK_CAPACITY = int(os.environ.get('FACE_AUTH_CACHE_DISK_CAPACITY', 100000))
 model = None
 class_names = None
 device = None
+STARTUP_TIMINGS: Dict[str, float] = {}
+model_warmed = False
+# Aligned, full-frame and draft-decoded embeddings differ, so switching modes
+# re-embeds the gallery and starts a fresh embedding cache
+PREPROCESSING_VARIANT = '+'.join(mode for mode, enabled in (('aligned', FACE_DETECTION), ('draft', JPEG_DRAFT_DECODE)) if enabled)
+gallery = EmbeddingGallery(GALLERY_DIR, variant=PREPROCESSING_VARIANT, max_users=GALLERY_MAX_USERS)
+vector_index = VectorIndex(VECTOR_INDEX_DIR, namespace=gallery.variant,
+                           ivf_min_rows=VECTOR_INDEX_IVF_MIN_ROWS, nprobe=VECTOR_INDEX_NPROBE)
+embedding_cache = EmbeddingCache(
+    max_entries=EMBEDDING_CACHE_MAX_ENTRIES,
+    max_bytes=EMBEDDING_CACHE_MAX_BYTES,
+    disk_dir=EMBEDDING_CACHE_DIR,
+    disk_capacity=EMBEDDING_CACHE_DISK_CAPACITY,
+    namespace=PREPROCESSING_VARIANT
+) if EMBEDDING_CACHE_ENABLED else None
+
+# Pooled HTTP session for storage object downloads, shared by the download threads
+storage_session = requests.Session()
+storage_session.headers.update({
+    "Authorization": f"Bearer {SUPABASE_SERVICE_KEY}",
+    "apikey": SUPABASE_SERVICE_KEY
+})
+storage_session.mount('http://', HTTPAdapter(pool_connections=4, pool_maxsize=STORAGE_DOWNLOAD_WORKERS))
+storage_session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=STORAGE_DOWNLOAD_WORKERS))
 
 def get_vggface2_transforms():
     transform = transforms.Compose([
@@ -69,26 +147,99 @@ def get_vggface2_transforms():
     ])
     return transform
 
+VGGFACE2_TRANSFORM = get_vggface2_transforms()
+
+def parse_form_bool(value: str) -> bool:
+    return value.lower() in ('1', 'true', 'yes')
+
+FORM_FIELD_TYPES = {
+    'threshold': float,
+    'min_verification_images': int,
+    'max_verification_images': int,
+    'max_references': int,
+    'min_references': int,
+    'top_k': int,
+    'early_exit': parse_form_bool,
+    'detect_faces': parse_form_bool
+}
+
+def parse_request_data() -> Optional[Dict[str, Any]]:
+    """
+    Read the request body as JSON, or as multipart/form-data where images are
+    raw file parts (image1, image2, or repeated images) instead of base64 strings.
+    """
+    with stage_timer('json_parse'):
+        if request.files:
+            data = {}
+            for key, value in request.form.items():
+                cast = FORM_FIELD_TYPES.get(key)
+                data[key] = cast(value) if cast else value
+            for key in request.files:
+                files = request.files.getlist(key)
+                data[key] = [f.read() for f in files] if key == 'images' else files[0].read()
+            return data
+        
+        return request.get_json(silent=True)
+
+def record_startup_phase(phase: str, started: float) -> float:
+    """Record how long a startup phase took (ms) and return the time it ended"""
+    now = time.perf_counter()
+    STARTUP_TIMINGS[phase] = round((now - started) * 1000.0, 1)
+    return now
+
+def load_checkpoint(model_path: str) -> Tuple[Dict[str, torch.Tensor], int, List[str]]:
+    """
+    Load the state dict, num_classes and class_names of a checkpoint.
+    The weights are memory-mapped rather than read into private memory, so
+    workers on the same node share them through the page cache.
+    """
+    if model_path.endswith('.safetensors'):
+        from safetensors.torch import load_file
+        
+        state_dict = load_file(model_path, device='cpu')
+        with open(model_path + '.json', 'r') as f:
+            metadata = json.load(f)
+        return state_dict, metadata['num_classes'], metadata['class_names']
+    
+    try:
+        checkpoint = torch.load(model_path, map_location='cpu', mmap=True)
+    except RuntimeError as e:
+        # Checkpoints saved with the legacy (non-zipfile) format cannot be mmapped
+        print(f"⚠️ Could not memory-map checkpoint, loading it fully: {e}")
+        checkpoint = torch.load(model_path, map_location='cpu')
+    
+    return checkpoint['model_state_dict'], checkpoint['num_classes'], checkpoint['class_names']
+
 def load_vggface2_model(model_path=MODEL_PATH):
     global device
     device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
     
     try:
         print(f"Loading model from: {model_path}")
-        checkpoint = torch.load(model_path, map_location=device)
+        started = time.perf_counter()
+        
+        state_dict, num_classes, class_names = load_checkpoint(model_path)
+        started = record_startup_phase('checkpoint_load_ms', started)
         
-        num_classes = checkpoint['num_classes']
-        class_names = checkpoint['class_names']
+        # Build the architecture on the meta device without fetching the pretrained
+        # VGGFace2 weights; every tensor is then taken from the checkpoint as-is
+        with torch.device('meta'):
+            model = RealVGGFace2Model(num_classes=num_classes, pretrained=None)
+        started = record_startup_phase('model_construct_ms', started)
         
-        model = RealVGGFace2Model(num_classes=num_classes, pretrained='vggface2')
-        model.load_state_dict(checkpoint['model_state_dict'])
+        # Checkpoints trained from pretrained='vggface2' also carry the 8631-way VGGFace2
+        # logits layer; it is unused with classify=False and absent from this model
+        state_dict = {key: value for key, value in state_dict.items() if not key.startswith('backbone.logits.')}
+        model.load_state_dict(state_dict, assign=True)
         model.to(device)
         model.eval()
+        record_startup_phase('state_dict_assign_ms', started)
         
         print(f"✅ Model loaded successfully!")
         print(f"   - Classes: {num_classes}")
         print(f"   - Class names: {class_names}")
         print(f"   - Device: {device}")
+        print(f"   - Startup timings (ms): {STARTUP_TIMINGS}")
         
         return model, class_names
         
@@ -96,25 +247,56 @@ def load_vggface2_model(model_path=MODEL_PATH):
         print(f"❌ Error loading model: {str(e)}")
         return None, None
 
-def download_image_from_supabase(bucket_name: str, file_path: str) -> Optional[bytes]:
+def load_inference_model(backend=INFERENCE_BACKEND, artifact_path=MODEL_ARTIFACT):
+    """Load the embedding model for the selected backend (eager, torchscript or onnxruntime)"""
+    global device
+    
+    if backend == 'eager':
+        return load_vggface2_model(artifact_path)
+    
     try:
-        if supabase is None:
-            raise Exception("Supabase client not initialized")
+        print(f"Loading {backend} model from: {artifact_path}")
+        if backend == 'torchscript':
+            loaded = TorchScriptBackend(artifact_path, torch.device('cuda' if torch.cuda.is_available() else 'cpu'))
+            device = loaded.device
+        elif backend == 'onnxruntime':
+            loaded = OnnxRuntimeBackend(artifact_path, torch.get_num_threads())
+            device = loaded.device
+        else:
+            raise ValueError(f"Unknown FACE_AUTH_BACKEND '{backend}', expected eager, torchscript or onnxruntime")
+        
+        class_names = loaded.metadata.get('class_names')
+        
+        print(f"✅ Model loaded successfully!")
+        print(f"   - Backend: {backend}")
+        print(f"   - Classes: {len(class_names) if class_names else 'Unknown'}")
+        print(f"   - Device: {device}")
+        
+        return loaded, class_names
         
-        response = supabase.storage.from_(bucket_name).download(file_path)
-        return response
+    except Exception as e:
+        print(f"❌ Error loading {backend} model: {str(e)}")
+        return None, None
+
+def download_image_from_supabase(bucket_name: str, file_path: str, timeout: float = STORAGE_DOWNLOAD_TIMEOUT) -> Optional[bytes]:
+    try:
+        url = f"{SUPABASE_URL.rstrip('/')}/storage/v1/object/{bucket_name}/{quote(file_path)}"
+        response = storage_session.get(url, timeout=timeout)
+        response.raise_for_status()
+        return response.content
     except Exception as e:
         print(f"❌ Error downloading image from Supabase: {e}")
         return None
 
-def list_files_in_supabase_folder(bucket_name: str, folder_path: str) -> List[str]:
-    """List all files in a Supabase storage folder"""
+def list_file_objects_in_supabase_folder(bucket_name: str, folder_path: str) -> List[Dict[str, Any]]:
+    """List image file objects (name, updated_at, metadata) in a Supabase storage folder"""
     try:
         if supabase is None:
             raise Exception("Supabase client not initialized")
         
         # List files in the folder
-        response = supabase.storage.from_(bucket_name).list(folder_path)
+        with stage_timer('storage_list'):
+            response = supabase.storage.from_(bucket_name).list(folder_path)
         
         # Filter for image files and sort by name
         image_extensions = {'.jpg', '.jpeg', '.png', '.bmp', '.gif', '.webp'}
@@ -127,53 +309,302 @@ def list_files_in_supabase_folder(bucket_name: str, folder_path: str) -> List[st
                 if '.' in filename:
                     ext = '.' + filename.split('.')[-1].lower()
                     if ext in image_extensions:
-                        image_files.append(filename)
+                        image_files.append(file_info)
         
         # Sort files to ensure consistent ordering
-        image_files.sort()
+        image_files.sort(key=lambda file_info: file_info['name'])
         return image_files
         
     except Exception as e:
         print(f"❌ Error listing files in Supabase folder: {e}")
+        record_error('storage_list')
         return []
 
-def preprocess_image_from_data(image_data):
+def is_usable_image(image_data: bytes) -> bool:
+    """Cheap header-only check that downloaded bytes are a decodable image"""
+    try:
+        Image.open(BytesIO(image_data)).verify()
+        return True
+    except Exception:
+        return False
+
+def download_user_images(bucket_name: str, user_folder: str, filenames: List[str],
+                         stop_after: Optional[int] = None, timings: Optional[Dict[str, Any]] = None) -> Dict[str, bytes]:
+    """
+    Download the given files from a user's folder concurrently, skipping failed downloads.
+    With stop_after set, returns as soon as that many usable images have arrived
+    and cancels the downloads that have not started yet.
+    """
+    images = {}
+    if not filenames:
+        return images
+    
+    download_ms = {}
+    # Download threads have no request context of their own
+    endpoint = metrics.current_endpoint()
+    trace = tracing.current_trace()
+    
+    def fetch(filename):
+        started = time.perf_counter()
+        with stage_timer('storage_download', endpoint, trace, file=f"{user_folder}/{filename}"):
+            image_data = download_image_from_supabase(bucket_name, f"{user_folder}/{filename}")
+        download_ms[filename] = round((time.perf_counter() - started) * 1000.0, 1)
+        return image_data
+    
+    executor = ThreadPoolExecutor(max_workers=min(STORAGE_DOWNLOAD_WORKERS, len(filenames)))
+    try:
+        futures = {executor.submit(fetch, filename): filename for filename in filenames}
+        for future in as_completed(futures):
+            filename = futures[future]
+            image_data = future.result()
+            if image_data and (stop_after is None or is_usable_image(image_data)):
+                images[filename] = image_data
+            else:
+                print(f"⚠️ Failed to download {user_folder}/{filename}")
+                record_error('storage_download')
+            
+            if stop_after is not None and len(images) >= stop_after:
+                break
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    
+    if timings is not None:
+        timings["downloads"] = dict(download_ms)
+    
+    # Keep the caller's file order regardless of completion order
+    return {filename: images[filename] for filename in filenames if filename in images}
+
+def decode_image_payload(image_data) -> bytes:
+    """Turn a base64 (optionally data-URL) string or raw bytes into image file bytes"""
     try:
         if isinstance(image_data, str):
-            if image_data.startswith('data:image'):
-                image_data = image_data.split(',')[1]
-            image_data = base64.b64decode(image_data)
+            with stage_timer('base64_decode'):
+                if image_data.startswith('data:image'):
+                    image_data = image_data.split(',')[1]
+                image_data = base64.b64decode(image_data)
+        if not isinstance(image_data, (bytes, bytearray)):
+            raise TypeError(f"unsupported image payload type {type(image_data).__name__}")
+        return bytes(image_data)
+    except Exception as e:
+        raise ValueError(f"Error preprocessing image: {e}")
+
+def hash_image_payload(image_bytes: bytes) -> str:
+    """Content hash used to deduplicate identical images"""
+    return hashlib.sha256(image_bytes).hexdigest()
+
+def decode_image(image_data, draft_size: Tuple[int, int] = INPUT_SIZE) -> Image.Image:
+    """Decode an image payload to an RGB PIL image at no less than draft_size"""
+    try:
+        image_data = decode_image_payload(image_data)
         
-        image = Image.open(BytesIO(image_data)).convert('RGB')
-        transform = get_vggface2_transforms()
-        img_tensor = transform(image).unsqueeze(0)
+        with stage_timer('image_decode'):
+            image = Image.open(BytesIO(image_data))
+            if JPEG_DRAFT_DECODE and image.format == 'JPEG':
+                # Let libjpeg decode at 1/2, 1/4 or 1/8 scale, still at least draft_size
+                image.draft('RGB', draft_size)
+            return image.convert('RGB')
+    except ValueError:
+        raise
+    except Exception as e:
+        raise ValueError(f"Error preprocessing image: {e}")
+
+def preprocess_image_from_data(image_data):
+    try:
+        image = decode_image(image_data)
+        with stage_timer('transform'):
+            img_tensor = VGGFACE2_TRANSFORM(image).unsqueeze(0)
         
         return img_tensor
+    except ValueError:
+        raise
     except Exception as e:
         raise ValueError(f"Error preprocessing image: {e}")
 
-def verify_faces_vggface2(model, img1_data, img2_data, threshold=0.6):
+def align_faces(images: List[Image.Image], detection_stats: Optional[Dict[str, Any]] = None,
+                detections: Optional[List[Optional[Dict[str, Any]]]] = None) -> List[Optional[Image.Image]]:
+    """
+    Detect and align the face in every image with one batched detector pass.
+    Returns a 160x160 crop per image, or None where no face was found. The raw
+    detection of every image is appended to detections, if given and the
+    detector is available.
+    """
+    aligner = get_face_aligner()
+    started = time.perf_counter()
+    with stage_timer('face_detection'):
+        if aligner is not None:
+            found = aligner.detect(images)
+            faces = [aligner.align(image, detection, INPUT_SIZE) if aligner.is_face(detection) else None
+                     for image, detection in zip(images, found)]
+            if detections is not None:
+                detections.extend(found)
+        else:
+            faces = [None] * len(images)
+    
+    if detection_stats is not None:
+        detection_stats["images"] = detection_stats.get("images", 0) + len(images)
+        detection_stats["faces_found"] = detection_stats.get("faces_found", 0) + sum(1 for face in faces if face is not None)
+        detection_stats["detector_ms"] = round(detection_stats.get("detector_ms", 0.0) + (time.perf_counter() - started) * 1000.0, 1)
+        detection_stats["detector_available"] = aligner is not None
+    return faces
+
+def get_confidence_label(similarity: float, threshold: float) -> str:
+    confidence_distance = abs(similarity - threshold)
+    if confidence_distance > 0.3:
+        return 'High'
+    elif confidence_distance > 0.1:
+        return 'Medium'
+    return 'Low'
+
+def preprocess_images(images: List[Any], detect_faces: bool = False,
+                      detection_stats: Optional[Dict[str, Any]] = None,
+                      detections: Optional[Dict[int, Optional[Dict[str, Any]]]] = None) -> Tuple[Optional[torch.Tensor], List[int], Dict[int, str]]:
+    """
+    Preprocess a list of images into one stacked (N, 3, 160, 160) batch.
+    With detect_faces, each image is replaced by its aligned face crop; images
+    without a face fall back to the full frame unless FACE_AUTH_REQUIRE_FACE is set,
+    and detections (if given) receives the detector output per input index.
+    Returns the batch, the input indices that made it into the batch and the
+    preprocessing error for every image that did not.
+    """
+    tensors = []
+    valid_indices = []
+    errors = {}
+    
+    if not detect_faces:
+        for i, image_data in enumerate(images):
+            try:
+                tensors.append(preprocess_image_from_data(image_data))
+                valid_indices.append(i)
+            except ValueError as e:
+                errors[i] = str(e)
+    else:
+        decoded = {}
+        for i, image_data in enumerate(images):
+            try:
+                decoded[i] = decode_image(image_data, (DETECT_SIZE, DETECT_SIZE))
+            except ValueError as e:
+                errors[i] = str(e)
+        
+        found = []
+        faces = align_faces(list(decoded.values()), detection_stats, found) if decoded else []
+        if detections is not None and found:
+            detections.update(zip(decoded.keys(), found))
+        for (i, image), face in zip(decoded.items(), faces):
+            if face is None and REQUIRE_FACE:
+                errors[i] = "No face detected in image"
+                continue
+            with stage_timer('transform'):
+                tensors.append(VGGFACE2_TRANSFORM(face if face is not None else image).unsqueeze(0))
+            valid_indices.append(i)
+    
+    batch = torch.cat(tensors) if tensors else None
+    return batch, valid_indices, errors
+
+def run_backbone(batch: torch.Tensor) -> torch.Tensor:
+    """Run the embedding backbone on a preprocessed batch and return CPU embeddings"""
+    return model.get_embeddings(batch.to(device)).cpu()
+
+inference_batcher = MicroBatcher(run_backbone, MAX_BATCH_SIZE, MAX_BATCH_WAIT_MS) if MICRO_BATCHING else None
+
+def compute_embeddings(batch: torch.Tensor) -> torch.Tensor:
+    """Embed a preprocessed batch, sharing the forward pass with concurrent requests when micro-batching is on"""
+    with stage_timer('embedding_forward', images=int(batch.shape[0])):
+        trace = tracing.current_trace()
+        if trace is not None:
+            # The profiler only sees ops on the calling thread, so traced requests skip the micro-batcher
+            return tracing.profile_call(trace, run_backbone, batch)
+        if inference_batcher is not None:
+            return inference_batcher.infer(batch)
+        return run_backbone(batch)
+
+def embed_images(model, images: List[Any], keys: Optional[List[str]] = None, detect_faces: bool = False,
+                 detection_stats: Optional[Dict[str, Any]] = None,
+                 detections: Optional[Dict[int, Optional[Dict[str, Any]]]] = None) -> Tuple[torch.Tensor, List[int], Dict[int, str]]:
+    """
+    Embed all decodable images with a single forward pass.
+    Images are content-hashed (or use the given keys); identical images and
+    embedding cache hits skip the backbone. With detect_faces, uncached images
+    go through one batched face detection and alignment pass first, and their
+    detections are added to detections by image index. Row k of the returned
+    (K, 512) CPU tensor belongs to images[valid_indices[k]].
+    """
+    errors = {}
+    image_keys = {}
+    resolved = {}
+    pending_keys = []
+    pending_images = []
+    
+    cache_hits = 0
+    
+    for i, image_data in enumerate(images):
+        try:
+            image_bytes = decode_image_payload(image_data)
+        except ValueError as e:
+            errors[i] = str(e)
+            continue
+        
+        key = keys[i] if keys is not None else hash_image_payload(image_bytes)
+        if detect_faces:
+            key += ":aligned"
+        image_keys[i] = key
+        if key in resolved or key in pending_keys:
+            continue
+        
+        cached = embedding_cache.get(key) if embedding_cache is not None else None
+        if cached is not None:
+            cache_hits += 1
+            resolved[key] = torch.from_numpy(cached)
+        else:
+            pending_keys.append(key)
+            pending_images.append(image_bytes)
+    
+    batch_detections = {} if detections is not None else None
+    batch, batch_valid, batch_errors = preprocess_images(pending_images, detect_faces, detection_stats, batch_detections)
+    if batch is not None:
+        new_embeddings = compute_embeddings(batch)
+        for row, j in enumerate(batch_valid):
+            resolved[pending_keys[j]] = new_embeddings[row]
+            if embedding_cache is not None:
+                embedding_cache.put(pending_keys[j], new_embeddings[row].numpy())
+    failed = {pending_keys[j]: error for j, error in batch_errors.items()}
+    if batch_detections:
+        key_detections = {pending_keys[j]: detection for j, detection in batch_detections.items()}
+        detections.update((i, key_detections[key]) for i, key in image_keys.items() if key in key_detections)
+    
+    valid_indices = []
+    rows = []
+    for i, key in image_keys.items():
+        if key in failed:
+            errors[i] = failed[key]
+        else:
+            valid_indices.append(i)
+            rows.append(resolved[key])
+    
+    if embedding_cache is not None:
+        record_cache_lookups('embedding', cache_hits, len(pending_keys))
+    record_error('image_preprocess', len(errors))
+    
+    embeddings = torch.stack(rows) if rows else torch.empty(0, 512)
+    return embeddings, valid_indices, errors
+
+def cosine_similarity_matrix(embeddings1: torch.Tensor, embeddings2: torch.Tensor) -> torch.Tensor:
+    """Full (N, M) cosine similarity matrix via one normalized matmul"""
+    embeddings1 = torch.nn.functional.normalize(embeddings1, dim=1)
+    embeddings2 = torch.nn.functional.normalize(embeddings2, dim=1)
+    return embeddings1 @ embeddings2.T
+
+def verify_faces_vggface2(model, img1_data, img2_data, threshold=0.6, detect_faces=False, detection_stats=None):
     try:
-        global device
+        embeddings, _, errors = embed_images(model, [img1_data, img2_data], detect_faces=detect_faces,
+                                             detection_stats=detection_stats)
+        if errors:
+            raise ValueError(next(iter(errors.values())))
         
-        img1_tensor = preprocess_image_from_data(img1_data).to(device)
-        img2_tensor = preprocess_image_from_data(img2_data).to(device)
+        with stage_timer('similarity'):
+            similarity = cosine_similarity_matrix(embeddings[0:1], embeddings[1:2]).item()
         
-        with torch.no_grad():
-            emb1 = model.get_embeddings(img1_tensor)
-            emb2 = model.get_embeddings(img2_tensor)
-            
-            similarity = torch.nn.functional.cosine_similarity(emb1, emb2).item()
-            
-            is_match = similarity > threshold
-            
-            confidence_distance = abs(similarity - threshold)
-            if confidence_distance > 0.3:
-                confidence = 'High'
-            elif confidence_distance > 0.1:
-                confidence = 'Medium'
-            else:
-                confidence = 'Low'
+        is_match = similarity > threshold
+        confidence = get_confidence_label(similarity, threshold)
         
         return {
             'similarity_score': float(similarity),
@@ -185,85 +616,332 @@ def verify_faces_vggface2(model, img1_data, img2_data, threshold=0.6):
         print(f"❌ Error during verification: {str(e)}")
         return None
 
-def get_user_images_from_supabase(user_id: str, provided_images: List[str], min_images: int = 4, max_images: int = 10) -> Dict[str, Any]:
+def prepare_user_references(user_id: str, min_images: int = 4, max_images: int = 10, early_exit: bool = False) -> Dict[str, Any]:
     """
-    Get verification images from user's folder in Supabase storage.
-    Takes the first min_images to max_images found in the folder.
+    Resolve a user's reference images against the gallery.
+    Returns the cached embeddings plus the downloaded bytes of every reference
+    that is new or changed in the user's Supabase folder and still needs embedding.
+    Enrolled users only use the references chosen at enrollment.
+    With early_exit, downloading stops once min_images usable references are available.
     """
     try:
         bucket_name = "images"
         user_folder = f"{user_id}"
+        timings = {}
         
-        # List all image files in the user's folder
-        image_files = list_files_in_supabase_folder(bucket_name, user_folder)
+        started = time.perf_counter()
+        file_infos = list_file_objects_in_supabase_folder(bucket_name, user_folder)
+        timings["storage_list"] = round((time.perf_counter() - started) * 1000.0, 1)
         
-        if not image_files:
+        if not file_infos:
             return {"error": f"No image files found in folder: {user_folder}"}
         
-        # Take between min_images and max_images
-        if len(image_files) < min_images:
-            return {"error": f"Not enough verification images found. Found {len(image_files)}, need at least {min_images}"}
+        if len(file_infos) < min_images:
+            return {"error": f"Not enough verification images found. Found {len(file_infos)}, need at least {min_images}"}
         
-        # Select the first max_images files
-        selected_files = image_files[:max_images]
+        candidate_infos = file_infos
+        enrolled_files = gallery.selected_files(user_id)
+        if enrolled_files is not None:
+            infos_by_name = {file_info['name']: file_info for file_info in file_infos}
+            enrolled_infos = [infos_by_name[name] for name in enrolled_files if name in infos_by_name]
+            if len(enrolled_infos) >= min_images:
+                candidate_infos = enrolled_infos
+            else:
+                print(f"⚠️ Only {len(enrolled_infos)} enrolled references left for user {user_id}, using folder order")
         
-        verify_images = {}
-        successful_downloads = 0
+        selected_infos = candidate_infos[:max_images]
+        cached, missing = gallery.lookup(user_id, selected_infos)
+        record_cache_lookups('gallery', len(cached), len(missing))
         
-        for filename in selected_files:
-            file_path = f"{user_folder}/{filename}"
-            image_data = download_image_from_supabase(bucket_name, file_path)
-            if image_data:
-                verify_images[filename] = image_data
-                successful_downloads += 1
-            else:
-                print(f"⚠️ Failed to download {file_path}")
+        downloaded = {}
+        if missing:
+            stop_after = max(1, min_images - len(cached)) if early_exit else None
+            started = time.perf_counter()
+            downloaded = download_user_images(bucket_name, user_folder, [info['name'] for info in missing],
+                                              stop_after=stop_after, timings=timings)
+            timings["storage_download"] = round((time.perf_counter() - started) * 1000.0, 1)
         
-        if successful_downloads < min_images:
-            return {"error": f"Could not download enough verification images. Downloaded {successful_downloads}, need at least {min_images}"}
+        return {
+            "user_id": user_id,
+            "selected_infos": selected_infos,
+            "cached": cached,
+            "downloaded": downloaded,
+            "total_files_found": len(file_infos),
+            "timings_ms": timings
+        }
         
-        print(f"✅ Successfully loaded {successful_downloads} verification images for user {user_id}")
-        print(f"   Files: {list(verify_images.keys())}")
+    except Exception as e:
+        print(f"❌ Error preparing user references: {e}")
+        return {"error": str(e)}
+
+def store_gallery_entry(user_id: str, files: List[str], signatures: List[str], embeddings: np.ndarray,
+                        selection: Optional[Dict[str, Any]] = None):
+    """Write a user's references to the gallery and mirror them into the identification index"""
+    entry = gallery.put(user_id, files, signatures, embeddings, selection=selection)
+    try:
+        vector_index.add_user(user_id, entry['files'], entry['embeddings'], entry['updated_at'])
+    except Exception as e:
+        print(f"⚠️ Could not update vector index for user {user_id}: {e}")
+
+def sync_vector_index():
+    """Bring the identification index up to date with the gallery, so a restart re-embeds nobody"""
+    started = time.perf_counter()
+    try:
+        indexed = vector_index.user_versions()
+        gallery_versions = gallery.user_versions()
+        updated = 0
+        with vector_index.bulk():
+            for user_id, updated_at in gallery_versions.items():
+                if indexed.get(user_id) == updated_at:
+                    continue
+                entry = gallery.get(user_id)
+                if entry is not None:
+                    vector_index.add_user(user_id, entry['files'], entry['embeddings'], entry['updated_at'])
+                    updated += 1
+            for user_id in set(indexed) - set(gallery_versions):
+                vector_index.remove_user(user_id)
+        record_startup_phase('vector_index_ms', started)
+        print(f"✅ Vector index ready: {len(vector_index)} references, {updated} users refreshed from the gallery")
+    except Exception as e:
+        print(f"❌ Vector index sync failed: {e}")
+
+def finalize_user_references(prepared: Dict[str, Any], new_embeddings: Dict[str, np.ndarray], min_images: int = 4) -> Dict[str, Any]:
+    """Combine cached and freshly computed reference embeddings and update the gallery"""
+    user_id = prepared["user_id"]
+    cached = prepared["cached"]
+    
+    files, signatures, embeddings = [], [], []
+    for file_info in prepared["selected_infos"]:
+        filename = file_info['name']
+        embedding = cached.get(filename)
+        if embedding is None:
+            embedding = new_embeddings.get(filename)
+        if embedding is not None:
+            files.append(filename)
+            signatures.append(gallery.signature(file_info))
+            embeddings.append(embedding)
+    
+    if len(files) < min_images:
+        return {"error": f"Could not download enough verification images. Downloaded {len(files)}, need at least {min_images}"}
+    
+    embeddings = np.stack(embeddings).astype(np.float32)
+    if len(cached) < len(prepared["selected_infos"]):
+        store_gallery_entry(user_id, files, signatures, embeddings)
+        print(f"✅ Updated gallery for user {user_id}: {len(new_embeddings)} new embeddings, {len(cached)} cached")
+    
+    return {
+        "embeddings": torch.from_numpy(embeddings),
+        "files_used": files,
+        "total_files_found": prepared["total_files_found"],
+        "gallery_hits": len(cached)
+    }
+
+def enroll_user_references(user_id: str, max_references: int = 10, min_references: int = 4,
+                           check_faces: bool = ENROLL_FACE_CHECK) -> Dict[str, Any]:
+    """
+    Score every candidate image in the user's folder, keep the best max_references
+    and store them with their embeddings as the user's gallery entry. Verification
+    afterwards only downloads and compares the selected references.
+    """
+    try:
+        bucket_name = "images"
+        user_folder = f"{user_id}"
+        timings = {}
+        
+        started = time.perf_counter()
+        file_infos = list_file_objects_in_supabase_folder(bucket_name, user_folder)
+        timings["storage_list"] = round((time.perf_counter() - started) * 1000.0, 1)
+        
+        if len(file_infos) < min_references:
+            return {"error": f"Not enough reference images found. Found {len(file_infos)}, need at least {min_references}"}
+        
+        candidate_infos = file_infos[:ENROLL_MAX_CANDIDATES]
+        candidate_names = [file_info['name'] for file_info in candidate_infos]
+        
+        started = time.perf_counter()
+        downloaded = download_user_images(bucket_name, user_folder, candidate_names)
+        timings["storage_download"] = round((time.perf_counter() - started) * 1000.0, 1)
+        
+        started = time.perf_counter()
+        names = list(downloaded.keys())
+        detection_stats = {}
+        detections = {}
+        embeddings, valid_indices, _ = embed_images(model, [downloaded[name] for name in names],
+                                                    detect_faces=FACE_DETECTION, detection_stats=detection_stats,
+                                                    detections=detections)
+        candidate_embeddings = {names[i]: embeddings[row].numpy() for row, i in enumerate(valid_indices)}
+        timings["embedding"] = round((time.perf_counter() - started) * 1000.0, 1)
+        
+        started = time.perf_counter()
+        # Candidates already run through the detector for alignment are not detected again
+        face_probabilities = {names[i]: detection["probability"] if detection else 0.0 for i, detection in detections.items()}
+        scores = score_references(candidate_names, downloaded, candidate_embeddings, check_faces, face_probabilities)
+        selected = select_top_references(scores, max_references)
+        timings["scoring"] = round((time.perf_counter() - started) * 1000.0, 1)
+        
+        rejected = {name: entry["rejected"] for name, entry in scores.items() if entry["rejected"]}
+        if len(selected) < min_references:
+            return {
+                "error": f"Not enough usable reference images. {len(selected)} passed the quality checks, need at least {min_references}",
+                "rejected": rejected
+            }
+        
+        infos_by_name = {file_info['name']: file_info for file_info in candidate_infos}
+        selection = {
+            "enrolled_at": time.time(),
+            "candidates": len(candidate_names),
+            "selected": selected,
+            "rejected": rejected,
+            "scores": {name: round(entry["score"], 4) for name, entry in scores.items()}
+        }
+        store_gallery_entry(
+            user_id,
+            selected,
+            [gallery.signature(infos_by_name[name]) for name in selected],
+            np.stack([candidate_embeddings[name] for name in selected]),
+            selection=selection
+        )
+        print(f"✅ Enrolled user {user_id}: {len(selected)} of {len(candidate_names)} references selected")
         
         return {
-            "verify_images": verify_images,
-            "total_files_found": len(image_files),
-            "files_used": list(verify_images.keys())
+            "selected": selected,
+            "rejected": rejected,
+            "scores": scores,
+            "total_files_found": len(file_infos),
+            "face_detection": detection_stats or None,
+            "timings_ms": timings
         }
         
     except Exception as e:
-        print(f"❌ Error getting user images: {e}")
+        print(f"❌ Error enrolling user references: {e}")
         return {"error": str(e)}
 
 def initialize_model():
     global model, class_names
     print("Initializing VGG-Face2 model...")
-    print(f"Looking for model at: {MODEL_PATH}")
+    print(f"Looking for {INFERENCE_BACKEND} model at: {MODEL_ARTIFACT}")
     
-    model, class_names = load_vggface2_model()
+    started = time.perf_counter()
+    model, class_names = load_inference_model()
+    record_startup_phase('model_total_ms', started)
+    
+    if embedding_cache is not None and os.path.exists(MODEL_ARTIFACT):
+        embedding_cache.set_namespace(f"{MODEL_ARTIFACT}:{os.path.getmtime(MODEL_ARTIFACT)}:{PREPROCESSING_VARIANT}")
+    
+    sync_vector_index()
     
     if model is not None:
         print("✅ Model initialization complete!")
-        print(f"Model type: VGG-Face2 (PyTorch)")
+        print(f"Model type: VGG-Face2 ({INFERENCE_BACKEND})")
         print(f"Available classes: {len(class_names) if class_names else 'Unknown'}")
     else:
         print("❌ Failed to initialize model")
 
+def warm_up_model(batch_sizes=(1, 4)):
+    """Run dummy forward passes so the first real request does not pay for lazy initialization"""
+    global model_warmed
+    if model is None:
+        return
+    
+    started = time.perf_counter()
+    try:
+        for batch_size in batch_sizes:
+            run_backbone(torch.zeros(batch_size, 3, 160, 160))
+        if FACE_DETECTION:
+            aligner = get_face_aligner()
+            if aligner is not None:
+                # Straight to the detector so warm-up does not count towards the face-found rate
+                aligner.detector.detect(Image.new('RGB', (DETECT_SIZE, DETECT_SIZE)))
+        model_warmed = True
+        record_startup_phase('warmup_ms', started)
+        print(f"✅ Model warmed up in {STARTUP_TIMINGS['warmup_ms']} ms (pid {os.getpid()}, {torch.get_num_threads()} torch threads)")
+    except Exception as e:
+        print(f"❌ Model warm-up failed: {e}")
+
+def configure_worker(worker_index: int, torch_threads: int):
+    """Per-process setup for a forked serving worker"""
+    torch.set_num_threads(torch_threads)
+    # ONNX Runtime sessions are not fork-safe; each worker opens its own
+    if isinstance(model, OnnxRuntimeBackend):
+        model.open_session(torch_threads)
+    # Worker processes must not share one on-disk embedding cache index
+    if embedding_cache is not None and EMBEDDING_CACHE_DIR:
+        embedding_cache.set_disk_dir(os.path.join(EMBEDDING_CACHE_DIR, f"worker-{worker_index}"))
+
+def request_route() -> str:
+    """Route pattern of the current request, a bounded metrics label"""
+    return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+@app.before_request
+def start_request_metrics():
+    g.request_started = time.perf_counter()
+    metrics.set_endpoint(request_route())
+    explicit = TRACE_ON_REQUEST and tracing.trace_requested(request.headers, request.args, TRACE_TOKEN)
+    tracing.begin_trace(request_route(), explicit, TRACE_SAMPLE_RATE)
+
+@app.after_request
+def record_request_metrics(response):
+    started = getattr(g, 'request_started', None)
+    if started is not None:
+        metrics.record_request(request_route(), response.status_code, time.perf_counter() - started)
+    metrics.set_endpoint(None)
+    
+    trace = tracing.end_trace()
+    if trace is not None and started is not None:
+        trace.add_span('request', started, time.perf_counter(), {"status": response.status_code})
+        attach_trace(response, trace)
+    return response
+
+def attach_trace(response, trace: tracing.RequestTrace):
+    """Write a finished trace to FACE_AUTH_TRACE_DIR and, if the caller asked for it, add it to the response"""
+    trace_file = trace.write(TRACE_DIR, TRACE_MAX_FILES) if TRACE_DIR else None
+    response.headers['X-Face-Auth-Trace-Id'] = trace.trace_id
+    if not trace.explicit:
+        return
+    
+    data = response.get_json(silent=True)
+    if isinstance(data, dict):
+        data["trace"] = dict(trace.summary(), file=trace_file)
+        response.set_data(app.json.dumps(data))
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    return Response(metrics.REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/health', methods=['GET'])
 def health_check():
+    if model is not None and not model_warmed:
+        return jsonify({
+            "status": "warming_up",
+            "ready": False,
+            "model_loaded": True,
+            "startup_timings_ms": STARTUP_TIMINGS
+        }), 503
+    
     return jsonify({
         "status": "healthy",
+        "ready": model_warmed,
         "model_loaded": model is not None,
         "model_path": MODEL_PATH,
-        "model_exists": os.path.exists(MODEL_PATH),
+        "model_exists": os.path.exists(MODEL_ARTIFACT),
         "model_type": "VGG-Face2 (PyTorch)",
+        "inference_backend": INFERENCE_BACKEND,
+        "model_artifact": MODEL_ARTIFACT,
         "pytorch_version": torch.__version__,
         "device": str(device) if device else "Not initialized",
         "working_directory": os.getcwd(),
         "port": os.environ.get('PORT', 9002),
+        "pid": os.getpid(),
+        "torch_threads": torch.get_num_threads(),
         "supabase_connected": supabase is not None,
         "supabase_url": SUPABASE_URL,
-        "classes": len(class_names) if class_names else 0
+        "classes": len(class_names) if class_names else 0,
+        "startup_timings_ms": STARTUP_TIMINGS,
+        "gallery": gallery.stats(),
+        "inference_batcher": inference_batcher.stats() if inference_batcher is not None else None,
+        "embedding_cache": embedding_cache.stats() if embedding_cache is not None else None,
+        "vector_index": vector_index.stats(),
+        "face_detection": dict(face_aligner_stats() or {}, enabled=FACE_DETECTION, require_face=REQUIRE_FACE)
     })
 
 @app.route('/verify_user', methods=['POST'])
@@ -275,7 +953,7 @@ def verify_user():
         if supabase is None:
             return jsonify({"error": "Supabase not connected"}), 503
         
-        data = request.get_json()
+        data = parse_request_data()
         
         if not data or 'userId' not in data or 'images' not in data:
             return jsonify({"error": "Missing required fields: userId, images"}), 400
@@ -285,6 +963,8 @@ def verify_user():
         threshold = data.get('threshold', 0.6)
         min_verification_images = data.get('min_verification_images', 4)
         max_verification_images = data.get('max_verification_images', 10)
+        early_exit = bool(data.get('early_exit', DOWNLOAD_EARLY_EXIT))
+        request_started = time.perf_counter()
         
         if len(provided_images) == 0:
             return jsonify({"error": "No images provided"}), 400
@@ -292,38 +972,72 @@ def verify_user():
         if len(provided_images) > 10:
             return jsonify({"error": "Maximum 10 images allowed"}), 400
         
-        result = get_user_images_from_supabase(user_id, provided_images, min_verification_images, max_verification_images)
+        prepared = prepare_user_references(user_id, min_verification_images, max_verification_images, early_exit)
+        if "error" in prepared:
+            return jsonify(prepared), 404
+        timings = prepared["timings_ms"]
+        
+        # Embed the provided images and any uncached references in one stacked batch
+        reference_names = list(prepared["downloaded"].keys())
+        all_images = list(provided_images) + [prepared["downloaded"][name] for name in reference_names]
+        # References and probes share the server-wide mode so they stay comparable with the gallery
+        detection_stats = {}
+        started = time.perf_counter()
+        embeddings, valid_indices, errors = embed_images(model, all_images, detect_faces=FACE_DETECTION,
+                                                         detection_stats=detection_stats)
+        timings["embedding"] = round((time.perf_counter() - started) * 1000.0, 1)
+        
+        num_provided = len(provided_images)
+        provided_rows = {}
+        new_embeddings = {}
+        for row, i in enumerate(valid_indices):
+            if i < num_provided:
+                provided_rows[i] = row
+            else:
+                new_embeddings[reference_names[i - num_provided]] = embeddings[row].numpy()
+        
+        for i, error in errors.items():
+            if i < num_provided:
+                print(f"Error preprocessing provided image {i}: {error}")
+            else:
+                print(f"⚠️ Could not embed {user_id}/{reference_names[i - num_provided]}: {error}")
+        
+        result = finalize_user_references(prepared, new_embeddings, min_verification_images)
         if "error" in result:
             return jsonify(result), 404
         
-        verify_images = result["verify_images"]
+        verification_files = result["files_used"]
+        
+        # Score every provided image against every reference with one matmul
+        started = time.perf_counter()
+        similarity_rows = {}
+        if provided_rows:
+            provided_indices = sorted(provided_rows)
+            provided_embeddings = embeddings[[provided_rows[i] for i in provided_indices]]
+            with stage_timer('similarity'):
+                similarities = cosine_similarity_matrix(provided_embeddings, result["embeddings"]).tolist()
+            similarity_rows = dict(zip(provided_indices, similarities))
+        timings["similarity"] = round((time.perf_counter() - started) * 1000.0, 1)
         
         comparisons = []
         matches_found = 0
         
-        for i, provided_img in enumerate(provided_images):
+        for i in range(len(provided_images)):
             image_matches = []
             best_match_score = 0
             
-            for verify_filename, verify_img_data in verify_images.items():
-                try:
-                    comparison_result = verify_faces_vggface2(model, provided_img, verify_img_data, threshold)
-                    if comparison_result:
-                        is_match = comparison_result['is_match']
-                        score = comparison_result['similarity_score']
-                        
-                        image_matches.append({
-                            "verification_image": verify_filename,
-                            "similarity_score": score,
-                            "is_match": is_match,
-                            "confidence": comparison_result['confidence']
-                        })
-                        
-                        if is_match and score > best_match_score:
-                            best_match_score = score
+            for verify_filename, score in zip(verification_files, similarity_rows.get(i, [])):
+                is_match = score > threshold
+                
+                image_matches.append({
+                    "verification_image": verify_filename,
+                    "similarity_score": float(score),
+                    "is_match": bool(is_match),
+                    "confidence": get_confidence_label(score, threshold)
+                })
                 
-                except Exception as e:
-                    print(f"Error comparing with {verify_filename}: {e}")
+                if is_match and score > best_match_score:
+                    best_match_score = score
             
             has_match = any(match['is_match'] for match in image_matches)
             if has_match:
@@ -348,9 +1062,132 @@ def verify_user():
             "threshold": threshold,
             "model_type": "VGG-Face2",
             "detailed_comparisons": comparisons,
-            "verification_images_found": len(verify_images),
-            "verification_files_used": result.get("files_used", []),
-            "total_files_in_folder": result.get("total_files_found", 0)
+            "verification_images_found": len(verification_files),
+            "verification_files_used": verification_files,
+            "total_files_in_folder": result.get("total_files_found", 0),
+            "gallery_hits": result.get("gallery_hits", 0),
+            "face_detection": detection_stats or None,
+            "timings_ms": dict(timings, total=round((time.perf_counter() - request_started) * 1000.0, 1))
+        })
+        
+    except Exception as e:
+        return jsonify({"error": f"Internal server error: {str(e)}"}), 500
+
+@app.route('/enroll', methods=['POST'])
+def enroll_user():
+    try:
+        if model is None:
+            return jsonify({"error": "Model not loaded"}), 503
+        
+        if supabase is None:
+            return jsonify({"error": "Supabase not connected"}), 503
+        
+        data = parse_request_data()
+        
+        if not data or 'userId' not in data:
+            return jsonify({"error": "Missing required field: userId"}), 400
+        
+        user_id = data['userId']
+        max_references = data.get('max_references', 10)
+        min_references = data.get('min_references', 4)
+        request_started = time.perf_counter()
+        
+        if min_references < 1 or max_references < min_references:
+            return jsonify({"error": "max_references must be at least min_references, which must be positive"}), 400
+        
+        result = enroll_user_references(user_id, max_references, min_references)
+        if "error" in result:
+            return jsonify(result), 404
+        
+        return jsonify({
+            "user_id": user_id,
+            "enrolled": True,
+            "references_selected": len(result["selected"]),
+            "selected_files": result["selected"],
+            "rejected_files": result["rejected"],
+            "reference_scores": result["scores"],
+            "total_files_in_folder": result["total_files_found"],
+            "face_detection": result["face_detection"],
+            "timings_ms": dict(result["timings_ms"], total=round((time.perf_counter() - request_started) * 1000.0, 1))
+        })
+        
+    except Exception as e:
+        return jsonify({"error": f"Internal server error: {str(e)}"}), 500
+
+@app.route('/identify', methods=['POST'])
+def identify_face():
+    try:
+        if model is None:
+            return jsonify({"error": "Model not loaded"}), 503
+        
+        data = parse_request_data()
+        
+        if not data or ('image' not in data and 'images' not in data):
+            return jsonify({"error": "Missing required field: image or images"}), 400
+        
+        provided_images = data['images'] if 'images' in data else [data['image']]
+        threshold = data.get('threshold', 0.6)
+        top_k = data.get('top_k', 5)
+        request_started = time.perf_counter()
+        timings = {}
+        
+        if len(provided_images) == 0:
+            return jsonify({"error": "No images provided"}), 400
+        
+        if len(provided_images) > 10:
+            return jsonify({"error": "Maximum 10 images allowed"}), 400
+        
+        if not 1 <= top_k <= MAX_IDENTIFY_TOP_K:
+            return jsonify({"error": f"top_k must be between 1 and {MAX_IDENTIFY_TOP_K}"}), 400
+        
+        if len(vector_index) == 0:
+            return jsonify({"error": "No enrolled users to identify against"}), 404
+        
+        # Probes use the server-wide mode so they are comparable with the indexed gallery embeddings
+        detection_stats = {}
+        started = time.perf_counter()
+        embeddings, valid_indices, errors = embed_images(model, provided_images, detect_faces=FACE_DETECTION,
+                                                         detection_stats=detection_stats)
+        timings["embedding"] = round((time.perf_counter() - started) * 1000.0, 1)
+        
+        started = time.perf_counter()
+        with stage_timer('similarity'):
+            matches = vector_index.search(embeddings.numpy(), top_k) if valid_indices else []
+        timings["search"] = round((time.perf_counter() - started) * 1000.0, 1)
+        
+        results = []
+        best_match = None
+        for i, candidates in zip(valid_indices, matches):
+            image_candidates = [{
+                "user_id": candidate["user_id"],
+                "similarity_score": candidate["score"],
+                "is_match": bool(candidate["score"] > threshold),
+                "confidence": get_confidence_label(candidate["score"], threshold),
+                "reference_image": candidate["file"]
+            } for candidate in candidates]
+            
+            identified = image_candidates[0] if image_candidates and image_candidates[0]["is_match"] else None
+            if identified and (best_match is None or identified["similarity_score"] > best_match["similarity_score"]):
+                best_match = identified
+            
+            results.append({
+                "provided_image_index": i,
+                "candidates": image_candidates,
+                "identified_user": identified["user_id"] if identified else None
+            })
+        
+        return jsonify({
+            "identified_user": best_match["user_id"] if best_match else None,
+            "best_score": best_match["similarity_score"] if best_match else None,
+            "threshold": threshold,
+            "top_k": top_k,
+            "model_type": "VGG-Face2",
+            "results": results,
+            "failed_images": {str(i): error for i, error in errors.items()},
+            "total_images_provided": len(provided_images),
+            "index": vector_index.stats(),
+            "face_detection": detection_stats or None,
+            "timings_ms": dict(timings, total=round((time.perf_counter() - request_started) * 1000.0, 1))
         })
         
     except Exception as e:
@@ -362,13 +1199,15 @@ def compare_faces():
         if model is None:
             return jsonify({"error": "Model not loaded"}), 503
         
-        data = request.get_json()
+        data = parse_request_data()
         
         if not data or 'image1' not in data or 'image2' not in data:
             return jsonify({"error": "Missing required fields: image1, image2"}), 400
 
         threshold = data.get('threshold', 0.6)
-        result = verify_faces_vggface2(model, data['image1'], data['image2'], threshold)
+        detect_faces = bool(data.get('detect_faces', FACE_DETECTION))
+        detection_stats = {}
+        result = verify_faces_vggface2(model, data['image1'], data['image2'], threshold, detect_faces, detection_stats)
         
         if result is None:
             return jsonify({"error": "Failed to process images"}), 500
@@ -378,7 +1217,8 @@ def compare_faces():
             "similarity_score": result['similarity_score'],
             "threshold": threshold,
             "confidence": result['confidence'].lower(),
-            "model_type": "VGG-Face2"
+            "model_type": "VGG-Face2",
+            "face_detection": detection_stats or None
         })
         
     except ValueError as ve:
@@ -392,46 +1232,100 @@ def batch_compare():
         if model is None:
             return jsonify({"error": "Model not loaded"}), 503
             
-        data = request.get_json()
+        with stage_timer('json_parse'):
+            data = request.get_json()
         
         if not data or 'pairs' not in data:
             return jsonify({
                 "error": "Missing required field: pairs (array of {image1, image2} objects)"
             }), 400
         
-        results = []
+        pairs = data['pairs']
         threshold = data.get('threshold', 0.6)
+        detect_faces = bool(data.get('detect_faces', FACE_DETECTION))
+        detection_stats = {}
+        
+        if len(pairs) > MAX_BATCH_PAIRS:
+            return jsonify({"error": f"Maximum {MAX_BATCH_PAIRS} pairs allowed"}), 400
+        
+        # Decode and hash every payload once so images shared between pairs
+        # are embedded a single time
+        payload_keys = {}
+        unique_images = {}
+        image_errors = {}
         
-        for i, pair in enumerate(data['pairs']):
-            if 'image1' not in pair or 'image2' not in pair:
-                results.append({
+        def resolve_image(image_data):
+            cache_key = image_data if isinstance(image_data, (str, bytes)) else None
+            if cache_key is not None and cache_key in payload_keys:
+                return payload_keys[cache_key]
+            try:
+                image_bytes = decode_image_payload(image_data)
+                key = hash_image_payload(image_bytes)
+                unique_images.setdefault(key, image_bytes)
+            except ValueError as e:
+                key = f"error:{len(image_errors)}"
+                image_errors[key] = str(e)
+            if cache_key is not None:
+                payload_keys[cache_key] = key
+            return key
+        
+        pair_keys = {}
+        results = [None] * len(pairs)
+        
+        for i, pair in enumerate(pairs):
+            if not isinstance(pair, dict) or 'image1' not in pair or 'image2' not in pair:
+                results[i] = {
                     "pair_index": i,
                     "match": False,
                     "error": "Missing image1 or image2 in pair"
-                })
+                }
                 continue
-            
-            try:
-                result = verify_faces_vggface2(model, pair['image1'], pair['image2'], threshold)
-                if result:
-                    results.append({
-                        "pair_index": i,
-                        "match": result['is_match'],
-                        "similarity_score": result['similarity_score'],
-                        "confidence": result['confidence'].lower()
-                    })
-                else:
-                    results.append({
-                        "pair_index": i,
-                        "match": False,
-                        "error": "Failed to process this pair"
-                    })
-            except Exception as e:
-                results.append({
+            pair_keys[i] = (resolve_image(pair['image1']), resolve_image(pair['image2']))
+        
+        # Embed each unique image once, in chunked batched forwards
+        unique_keys = list(unique_images.keys())
+        embedding_rows = {}
+        embedding_chunks = []
+        num_embedded = 0
+        
+        for start in range(0, len(unique_keys), EMBED_CHUNK_SIZE):
+            chunk_keys = unique_keys[start:start + EMBED_CHUNK_SIZE]
+            embeddings, valid_indices, errors = embed_images(model, [unique_images[key] for key in chunk_keys], keys=chunk_keys,
+                                                             detect_faces=detect_faces, detection_stats=detection_stats)
+            for row, j in enumerate(valid_indices):
+                embedding_rows[chunk_keys[j]] = num_embedded + row
+            for j, error in errors.items():
+                image_errors[chunk_keys[j]] = error
+            embedding_chunks.append(embeddings)
+            num_embedded += embeddings.shape[0]
+        
+        # Score all valid pairs in one vectorized step
+        valid_pairs = []
+        for i, (key1, key2) in pair_keys.items():
+            error = image_errors.get(key1) or image_errors.get(key2)
+            if error:
+                results[i] = {
                     "pair_index": i,
                     "match": False,
-                    "error": str(e)
-                })
+                    "error": error
+                }
+            else:
+                valid_pairs.append(i)
+        
+        if valid_pairs:
+            with stage_timer('similarity'):
+                all_embeddings = torch.nn.functional.normalize(torch.cat(embedding_chunks), dim=1)
+                rows1 = torch.tensor([embedding_rows[pair_keys[i][0]] for i in valid_pairs])
+                rows2 = torch.tensor([embedding_rows[pair_keys[i][1]] for i in valid_pairs])
+                similarities = (all_embeddings[rows1] * all_embeddings[rows2]).sum(dim=1).tolist()
+            
+            for i, similarity in zip(valid_pairs, similarities):
+                results[i] = {
+                    "pair_index": i,
+                    "match": bool(similarity > threshold),
+                    "similarity_score": float(similarity),
+                    "confidence": get_confidence_label(similarity, threshold).lower()
+                }
         
         match_results = [result.get('match', False) for result in results]
         
@@ -440,8 +1334,10 @@ def batch_compare():
             "detailed_results": results,
             "threshold": threshold,
             "model_type": "VGG-Face2",
-            "total_pairs": len(data['pairs']),
-            "successful_pairs": len([r for r in results if 'error' not in r])
+            "total_pairs": len(pairs),
+            "successful_pairs": len([r for r in results if 'error' not in r]),
+            "unique_images": len(unique_images),
+            "face_detection": detection_stats or None
         })
         
     except Exception as e:
@@ -457,10 +1353,13 @@ def model_info():
     try:
         total_params = sum(p.numel() for p in model.parameters())
         trainable_params = sum(p.numel() for p in model.parameters() if p.requires_grad)
+        if total_params == 0 and hasattr(model, 'metadata'):
+            total_params = model.metadata.get('total_parameters', 0)
         
         return jsonify({
             "model_loaded": True,
             "model_type": "VGG-Face2 (PyTorch)",
+            "inference_backend": INFERENCE_BACKEND,
             "total_parameters": int(total_params),
             "trainable_parameters": int(trainable_params),
             "input_size": "160x160x3",
@@ -478,6 +1377,7 @@ def model_info():
 
 if __name__ == '__main__':
     initialize_model()
+    warm_up_model()
     app.run(
         host='0.0.0.0',
         port=int(os.environ.get('PORT', 9002)),
@@ -0,0 +1,140 @@
+import math
+import time
+import threading
+import numpy as np
+from PIL import Image
+from typing import List, Dict, Any, Optional, Tuple
+
+DETECT_SIZE = 640
+MIN_FACE_PROBABILITY = 0.9
+FACE_MARGIN = 0.2
+# Faces in verification uploads are large; skipping tiny pyramid scales keeps detection fast
+MIN_FACE_SIZE = 40
+
+_aligner = None
+_aligner_lock = threading.Lock()
+
+class FaceAligner:
+    """
+    Batched MTCNN face detection plus eye-level alignment.
+    Every image of a call is letterboxed onto one DETECT_SIZE canvas so the
+    whole request goes through the detector in a single batched pass; boxes and
+    landmarks are mapped back to the original image for cropping.
+    """
+
+    def __init__(self, detect_size: int = DETECT_SIZE, min_probability: float = MIN_FACE_PROBABILITY,
+                 margin: float = FACE_MARGIN, min_face_size: int = MIN_FACE_SIZE, device: str = 'cpu'):
+        from facenet_pytorch import MTCNN
+
+        self.detector = MTCNN(keep_all=True, min_face_size=min_face_size, device=device)
+        self.detect_size = detect_size
+        self.min_probability = min_probability
+        self.margin = margin
+        # MTCNN keeps per-call state on its modules; serialize calls within a process
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.images = 0
+        self.faces_found = 0
+        self.detector_ms_total = 0.0
+
+    def _letterbox(self, image: Image.Image) -> Tuple[Image.Image, float]:
+        scale = self.detect_size / max(image.width, image.height)
+        resized = image.resize((max(1, round(image.width * scale)), max(1, round(image.height * scale))), Image.BILINEAR)
+        canvas = Image.new('RGB', (self.detect_size, self.detect_size))
+        canvas.paste(resized, (0, 0))
+        return canvas, scale
+
+    def detect(self, images: List[Image.Image]) -> List[Optional[Dict[str, Any]]]:
+        """
+        Most confident face per image as {box, probability, landmarks} in original
+        image coordinates, or None when the detector finds nothing. Callers
+        compare probability against min_probability (see is_face).
+        """
+        if not images:
+            return []
+
+        canvases, scales = zip(*[self._letterbox(image) for image in images])
+        started = time.perf_counter()
+        with self._lock:
+            boxes, probs, landmarks = self.detector.detect(list(canvases), landmarks=True)
+        elapsed_ms = (time.perf_counter() - started) * 1000.0
+
+        detections = []
+        for i, scale in enumerate(scales):
+            if boxes[i] is None or probs[i] is None:
+                detections.append(None)
+                continue
+            best = int(np.argmax(probs[i]))
+            detections.append({
+                "box": (boxes[i][best] / scale).tolist(),
+                "probability": float(probs[i][best]),
+                "landmarks": (landmarks[i][best] / scale).tolist()
+            })
+
+        with self._lock:
+            self.calls += 1
+            self.images += len(images)
+            self.faces_found += sum(1 for detection in detections if self.is_face(detection))
+            self.detector_ms_total += elapsed_ms
+        return detections
+
+    def is_face(self, detection: Optional[Dict[str, Any]]) -> bool:
+        return detection is not None and detection["probability"] >= self.min_probability
+
+    def face_probabilities(self, images: List[Image.Image]) -> List[float]:
+        """Best face probability per image, 0.0 where nothing was detected"""
+        return [detection["probability"] if detection else 0.0 for detection in self.detect(images)]
+
+    def align(self, image: Image.Image, detection: Dict[str, Any], output_size: Tuple[int, int] = (160, 160)) -> Image.Image:
+        """Rotate the image so the eyes are level, then crop a square around the face with a margin"""
+        x1, y1, x2, y2 = detection["box"]
+        (left_x, left_y), (right_x, right_y) = detection["landmarks"][0], detection["landmarks"][1]
+        center = ((x1 + x2) / 2.0, (y1 + y2) / 2.0)
+
+        angle = math.degrees(math.atan2(right_y - left_y, right_x - left_x))
+        if abs(angle) > 1.0:
+            image = image.rotate(angle, resample=Image.BILINEAR, center=center)
+
+        half = max(x2 - x1, y2 - y1) * (0.5 + self.margin)
+        crop = image.crop((
+            int(round(center[0] - half)),
+            int(round(center[1] - half)),
+            int(round(center[0] + half)),
+            int(round(center[1] + half))
+        ))
+        return crop.resize(output_size, Image.BILINEAR)
+
+    def detect_and_align(self, images: List[Image.Image], output_size: Tuple[int, int] = (160, 160)) -> List[Optional[Image.Image]]:
+        """Aligned face crop per image, or None where no face was found"""
+        detections = self.detect(images)
+        return [
+            self.align(image, detection, output_size) if self.is_face(detection) else None
+            for image, detection in zip(images, detections)
+        ]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "images": self.images,
+                "faces_found": self.faces_found,
+                "face_found_rate": round(self.faces_found / self.images, 4) if self.images else None,
+                "detector_ms_total": round(self.detector_ms_total, 1),
+                "detector_ms_per_image": round(self.detector_ms_total / self.images, 2) if self.images else None
+            }
+
+def get_face_aligner() -> Optional[FaceAligner]:
+    """Process-wide detector, created on first use; None if facenet-pytorch's MTCNN cannot be loaded"""
+    global _aligner
+    with _aligner_lock:
+        if _aligner is None:
+            try:
+                _aligner = FaceAligner()
+            except Exception as e:
+                print(f"⚠️ Face detector unavailable: {e}")
+                # Remember the failure instead of retrying on every request
+                _aligner = False
+        return _aligner or None
+
+def face_aligner_stats() -> Optional[Dict[str, Any]]:
+    return _aligner.stats() if _aligner else None
@@ -0,0 +1,236 @@
+import os
+import re
+import json
+import time
+import threading
+import numpy as np
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Tuple
+
+EMBEDDING_DIM = 512
+
+def file_signature(file_info: Dict[str, Any]) -> str:
+    """Build a change signature for a storage object from its etag, timestamp and size"""
+    metadata = file_info.get('metadata') or {}
+    etag = metadata.get('eTag') or metadata.get('etag') or ''
+    updated_at = file_info.get('updated_at') or metadata.get('lastModified') or ''
+    size = metadata.get('size', '')
+    return f"{etag}|{updated_at}|{size}"
+
+class EmbeddingGallery:
+    """
+    Per-user store of precomputed reference embeddings.
+    Each entry keeps the reference filenames, their storage signatures and an
+    (N, 512) float32 embedding matrix, plus the enrollment selection once the
+    user has been enrolled. Up to max_users entries are cached in memory,
+    least recently used first out, and all are persisted to root_dir so a
+    restart does not re-embed every user; a cached entry is
+    re-read once its metadata file changes on disk, so entries rewritten by
+    another worker or by the bulk enrollment job are picked up. The variant is folded
+    into every signature, so embeddings produced by a different preprocessing
+    mode count as stale.
+    """
+
+    def __init__(self, root_dir: Optional[str] = None, variant: str = '', max_users: int = 2000):
+        self.root_dir = root_dir
+        self.variant = variant
+        self.max_users = max(1, int(max_users))
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.evictions = 0
+
+        if self.root_dir:
+            try:
+                os.makedirs(self.root_dir, exist_ok=True)
+            except OSError as e:
+                print(f"⚠️ Gallery directory {self.root_dir} unavailable, using memory only: {e}")
+                self.root_dir = None
+
+    def _entry_paths(self, user_id: str) -> Tuple[str, str]:
+        safe_id = re.sub(r'[^A-Za-z0-9_.-]', '_', user_id)
+        base = os.path.join(self.root_dir, safe_id)
+        return base + '.npy', base + '.json'
+
+    def _disk_stamp(self, user_id: str):
+        """Identity of the entry's metadata file, which is replaced last on every save"""
+        try:
+            stat = os.stat(self._entry_paths(user_id)[1])
+            return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            return None
+
+    def _load_from_disk(self, user_id: str) -> Optional[Dict[str, Any]]:
+        if not self.root_dir:
+            return None
+
+        embeddings_path, meta_path = self._entry_paths(user_id)
+        stamp = self._disk_stamp(user_id)
+        if stamp is None or not os.path.exists(embeddings_path):
+            return None
+
+        try:
+            with open(meta_path, 'r') as f:
+                meta = json.load(f)
+            if meta.get('user_id') != user_id:
+                return None
+
+            embeddings = np.load(embeddings_path).astype(np.float32, copy=False)
+            if embeddings.shape != (len(meta['files']), EMBEDDING_DIM):
+                return None
+
+            return {
+                "files": meta['files'],
+                "signatures": meta['signatures'],
+                "embeddings": embeddings,
+                "updated_at": meta.get('updated_at', 0),
+                "selection": meta.get('selection'),
+                "disk_stamp": stamp
+            }
+        except Exception as e:
+            print(f"⚠️ Could not read gallery entry for {user_id}: {e}")
+            return None
+
+    def _save_to_disk(self, user_id: str, entry: Dict[str, Any]):
+        if not self.root_dir:
+            return
+
+        embeddings_path, meta_path = self._entry_paths(user_id)
+        try:
+            tmp_embeddings_path = embeddings_path + '.tmp'
+            with open(tmp_embeddings_path, 'wb') as f:
+                np.save(f, entry['embeddings'])
+            os.replace(tmp_embeddings_path, embeddings_path)
+
+            tmp_meta_path = meta_path + '.tmp'
+            with open(tmp_meta_path, 'w') as f:
+                json.dump({
+                    "user_id": user_id,
+                    "files": entry['files'],
+                    "signatures": entry['signatures'],
+                    "updated_at": entry['updated_at'],
+                    "selection": entry.get('selection')
+                }, f)
+            # Stamped before the rename, which keeps inode and mtime, so a concurrent writer cannot be mistaken for this one
+            stat = os.stat(tmp_meta_path)
+            os.replace(tmp_meta_path, meta_path)
+            entry['disk_stamp'] = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        except Exception as e:
+            print(f"⚠️ Could not persist gallery entry for {user_id}: {e}")
+
+    def signature(self, file_info: Dict[str, Any]) -> str:
+        signature = file_signature(file_info)
+        return f"{signature}|{self.variant}" if self.variant else signature
+
+    def get(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """Return the gallery entry for a user, loading it from disk if needed or changed there"""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and self.root_dir and entry.get('disk_stamp') != self._disk_stamp(user_id):
+                entry = None
+            if entry is None:
+                entry = self._load_from_disk(user_id)
+                if entry is not None:
+                    self._insert(user_id, entry)
+                else:
+                    self._entries.pop(user_id, None)
+            else:
+                self._entries.move_to_end(user_id)
+            return entry
+
+    def _insert(self, user_id: str, entry: Dict[str, Any]):
+        self._entries[user_id] = entry
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_users:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def lookup(self, user_id: str, file_infos: List[Dict[str, Any]]) -> Tuple[Dict[str, np.ndarray], List[Dict[str, Any]]]:
+        """
+        Split the requested storage objects into cached embeddings and objects
+        that must be (re-)embedded because they are new or changed.
+        """
+        entry = self.get(user_id)
+        cached = {}
+        missing = []
+
+        known = {}
+        if entry is not None:
+            for row, (name, signature) in enumerate(zip(entry['files'], entry['signatures'])):
+                known[name] = (signature, row)
+
+        for file_info in file_infos:
+            name = file_info['name']
+            if name in known and known[name][0] == self.signature(file_info):
+                cached[name] = entry['embeddings'][known[name][1]]
+            else:
+                missing.append(file_info)
+
+        with self._lock:
+            if missing:
+                self.misses += 1
+                if entry is not None:
+                    self.invalidations += 1
+            else:
+                self.hits += 1
+
+        return cached, missing
+
+    def put(self, user_id: str, files: List[str], signatures: List[str], embeddings: np.ndarray,
+            selection: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Replace the gallery entry for a user and return it. The enrollment
+        selection of the previous entry is kept unless a new one is given.
+        """
+        previous = self.get(user_id) if selection is None else None
+        entry = {
+            "files": list(files),
+            "signatures": list(signatures),
+            "embeddings": np.ascontiguousarray(embeddings, dtype=np.float32).reshape(len(files), EMBEDDING_DIM),
+            "updated_at": time.time(),
+            "selection": selection if selection is not None else (previous or {}).get('selection')
+        }
+        with self._lock:
+            self._insert(user_id, entry)
+            self._save_to_disk(user_id, entry)
+        return entry
+
+    def selected_files(self, user_id: str) -> Optional[List[str]]:
+        """Reference files chosen at enrollment, best first, or None if the user was never enrolled"""
+        entry = self.get(user_id)
+        if entry is None or not entry.get('selection'):
+            return None
+        return list(entry['selection']['selected'])
+
+    def user_versions(self) -> Dict[str, float]:
+        """updated_at of every user with a gallery entry, in memory or on disk"""
+        versions = {}
+        if self.root_dir:
+            for name in os.listdir(self.root_dir):
+                if not name.endswith('.json'):
+                    continue
+                try:
+                    with open(os.path.join(self.root_dir, name), 'r') as f:
+                        meta = json.load(f)
+                    versions[meta['user_id']] = meta.get('updated_at', 0)
+                except Exception:
+                    continue
+        with self._lock:
+            for user_id, entry in self._entries.items():
+                # Memory may hold an older copy of an entry another process rewrote
+                versions[user_id] = max(versions.get(user_id, 0), entry['updated_at'])
+        return versions
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "users_in_memory": len(self._entries),
+                "max_users": self.max_users,
+                "evictions": self.evictions,
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "persistent": self.root_dir is not None
+            }
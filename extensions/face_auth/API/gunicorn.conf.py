@@ -0,0 +1,53 @@
+"""
+gunicorn configuration for the face verification API.
+
+Usage:
+    gunicorn --config gunicorn.conf.py
+
+FACE_AUTH_WORKERS         worker processes (default: available cores / FACE_AUTH_TORCH_THREADS)
+FACE_AUTH_TORCH_THREADS   torch intra-op threads per worker (default: 2)
+FACE_AUTH_WORKER_THREADS  request threads per worker, feeding the micro-batcher (default: 4)
+FACE_AUTH_METRICS_DIR     directory where workers publish metrics for /metrics (default: /tmp/face_auth_metrics)
+"""
+import os
+
+def available_cpus():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+TORCH_THREADS = int(os.environ.get('FACE_AUTH_TORCH_THREADS', 2))
+
+# Must be set before torch is imported by the preloaded app so the master does
+# not size its thread pools for the whole node
+os.environ.setdefault('OMP_NUM_THREADS', str(TORCH_THREADS))
+os.environ.setdefault('MKL_NUM_THREADS', str(TORCH_THREADS))
+# Workers share their metrics through this directory so any worker can answer a scrape
+os.environ.setdefault('FACE_AUTH_METRICS_DIR', '/tmp/face_auth_metrics')
+
+wsgi_app = 'wsgi:app'
+bind = f"0.0.0.0:{os.environ.get('PORT', 9002)}"
+workers = int(os.environ.get('FACE_AUTH_WORKERS', max(1, available_cpus() // TORCH_THREADS)))
+worker_class = 'gthread'
+threads = int(os.environ.get('FACE_AUTH_WORKER_THREADS', 4))
+preload_app = True
+timeout = 120
+graceful_timeout = 30
+
+def on_starting(server):
+    # Counters restart with the server; drop snapshots of the previous run's workers
+    import metrics
+    metrics.REGISTRY.clear_shared_dir()
+
+def pre_fork(server, worker):
+    # Stable per-worker slot numbers, so per-worker state (e.g. the embedding
+    # cache directory) is reused when gunicorn replaces a worker
+    used = {getattr(running, 'face_auth_slot', None) for running in server.WORKERS.values()}
+    worker.face_auth_slot = next(slot for slot in range(len(used) + 1) if slot not in used)
+
+def post_fork(server, worker):
+    import face_auth_api
+    face_auth_api.configure_worker(worker.face_auth_slot, TORCH_THREADS)
+    # Warm up before the worker starts accepting connections
+    face_auth_api.warm_up_model()
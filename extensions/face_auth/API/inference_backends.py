@@ -0,0 +1,91 @@
+import os
+import json
+import threading
+import torch
+import numpy as np
+from typing import Dict, Any, Iterator, Optional
+
+def read_artifact_metadata(artifact_path: str) -> Dict[str, Any]:
+    """Read the JSON sidecar (num_classes, class_names, ...) written next to an exported artifact"""
+    metadata_path = artifact_path + '.json'
+    if not os.path.exists(metadata_path):
+        return {}
+    with open(metadata_path, 'r') as f:
+        return json.load(f)
+
+class TorchScriptBackend:
+    """Frozen TorchScript module returning (embeddings, logits)"""
+
+    name = "torchscript"
+
+    def __init__(self, artifact_path: str, device: torch.device):
+        self.artifact_path = artifact_path
+        self.metadata = read_artifact_metadata(artifact_path)
+        # Quantized kernels are CPU-only
+        self.device = torch.device('cpu') if self.metadata.get('quantization') else device
+        if self.metadata.get('quantized_engine'):
+            torch.backends.quantized.engine = self.metadata['quantized_engine']
+        self.module = torch.jit.load(artifact_path, map_location=self.device)
+        self.module.eval()
+        if not self.metadata.get('quantization'):
+            # Conv/BN folding and MKLDNN layouts; the result is not serializable, so it is applied here
+            self.module = torch.jit.optimize_for_inference(self.module)
+
+    def get_embeddings(self, x: torch.Tensor) -> torch.Tensor:
+        with torch.inference_mode():
+            embeddings, _ = self.module(x)
+        return embeddings
+
+    def parameters(self) -> Iterator[torch.Tensor]:
+        return self.module.parameters()
+
+class OnnxRuntimeBackend:
+    """
+    ONNX Runtime CPU session with full graph optimizations.
+    The session is created on first use rather than at load: with gunicorn's
+    preload_app the model is loaded in the master, and an ONNX Runtime session
+    and its thread pools do not survive a fork. Workers open their own session
+    after forking (configure_worker).
+    """
+
+    name = "onnxruntime"
+
+    def __init__(self, artifact_path: str, num_threads: int = 0):
+        if not os.path.exists(artifact_path):
+            raise FileNotFoundError(f"ONNX model not found: {artifact_path}")
+
+        self.artifact_path = artifact_path
+        self.num_threads = num_threads
+        self.device = torch.device('cpu')
+        self.metadata = read_artifact_metadata(artifact_path)
+        self.session = None
+        self.input_name = None
+        self._session_lock = threading.Lock()
+
+    def open_session(self, num_threads: Optional[int] = None):
+        """Create this process's session, replacing any existing one"""
+        import onnxruntime as ort
+
+        if num_threads is not None:
+            self.num_threads = num_threads
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if self.num_threads > 0:
+            options.intra_op_num_threads = self.num_threads
+
+        session = ort.InferenceSession(self.artifact_path, options, providers=['CPUExecutionProvider'])
+        self.input_name = session.get_inputs()[0].name
+        self.session = session
+
+    def get_embeddings(self, x: torch.Tensor) -> torch.Tensor:
+        if self.session is None:
+            with self._session_lock:
+                if self.session is None:
+                    self.open_session()
+        inputs = np.ascontiguousarray(x.detach().cpu().numpy(), dtype=np.float32)
+        embeddings = self.session.run(['embeddings'], {self.input_name: inputs})[0]
+        return torch.from_numpy(embeddings)
+
+    def parameters(self) -> Iterator[torch.Tensor]:
+        # Weights live inside the ONNX graph; model_info falls back to the exported count
+        return iter(())
@@ -0,0 +1,148 @@
+import os
+import time
+import queue
+import threading
+import torch
+from concurrent.futures import Future
+from typing import Callable, Dict, Any, List, Optional, Tuple
+
+BATCH_SIZE_BUCKETS = [1, 2, 4, 8, 16, 32, 64, 128]
+
+class MicroBatcher:
+    """
+    Dynamic micro-batching queue in front of an embedding function.
+    Concurrent callers submit (N, 3, 160, 160) tensors; a worker thread collects
+    submissions for up to max_wait_ms or until max_batch_size images are queued,
+    runs one forward pass over the concatenated batch and scatters the rows back.
+    """
+
+    def __init__(self, infer_fn: Callable[[torch.Tensor], torch.Tensor], max_batch_size: int = 32, max_wait_ms: float = 5.0):
+        self.infer_fn = infer_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait_ms = max(0.0, float(max_wait_ms))
+
+        self._lock = threading.Lock()
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self._carry = None
+
+        self.batches_run = 0
+        self.images_processed = 0
+        self.requests_processed = 0
+        self.total_wait_ms = 0.0
+        self.max_observed_wait_ms = 0.0
+        self.total_forward_ms = 0.0
+        self.batch_size_histogram = {str(bucket): 0 for bucket in BATCH_SIZE_BUCKETS}
+        self.batch_size_histogram['+Inf'] = 0
+
+    def _ensure_started(self):
+        # Threads do not survive fork, so each worker process starts its own
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._queue = queue.Queue()
+            self._carry = None
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="inference-batcher", daemon=True)
+            self._thread.start()
+
+    def submit(self, batch: torch.Tensor) -> Future:
+        """Queue a batch of face tensors; the future resolves to its embeddings"""
+        self._ensure_started()
+        future = Future()
+        self._queue.put((batch, future, time.perf_counter()))
+        return future
+
+    def infer(self, batch: torch.Tensor) -> torch.Tensor:
+        return self.submit(batch).result()
+
+    def _next_item(self, timeout: Optional[float]) -> Optional[Tuple[torch.Tensor, Future, float]]:
+        if self._carry is not None:
+            item, self._carry = self._carry, None
+            return item
+        try:
+            if timeout is None:
+                return self._queue.get()
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def _collect(self) -> List[Tuple[torch.Tensor, Future, float]]:
+        items = [self._next_item(None)]
+        size = items[0][0].shape[0]
+        deadline = time.perf_counter() + self.max_wait_ms / 1000.0
+
+        while size < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            item = self._next_item(remaining)
+            if item is None:
+                break
+            if size + item[0].shape[0] > self.max_batch_size:
+                # Keep oversized follow-ups for the next forward pass
+                self._carry = item
+                break
+            items.append(item)
+            size += item[0].shape[0]
+
+        return items
+
+    def _run(self):
+        while True:
+            items = self._collect()
+            started = time.perf_counter()
+            sizes = [batch.shape[0] for batch, _, _ in items]
+
+            try:
+                embeddings = self.infer_fn(torch.cat([batch for batch, _, _ in items]))
+                outputs = torch.split(embeddings, sizes)
+                for (_, future, _), output in zip(items, outputs):
+                    future.set_result(output)
+            except Exception as e:
+                for _, future, _ in items:
+                    future.set_exception(e)
+
+            self._record(items, sum(sizes), started)
+
+    def _record(self, items: List[Tuple[torch.Tensor, Future, float]], batch_size: int, started: float):
+        finished = time.perf_counter()
+        with self._lock:
+            self.batches_run += 1
+            self.images_processed += batch_size
+            self.requests_processed += len(items)
+            self.total_forward_ms += (finished - started) * 1000.0
+            for _, _, submitted in items:
+                wait_ms = (started - submitted) * 1000.0
+                self.total_wait_ms += wait_ms
+                self.max_observed_wait_ms = max(self.max_observed_wait_ms, wait_ms)
+
+            for bucket in BATCH_SIZE_BUCKETS:
+                if batch_size <= bucket:
+                    self.batch_size_histogram[str(bucket)] += 1
+                    break
+            else:
+                self.batch_size_histogram['+Inf'] += 1
+
+    def queue_depth(self) -> int:
+        depth = self._queue.qsize() if self._queue is not None else 0
+        return depth + (1 if self._carry is not None else 0)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait_ms,
+                "queue_depth": self.queue_depth(),
+                "batches_run": self.batches_run,
+                "requests_processed": self.requests_processed,
+                "images_processed": self.images_processed,
+                "avg_batch_size": round(self.images_processed / self.batches_run, 2) if self.batches_run else 0,
+                "avg_wait_ms": round(self.total_wait_ms / self.requests_processed, 3) if self.requests_processed else 0,
+                "max_wait_ms_observed": round(self.max_observed_wait_ms, 3),
+                "avg_forward_ms": round(self.total_forward_ms / self.batches_run, 3) if self.batches_run else 0,
+                "batch_size_histogram": dict(self.batch_size_histogram)
+            }
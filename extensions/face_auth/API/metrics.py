@@ -0,0 +1,244 @@
+import os
+import json
+import glob
+import time
+import threading
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional, Tuple
+from tracing import RequestTrace, record_span
+
+# Seconds; spans cache hits (sub-millisecond) to cold storage downloads and CPU forwards
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SNAPSHOT_INTERVAL_S = 1.0
+ERROR_TYPES = {400: "bad_request", 404: "not_found", 413: "payload_too_large", 500: "internal", 503: "unavailable"}
+
+_request_context = threading.local()
+
+def set_endpoint(endpoint: Optional[str]):
+    """Label subsequent measurements on this thread with the endpoint being served"""
+    _request_context.endpoint = endpoint
+
+def current_endpoint() -> str:
+    return getattr(_request_context, 'endpoint', None) or 'none'
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = '') -> str:
+    pairs = [f'{name}="{str(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+class Counter:
+    """Monotonic counter with a fixed set of label names"""
+
+    kind = 'counter'
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...]):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            return {json.dumps(key): value for key, value in self._values.items()}
+
+    @staticmethod
+    def merge(into: Dict[str, Any], other: Dict[str, Any]):
+        for key, value in other.items():
+            into[key] = into.get(key, 0.0) + value
+
+    def render(self, values: Dict[str, Any]) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, tuple(json.loads(key)))} {_format_value(value)}"
+                for key, value in sorted(values.items())]
+
+class Histogram:
+    """Cumulative-bucket histogram with a fixed set of label names"""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...], buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # Per label set: [count per bucket..., count above the last bucket, sum]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            entry[index] += 1
+            entry[-1] += value
+
+    def snapshot(self) -> Dict[str, List[float]]:
+        with self._lock:
+            return {json.dumps(key): list(entry) for key, entry in self._values.items()}
+
+    @staticmethod
+    def merge(into: Dict[str, Any], other: Dict[str, Any]):
+        for key, entry in other.items():
+            if key in into:
+                into[key] = [a + b for a, b in zip(into[key], entry)]
+            else:
+                into[key] = list(entry)
+
+    def render(self, values: Dict[str, Any]) -> List[str]:
+        lines = []
+        for key, entry in sorted(values.items()):
+            label_values = tuple(json.loads(key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), entry[:-1]):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float('inf') else f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, label_values, le)} {int(cumulative)}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, label_values)} {_format_value(entry[-1])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, label_values)} {int(cumulative)}")
+        return lines
+
+class MetricsRegistry:
+    """
+    Process-local metrics rendered in the Prometheus text format.
+    With a shared directory configured (one per gunicorn master), every worker
+    writes its snapshot there at most once per SNAPSHOT_INTERVAL_S and on each
+    scrape, and /metrics sums the snapshots of all workers, so a scrape that
+    lands on any worker sees the whole server. Snapshot files are named by pid
+    and process start time: a replacement worker that reuses a dead worker's
+    pid gets its own file, and the dead worker's totals keep counting, so
+    counters never go backwards while the server runs.
+    """
+
+    def __init__(self, shared_dir: Optional[str] = None):
+        self.metrics: Dict[str, Any] = {}
+        self.shared_dir = shared_dir
+        self._last_snapshot = 0.0
+        self._snapshot_lock = threading.Lock()
+        self._snapshot_pid = None
+        self._snapshot_name = None
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self.register(Counter(name, help_text, labelnames))
+
+    def histogram(self, name: str, help_text: str, labelnames: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help_text, labelnames, buckets))
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        return {name: metric.snapshot() for name, metric in self.metrics.items()}
+
+    def _snapshot_path(self) -> str:
+        pid = os.getpid()
+        if pid != self._snapshot_pid:
+            # Picked on first write in each process, so forked workers do not inherit the master's name
+            self._snapshot_pid = pid
+            self._snapshot_name = f"metrics-{pid}-{time.time_ns()}.json"
+        return os.path.join(self.shared_dir, self._snapshot_name)
+
+    def write_snapshot(self, force: bool = False):
+        """Publish this process's values to the shared directory (throttled unless forced)"""
+        if not self.shared_dir:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_snapshot < SNAPSHOT_INTERVAL_S:
+            return
+        if not self._snapshot_lock.acquire(blocking=force):
+            return
+        try:
+            self._last_snapshot = now
+            os.makedirs(self.shared_dir, exist_ok=True)
+            path = self._snapshot_path()
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(self.snapshot(), f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"⚠️ Could not write metrics snapshot: {e}")
+        finally:
+            self._snapshot_lock.release()
+
+    def clear_shared_dir(self):
+        """Drop snapshots left by a previous server; call once in the master before forking"""
+        if self.shared_dir:
+            for path in glob.glob(os.path.join(self.shared_dir, "metrics-*.json")):
+                os.remove(path)
+
+    def collect(self) -> Dict[str, Dict[str, Any]]:
+        """Values summed over every process that published a snapshot, or this process alone"""
+        if not self.shared_dir:
+            return self.snapshot()
+
+        self.write_snapshot(force=True)
+        merged = {name: {} for name in self.metrics}
+        for path in glob.glob(os.path.join(self.shared_dir, "metrics-*.json")):
+            try:
+                with open(path, 'r') as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for name, values in snapshot.items():
+                if name in self.metrics:
+                    self.metrics[name].merge(merged[name], values)
+        return merged
+
+    def render(self) -> str:
+        values = self.collect()
+        lines = []
+        for name, metric in self.metrics.items():
+            lines.append(f"# HELP {name} {metric.help}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            lines.extend(metric.render(values.get(name, {})))
+        return '\n'.join(lines) + '\n'
+
+REGISTRY = MetricsRegistry(os.environ.get('FACE_AUTH_METRICS_DIR'))
+
+REQUESTS = REGISTRY.counter('face_auth_requests_total', 'HTTP requests served', ('endpoint', 'status'))
+ERRORS = REGISTRY.counter('face_auth_errors_total', 'Failed requests and per-item failures by type', ('endpoint', 'type'))
+CACHE_LOOKUPS = REGISTRY.counter('face_auth_cache_lookups_total', 'Embedding cache and gallery lookups', ('endpoint', 'cache', 'result'))
+REQUEST_SECONDS = REGISTRY.histogram('face_auth_request_duration_seconds', 'End-to-end request latency', ('endpoint',))
+STAGE_SECONDS = REGISTRY.histogram('face_auth_stage_duration_seconds', 'Latency of each request processing stage', ('endpoint', 'stage'))
+
+@contextmanager
+def stage_timer(stage: str, endpoint: Optional[str] = None, trace: Optional[RequestTrace] = None, **span_args):
+    """Time the enclosed block into the stage histogram, and into the request trace when one is active"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        ended = time.perf_counter()
+        STAGE_SECONDS.observe(ended - started, endpoint=endpoint or current_endpoint(), stage=stage)
+        record_span(stage, started, ended, trace, **span_args)
+
+def record_request(endpoint: str, status: int, seconds: float):
+    REQUESTS.inc(endpoint=endpoint, status=status)
+    REQUEST_SECONDS.observe(seconds, endpoint=endpoint)
+    if status >= 400:
+        ERRORS.inc(endpoint=endpoint, type=ERROR_TYPES.get(status, f"http_{status}"))
+    REGISTRY.write_snapshot()
+
+def record_error(error_type: str, count: int = 1, endpoint: Optional[str] = None):
+    if count:
+        ERRORS.inc(count, endpoint=endpoint or current_endpoint(), type=error_type)
+
+def record_cache_lookups(cache: str, hits: int, misses: int, endpoint: Optional[str] = None):
+    endpoint = endpoint or current_endpoint()
+    if hits:
+        CACHE_LOOKUPS.inc(hits, endpoint=endpoint, cache=cache, result='hit')
+    if misses:
+        CACHE_LOOKUPS.inc(misses, endpoint=endpoint, cache=cache, result='miss')
@@ -0,0 +1,106 @@
+"""
+Quantize the face verification model to INT8 for CPU inference.
+
+Usage:
+    python quantize_model.py --mode dynamic
+    python quantize_model.py --mode static --calibration_dir /data/calibration_faces
+
+dynamic: Linear layers (backbone last_linear + classifier) use dynamic INT8 quantization.
+static:  post-training static quantization of the whole conv stack (FX graph mode),
+         calibrated on a folder of face images.
+
+The result is saved as a TorchScript artifact with a JSON sidecar; load it with
+FACE_AUTH_BACKEND=torchscript FACE_AUTH_MODEL_ARTIFACT=<path>. Run
+evaluate_quantization.py against it before shipping.
+"""
+import os
+import sys
+import argparse
+import torch
+import torch.nn as nn
+from pathlib import Path
+
+from face_auth_api import load_vggface2_model, preprocess_image_from_data, MODEL_PATH
+from export_model import EmbeddingExportWrapper, write_metadata
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.webp'}
+
+def load_calibration_batches(calibration_dir, max_images=256, batch_size=32):
+    """Yield preprocessed (N, 3, 160, 160) batches from a folder tree of face images"""
+    image_paths = sorted(p for p in Path(calibration_dir).rglob('*') if p.suffix.lower() in IMAGE_EXTENSIONS)[:max_images]
+    if not image_paths:
+        raise ValueError(f"No calibration images found in {calibration_dir}")
+
+    print(f"Calibrating on {len(image_paths)} images from {calibration_dir}")
+    batch = []
+    for image_path in image_paths:
+        try:
+            batch.append(preprocess_image_from_data(image_path.read_bytes()))
+        except ValueError as e:
+            print(f"⚠️ Skipping {image_path}: {e}")
+            continue
+        if len(batch) == batch_size:
+            yield torch.cat(batch)
+            batch = []
+    if batch:
+        yield torch.cat(batch)
+
+def quantize_dynamic(wrapper):
+    return torch.ao.quantization.quantize_dynamic(wrapper, {nn.Linear}, dtype=torch.qint8)
+
+def quantize_static(wrapper, calibration_dir, max_images, engine):
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+
+    torch.backends.quantized.engine = engine
+    example = torch.randn(1, 3, 160, 160)
+    prepared = prepare_fx(wrapper, get_default_qconfig_mapping(engine), (example,))
+
+    with torch.no_grad():
+        for batch in load_calibration_batches(calibration_dir, max_images):
+            prepared(batch)
+
+    return convert_fx(prepared)
+
+def main():
+    parser = argparse.ArgumentParser(description="Quantize the face verification model to INT8")
+    parser.add_argument("--checkpoint", default=MODEL_PATH, help=f"Path to the fp32 .pth checkpoint (default: {MODEL_PATH})")
+    parser.add_argument("--mode", choices=['dynamic', 'static'], default='dynamic', help="Quantization mode (default: dynamic)")
+    parser.add_argument("--calibration_dir", help="Folder of face images used to calibrate static quantization")
+    parser.add_argument("--calibration_images", type=int, default=256, help="Maximum calibration images (default: 256)")
+    parser.add_argument("--engine", choices=['x86', 'fbgemm', 'qnnpack'], default='x86', help="Quantized kernel backend (default: x86)")
+    parser.add_argument("--output", help="Output path (default: <checkpoint>.int8-<mode>.torchscript.pt)")
+    args = parser.parse_args()
+
+    if args.mode == 'static' and not args.calibration_dir:
+        print("Error: --calibration_dir is required for static quantization")
+        sys.exit(1)
+
+    model, class_names = load_vggface2_model(args.checkpoint)
+    if model is None:
+        sys.exit(1)
+
+    model = model.cpu().eval()
+    wrapper = EmbeddingExportWrapper(model).eval()
+
+    if args.mode == 'dynamic':
+        quantized = quantize_dynamic(wrapper)
+    else:
+        quantized = quantize_static(wrapper, args.calibration_dir, args.calibration_images, args.engine)
+
+    output_path = args.output or os.path.splitext(args.checkpoint)[0] + f".int8-{args.mode}.torchscript.pt"
+    with torch.no_grad():
+        scripted = torch.jit.freeze(torch.jit.trace(quantized.eval(), torch.randn(4, 3, 160, 160)))
+    scripted.save(output_path)
+
+    write_metadata(output_path, model, class_names, 'torchscript',
+                   extra={"quantization": args.mode, "quantized_engine": args.engine})
+
+    fp32_size = os.path.getsize(args.checkpoint) / 1024 / 1024
+    int8_size = os.path.getsize(output_path) / 1024 / 1024
+    print(f"✅ Quantized ({args.mode}) model saved to: {output_path}")
+    print(f"   Size: {fp32_size:.1f} MB -> {int8_size:.1f} MB")
+    print(f"   Evaluate with: python evaluate_quantization.py --quantized {output_path} --pairs <pairs.csv>")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+import numpy as np
+from io import BytesIO
+from PIL import Image
+from typing import List, Dict, Any, Optional
+from face_detection import get_face_aligner, MIN_FACE_PROBABILITY
+
+# Metrics are computed on a thumbnail so sharpness is comparable across upload resolutions
+METRIC_SIZE = 256
+MIN_SHARPNESS = 20.0
+SHARPNESS_REFERENCE = 500.0
+MIN_BRIGHTNESS = 40.0
+MAX_BRIGHTNESS = 215.0
+MAX_CLIPPED_FRACTION = 0.25
+MAX_CONSISTENCY_GAP = 0.25
+
+def load_metric_image(image_bytes: bytes) -> Image.Image:
+    image = Image.open(BytesIO(image_bytes))
+    if image.format == 'JPEG':
+        image.draft('RGB', (METRIC_SIZE, METRIC_SIZE))
+    image = image.convert('RGB')
+    image.thumbnail((METRIC_SIZE, METRIC_SIZE), Image.BILINEAR)
+    return image
+
+def image_quality_metrics(image: Image.Image) -> Dict[str, float]:
+    """Sharpness (variance of the Laplacian), mean brightness and fraction of clipped pixels"""
+    gray = np.asarray(image.convert('L'), dtype=np.float32)
+    laplacian = (gray[1:-1, :-2] + gray[1:-1, 2:] + gray[:-2, 1:-1] + gray[2:, 1:-1]
+                 - 4.0 * gray[1:-1, 1:-1])
+    return {
+        "sharpness": float(laplacian.var()) if laplacian.size else 0.0,
+        "brightness": float(gray.mean()),
+        "clipped_fraction": float(((gray <= 5) | (gray >= 250)).mean())
+    }
+
+def detect_face_probabilities(images: List[Image.Image]) -> Optional[List[float]]:
+    """
+    Highest MTCNN face probability per image (0.0 when no face is found),
+    or None when the detector is unavailable
+    """
+    aligner = get_face_aligner()
+    if aligner is None:
+        print("⚠️ Face detector unavailable, skipping face check")
+        return None
+    return aligner.face_probabilities(images)
+
+def embedding_consistency(embeddings: np.ndarray) -> np.ndarray:
+    """Mean cosine similarity of every embedding to all the others"""
+    if len(embeddings) < 2:
+        return np.ones(len(embeddings), dtype=np.float32)
+    normalized = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True).clip(min=1e-12)
+    similarities = normalized @ normalized.T
+    return (similarities.sum(axis=1) - 1.0) / (len(embeddings) - 1)
+
+def score_references(names: List[str], images: Dict[str, bytes], embeddings: Dict[str, np.ndarray],
+                     check_faces: bool = True, face_probabilities: Optional[Dict[str, float]] = None) -> Dict[str, Dict[str, Any]]:
+    """
+    Score candidate reference images. Each entry holds the quality metrics, a
+    rejection reason (or None) and a combined score; higher is better.
+    Consistency is measured only among candidates that pass the per-image checks,
+    so a blurry or faceless upload cannot drag the others down. Face
+    probabilities already known (e.g. from face alignment) are reused; only the
+    remaining candidates go through the detector.
+    """
+    scores = {}
+    metric_images = {}
+
+    for name in names:
+        if name not in images:
+            scores[name] = {"rejected": "could not be downloaded", "score": 0.0}
+            continue
+        if name not in embeddings:
+            scores[name] = {"rejected": "could not be embedded", "score": 0.0}
+            continue
+        try:
+            metric_images[name] = load_metric_image(images[name])
+        except Exception as e:
+            scores[name] = {"rejected": f"could not be decoded: {e}", "score": 0.0}
+
+    decodable = [name for name in names if name in metric_images]
+    face_probabilities = dict(face_probabilities or {}) if check_faces else {}
+    undetected = [name for name in decodable if name not in face_probabilities]
+    if check_faces and undetected:
+        detected = detect_face_probabilities([metric_images[name] for name in undetected])
+        if detected is not None:
+            face_probabilities.update(zip(undetected, detected))
+
+    for name in decodable:
+        entry = image_quality_metrics(metric_images[name])
+        entry["face_probability"] = face_probabilities.get(name)
+        entry["rejected"] = None
+
+        if entry["face_probability"] is not None and entry["face_probability"] < MIN_FACE_PROBABILITY:
+            entry["rejected"] = "no face detected"
+        elif entry["sharpness"] < MIN_SHARPNESS:
+            entry["rejected"] = "too blurry"
+        elif not (MIN_BRIGHTNESS <= entry["brightness"] <= MAX_BRIGHTNESS) or entry["clipped_fraction"] > MAX_CLIPPED_FRACTION:
+            entry["rejected"] = "poorly exposed"
+        scores[name] = entry
+
+    passing = [name for name in decodable if scores[name]["rejected"] is None]
+    if passing:
+        consistency = embedding_consistency(np.stack([embeddings[name] for name in passing]))
+        median = float(np.median(consistency))
+        for name, value in zip(passing, consistency):
+            entry = scores[name]
+            entry["consistency"] = float(value)
+            if len(passing) > 2 and value < median - MAX_CONSISTENCY_GAP:
+                # Far less similar to the rest than typical: likely another person or a bad crop
+                entry["rejected"] = "inconsistent with other references"
+
+            sharpness_term = min(1.0, np.log1p(entry["sharpness"]) / np.log1p(SHARPNESS_REFERENCE))
+            face_term = entry["face_probability"] if entry["face_probability"] is not None else 1.0
+            entry["score"] = float(value + 0.1 * sharpness_term + 0.1 * face_term)
+
+    for name in decodable:
+        scores[name].setdefault("score", 0.0)
+    return scores
+
+def select_top_references(scores: Dict[str, Dict[str, Any]], top_k: int) -> List[str]:
+    """Names of the best top_k accepted references, best first"""
+    accepted = [name for name, entry in scores.items() if entry["rejected"] is None]
+    accepted.sort(key=lambda name: (-scores[name]["score"], name))
+    return accepted[:top_k]
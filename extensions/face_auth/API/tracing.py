@@ -0,0 +1,171 @@
+import os
+import glob
+import hmac
+import json
+import time
+import uuid
+import random
+import threading
+from typing import Dict, Any, List, Optional, Callable
+
+TRACE_HEADER = 'X-Face-Auth-Trace'
+TRACE_TOKEN_HEADER = 'X-Face-Auth-Trace-Token'
+TRACE_QUERY_PARAM = 'trace'
+TORCH_PROFILE_ROWS = 20
+
+_request_context = threading.local()
+
+class RequestTrace:
+    """
+    Span timings collected for one request. Spans come from stage timers on
+    any thread; forward passes run under torch.profiler add an op summary.
+    Exported either as a JSON summary or in the Chrome trace event format
+    (load the file in chrome://tracing or Perfetto).
+    """
+
+    def __init__(self, endpoint: str, explicit: bool):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.endpoint = endpoint
+        # Explicitly requested traces are returned to the caller; sampled ones are only written to disk
+        self.explicit = explicit
+        self.started = time.perf_counter()
+        self.wall_started = time.time()
+        self.spans: List[Dict[str, Any]] = []
+        self.torch_ops: Dict[str, Dict[str, float]] = {}
+        self.profiled_forwards = 0
+        self._lock = threading.Lock()
+
+    def add_span(self, name: str, started: float, ended: float, args: Optional[Dict[str, Any]] = None):
+        span = {
+            "name": name,
+            "start_ms": round((started - self.started) * 1000.0, 3),
+            "duration_ms": round((ended - started) * 1000.0, 3),
+            "thread": threading.current_thread().name
+        }
+        if args:
+            span["args"] = args
+        with self._lock:
+            self.spans.append(span)
+
+    def add_torch_profile(self, key_averages):
+        with self._lock:
+            self.profiled_forwards += 1
+            for event in key_averages:
+                op = self.torch_ops.setdefault(event.key, {"calls": 0, "self_cpu_ms": 0.0, "cpu_total_ms": 0.0})
+                op["calls"] += event.count
+                op["self_cpu_ms"] += event.self_cpu_time_total / 1000.0
+                op["cpu_total_ms"] += event.cpu_time_total / 1000.0
+
+    def torch_summary(self, rows: int = TORCH_PROFILE_ROWS) -> Optional[List[Dict[str, Any]]]:
+        """Ops with the most self CPU time across every profiled forward pass"""
+        if not self.profiled_forwards:
+            return None
+        ops = sorted(self.torch_ops.items(), key=lambda item: -item[1]["self_cpu_ms"])[:rows]
+        return [{
+            "op": name,
+            "calls": int(op["calls"]),
+            "self_cpu_ms": round(op["self_cpu_ms"], 3),
+            "cpu_total_ms": round(op["cpu_total_ms"], 3)
+        } for name, op in ops]
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: span["start_ms"])
+        stages = {}
+        for span in spans:
+            stage = stages.setdefault(span["name"], {"count": 0, "total_ms": 0.0})
+            stage["count"] += 1
+            stage["total_ms"] = round(stage["total_ms"] + span["duration_ms"], 3)
+        return {
+            "trace_id": self.trace_id,
+            "endpoint": self.endpoint,
+            "stages": stages,
+            "spans": spans,
+            "torch_profile": self.torch_summary()
+        }
+
+    def chrome_trace(self) -> Dict[str, Any]:
+        pid = os.getpid()
+        threads = {}
+        events = []
+        with self._lock:
+            spans = list(self.spans)
+        for span in spans:
+            tid = threads.setdefault(span["thread"], len(threads))
+            events.append({
+                "name": span["name"],
+                "ph": "X",
+                "ts": span["start_ms"] * 1000.0,
+                "dur": span["duration_ms"] * 1000.0,
+                "pid": pid,
+                "tid": tid,
+                "args": span.get("args", {})
+            })
+        for name, tid in threads.items():
+            events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}})
+        return {
+            "traceEvents": events,
+            "displayTimeUnit": "ms",
+            "otherData": {
+                "trace_id": self.trace_id,
+                "endpoint": self.endpoint,
+                "started_at": self.wall_started,
+                "torch_profile": self.torch_summary()
+            }
+        }
+
+    def write(self, trace_dir: str, max_files: int = 200) -> Optional[str]:
+        """Write the Chrome trace to trace_dir, keeping only the newest max_files traces"""
+        try:
+            os.makedirs(trace_dir, exist_ok=True)
+            stamp = time.strftime('%Y%m%dT%H%M%S', time.gmtime(self.wall_started))
+            path = os.path.join(trace_dir, f"trace-{stamp}-{self.trace_id}.json")
+            with open(path, 'w') as f:
+                json.dump(self.chrome_trace(), f)
+
+            existing = sorted(glob.glob(os.path.join(trace_dir, "trace-*.json")), key=os.path.getmtime)
+            for old_path in existing[:max(0, len(existing) - max_files)]:
+                os.remove(old_path)
+            return path
+        except OSError as e:
+            print(f"⚠️ Could not write trace {self.trace_id}: {e}")
+            return None
+
+def trace_requested(headers, args, token: Optional[str] = None) -> bool:
+    """Whether the caller asked for a trace, and presented the shared secret if one is configured"""
+    value = headers.get(TRACE_HEADER) or args.get(TRACE_QUERY_PARAM) or ''
+    if value.lower() not in ('1', 'true', 'yes'):
+        return False
+    if token:
+        return hmac.compare_digest(headers.get(TRACE_TOKEN_HEADER, '').encode(), token.encode())
+    return True
+
+def begin_trace(endpoint: str, explicit: bool, sample_rate: float) -> Optional[RequestTrace]:
+    """Start tracing the current thread's request if it asked for it or is sampled"""
+    trace = None
+    if explicit or (sample_rate > 0 and random.random() < sample_rate):
+        trace = RequestTrace(endpoint, explicit)
+    _request_context.trace = trace
+    return trace
+
+def end_trace() -> Optional[RequestTrace]:
+    trace = current_trace()
+    _request_context.trace = None
+    return trace
+
+def current_trace() -> Optional[RequestTrace]:
+    return getattr(_request_context, 'trace', None)
+
+def record_span(name: str, started: float, ended: float, trace: Optional[RequestTrace] = None, **args):
+    trace = trace or current_trace()
+    if trace is not None:
+        trace.add_span(name, started, ended, args)
+
+def profile_call(trace: RequestTrace, fn: Callable, *args):
+    """Run fn under the torch CPU profiler and add its op summary to the trace"""
+    from torch.profiler import profile, ProfilerActivity
+
+    with profile(activities=[ProfilerActivity.CPU]) as profiler:
+        result = fn(*args)
+    trace.add_torch_profile(profiler.key_averages())
+    return result
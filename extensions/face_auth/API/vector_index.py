@@ -0,0 +1,550 @@
+import os
+import json
+import math
+import fcntl
+import threading
+import numpy as np
+from contextlib import contextmanager
+from typing import List, Dict, Any, Optional
+
+EMBEDDING_DIM = 512
+BLOCK_ROWS = 65536
+IVF_MIN_ROWS = 20000
+DEFAULT_NPROBE = 16
+MIN_CAPACITY = 1024
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLE_PER_LIST = 64
+INDEX_FILE = 'index.json'
+LOCK_FILE = 'index.lock'
+# Log entries replayed on top of index.json before a new snapshot is written
+LOG_COMPACT_MIN_ENTRIES = 1000
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, EMBEDDING_DIM)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True).clip(min=1e-12)
+
+def nearest_centroids(vectors: np.ndarray, centroids: np.ndarray, block_rows: int = BLOCK_ROWS) -> np.ndarray:
+    assignments = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), block_rows):
+        assignments[start:start + block_rows] = np.argmax(vectors[start:start + block_rows] @ centroids.T, axis=1)
+    return assignments
+
+def spherical_kmeans(data: np.ndarray, num_lists: int, iterations: int = KMEANS_ITERATIONS, seed: int = 0) -> np.ndarray:
+    """Unit-norm centroids maximizing cosine similarity to their members"""
+    rng = np.random.default_rng(seed)
+    centroids = data[rng.choice(len(data), num_lists, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = nearest_centroids(data, centroids)
+        order = np.argsort(assignments, kind='stable')
+        lists, starts = np.unique(assignments[order], return_index=True)
+        sums = np.zeros_like(centroids)
+        sums[lists] = np.add.reduceat(data[order], starts, axis=0)
+        # Reseed lists that lost every member
+        empty = np.setdiff1d(np.arange(num_lists), lists)
+        if len(empty):
+            sums[empty] = data[rng.choice(len(data), len(empty), replace=False)]
+        centroids = normalize_rows(sums)
+    return centroids
+
+class VectorIndex:
+    """
+    1:N search index over every enrolled user's gallery embeddings.
+    Rows are L2-normalized float32 vectors in a memory-mapped file under
+    root_dir; index.json maps each user to a contiguous row range and its
+    reference filenames. Rows are append-only: replacing or removing a user
+    leaves tombstones that are compacted into a new file generation, so worker
+    processes still mapping the previous generation never see a row change owner.
+    Single-user changes are appended to a log next to index.json, which other
+    processes replay incrementally; a full snapshot is only written on a new
+    generation, after (re)training and once the log outgrows the user table.
+    Small indexes are searched exactly with a blocked matmul; from ivf_min_rows
+    live rows on, an IVF layer (spherical k-means lists, nprobe scanned per
+    query) narrows the scan.
+    """
+
+    def __init__(self, root_dir: Optional[str] = None, namespace: str = '', ivf_min_rows: int = IVF_MIN_ROWS,
+                 nprobe: int = DEFAULT_NPROBE, block_rows: int = BLOCK_ROWS):
+        self.root_dir = root_dir
+        self.namespace = namespace
+        self.ivf_min_rows = ivf_min_rows
+        self.nprobe = max(1, nprobe)
+        self.block_rows = max(1, block_rows)
+        # Re-entrant so bulk() can wrap add_user/remove_user
+        self._lock = threading.RLock()
+        self._write_depth = 0
+        self._lock_file = None
+        self._dirty = False
+        self._snapshot_needed = False
+        self._pending_log: List[Dict[str, Any]] = []
+        self._stamp = None
+        self._snapshot = 0
+        self._log_file = None
+        self._log_offset = 0
+        self._log_entries = 0
+        self._generation = 0
+        self._centroids_file = None
+        self._ivf_lists = None
+        self.searches = 0
+        self.rows_scanned = 0
+
+        if self.root_dir:
+            try:
+                os.makedirs(self.root_dir, exist_ok=True)
+            except OSError as e:
+                print(f"⚠️ Vector index directory {self.root_dir} unavailable, using memory only: {e}")
+                self.root_dir = None
+
+        self._loaded = False
+        with self._write():
+            if not self._loaded:
+                self._reset()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.root_dir, name)
+
+    def _data_files(self, generation: int) -> Dict[str, str]:
+        return {"vectors": f"vectors-{generation}.f32", "assignments": f"assignments-{generation}.i32"}
+
+    def _create_arrays(self, capacity: int, generation: int):
+        """Fresh vector and assignment arrays; memory-mapped files of a new generation when persistent"""
+        if not self.root_dir:
+            return (np.zeros((capacity, EMBEDDING_DIM), dtype=np.float32),
+                    np.full(capacity, -1, dtype=np.int32))
+
+        files = self._data_files(generation)
+        vectors = np.memmap(self._path(files["vectors"]), dtype=np.float32, mode='w+', shape=(capacity, EMBEDDING_DIM))
+        assignments = np.memmap(self._path(files["assignments"]), dtype=np.int32, mode='w+', shape=(capacity,))
+        assignments[:] = -1
+        return vectors, assignments
+
+    def _set_users(self, users: Dict[str, Dict[str, Any]]):
+        """Rebuild the row -> user lookup from the user table"""
+        self._users = users
+        self._row_users = np.full(self._capacity, -1, dtype=np.int32)
+        # Code -> (user_id, first row, files); a removed user's code maps to None
+        self._codes: List[Optional[tuple]] = []
+        self._tombstones = self._num_rows
+        for user_id, user in users.items():
+            user['code'] = len(self._codes)
+            self._codes.append((user_id, user['start'], user['files']))
+            self._row_users[user['start']:user['start'] + len(user['files'])] = user['code']
+            self._tombstones -= len(user['files'])
+
+    def _reset(self):
+        self._generation += 1
+        self._capacity = MIN_CAPACITY
+        self._vectors, self._assignments = self._create_arrays(self._capacity, self._generation)
+        self._num_rows = 0
+        self._centroids = None
+        self._centroids_file = None
+        self._trained_rows = 0
+        self._set_users({})
+        self._dirty = True
+        self._snapshot_needed = True
+
+    def _read_stamp(self):
+        try:
+            stat = os.stat(self._path(INDEX_FILE))
+            return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            return None
+
+    def _load(self) -> bool:
+        stamp = self._read_stamp()
+        if stamp is None:
+            return False
+        try:
+            with open(self._path(INDEX_FILE), 'r') as f:
+                meta = json.load(f)
+            if meta.get('dim') != EMBEDDING_DIM or meta.get('namespace', '') != self.namespace:
+                return False
+
+            capacity = int(meta['capacity'])
+            files = self._data_files(meta['generation'])
+            vectors = np.memmap(self._path(files["vectors"]), dtype=np.float32, mode='r+', shape=(capacity, EMBEDDING_DIM))
+            assignments = np.memmap(self._path(files["assignments"]), dtype=np.int32, mode='r+', shape=(capacity,))
+            centroids = np.load(self._path(meta['centroids'])) if meta.get('centroids') else None
+        except Exception as e:
+            print(f"⚠️ Vector index unreadable: {e}")
+            return False
+
+        self._generation = int(meta['generation'])
+        self._capacity = capacity
+        self._vectors, self._assignments = vectors, assignments
+        self._num_rows = int(meta['num_rows'])
+        self._centroids = centroids
+        self._centroids_file = meta.get('centroids')
+        self._trained_rows = int(meta.get('trained_rows', 0))
+        self._set_users(meta['users'])
+        self._snapshot = int(meta.get('snapshot', 0))
+        self._log_file = meta.get('log')
+        self._log_offset = 0
+        self._log_entries = 0
+        self._stamp = stamp
+        self._loaded = True
+        self._replay_log()
+        return True
+
+    def _replay_log(self) -> bool:
+        """Apply log entries appended since the last replay; False if the log is gone (a snapshot replaced it)"""
+        if not self._log_file:
+            return True
+        try:
+            if os.path.getsize(self._path(self._log_file)) == self._log_offset:
+                return True
+            with open(self._path(self._log_file), 'rb') as f:
+                f.seek(self._log_offset)
+                data = f.read()
+        except FileNotFoundError:
+            return False
+        # A writer may be mid-append; only complete lines are applied
+        complete = data[:data.rfind(b'\n') + 1]
+        for line in complete.splitlines():
+            entry = json.loads(line)
+            if entry['op'] == 'add':
+                self._apply_add(entry['user_id'], entry['start'], entry['files'], entry['updated_at'])
+            else:
+                self._drop(entry['user_id'])
+            self._log_entries += 1
+        self._log_offset += len(complete)
+        return True
+
+    def _refresh(self):
+        """Pick up changes written by another worker process"""
+        if not self.root_dir:
+            return
+        if self._read_stamp() != self._stamp or not self._replay_log():
+            self._load()
+
+    def _save(self):
+        self._dirty = False
+        pending, self._pending_log = self._pending_log, []
+        if not self.root_dir:
+            return
+
+        self._vectors.flush()
+        self._assignments.flush()
+        if (self._snapshot_needed or self._log_file is None or
+                self._log_entries + len(pending) > max(LOG_COMPACT_MIN_ENTRIES, len(self._users))):
+            self._save_snapshot()
+        elif pending:
+            self._append_log(pending)
+
+    def _append_log(self, entries: List[Dict[str, Any]]):
+        data = ''.join(json.dumps(entry) + '\n' for entry in entries).encode()
+        with open(self._path(self._log_file), 'ab') as f:
+            # Drop a partial line left by a writer that died mid-append
+            f.truncate(self._log_offset)
+            f.write(data)
+        self._log_offset += len(data)
+        self._log_entries += len(entries)
+
+    def _save_snapshot(self):
+        """Write the full user table to index.json with a fresh, empty log"""
+        self._snapshot += 1
+        self._log_file = f"index-{self._snapshot}.log"
+        open(self._path(self._log_file), 'wb').close()
+        meta = {
+            "dim": EMBEDDING_DIM,
+            "namespace": self.namespace,
+            "generation": self._generation,
+            "capacity": self._capacity,
+            "num_rows": self._num_rows,
+            "centroids": self._centroids_file,
+            "trained_rows": self._trained_rows,
+            "snapshot": self._snapshot,
+            "log": self._log_file,
+            "users": {
+                user_id: {"start": user['start'], "files": user['files'], "updated_at": user['updated_at']}
+                for user_id, user in self._users.items()
+            }
+        }
+        tmp_path = self._path(INDEX_FILE + '.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, self._path(INDEX_FILE))
+        self._stamp = self._read_stamp()
+        self._log_offset = 0
+        self._log_entries = 0
+        self._snapshot_needed = False
+
+        # Files of older generations and logs of older snapshots are no longer
+        # referenced; processes that still map them keep their pages until they reload
+        current = set(self._data_files(self._generation).values()) | {self._centroids_file, self._log_file}
+        for name in os.listdir(self.root_dir):
+            if name not in current and name.split('-')[0] in ('vectors', 'assignments', 'centroids', 'index'):
+                try:
+                    os.remove(self._path(name))
+                except OSError:
+                    pass
+
+    @contextmanager
+    def _write(self):
+        """Serialize writers across threads and worker processes; save once at the outermost exit"""
+        with self._lock:
+            if self._write_depth == 0 and self.root_dir:
+                self._lock_file = open(self._path(LOCK_FILE), 'a')
+                fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+                self._refresh()
+            self._write_depth += 1
+            try:
+                yield
+            finally:
+                self._write_depth -= 1
+                if self._write_depth == 0:
+                    try:
+                        if self._dirty:
+                            self._save()
+                    finally:
+                        if self._lock_file is not None:
+                            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+                            self._lock_file.close()
+                            self._lock_file = None
+
+    def bulk(self):
+        """Group many updates under one lock and a single index write, e.g. for offline enrollment"""
+        return self._write()
+
+    def _rewrite(self, capacity: int):
+        """Copy live rows into a new generation of the given capacity, dropping tombstones"""
+        self._generation += 1
+        vectors, assignments = self._create_arrays(capacity, self._generation)
+        row = 0
+        users = {}
+        for user_id, user in sorted(self._users.items(), key=lambda item: item[1]['start']):
+            count = len(user['files'])
+            vectors[row:row + count] = self._vectors[user['start']:user['start'] + count]
+            assignments[row:row + count] = self._assignments[user['start']:user['start'] + count]
+            users[user_id] = dict(user, start=row)
+            row += count
+
+        self._vectors, self._assignments = vectors, assignments
+        self._capacity = capacity
+        self._num_rows = row
+        self._set_users(users)
+        self._dirty = True
+        self._snapshot_needed = True
+
+    def _ensure_capacity(self, rows: int):
+        if rows <= self._capacity:
+            return
+        # Tombstones are dropped by the rewrite; size the new file to be at most half full
+        needed = rows - self._tombstones
+        capacity = self._capacity
+        while capacity < 2 * needed:
+            capacity *= 2
+        self._rewrite(capacity)
+
+    def _maybe_train(self):
+        live_rows = self._num_rows - self._tombstones
+        if live_rows < self.ivf_min_rows:
+            if self._centroids is not None:
+                self._centroids = None
+                self._centroids_file = None
+                self._trained_rows = 0
+                self._dirty = True
+                self._snapshot_needed = True
+            return
+        if self._centroids is None or live_rows >= 2 * self._trained_rows:
+            self._train()
+
+    def _train(self):
+        live = np.flatnonzero(self._row_users[:self._num_rows] >= 0)
+        num_lists = int(np.clip(round(math.sqrt(len(live))), 16, 4096))
+        rng = np.random.default_rng(0)
+        sample = np.sort(rng.choice(live, min(len(live), num_lists * KMEANS_SAMPLE_PER_LIST), replace=False))
+        centroids = spherical_kmeans(np.asarray(self._vectors[sample]), num_lists).astype(np.float32)
+
+        for start in range(0, self._num_rows, self.block_rows):
+            end = min(start + self.block_rows, self._num_rows)
+            self._assignments[start:end] = nearest_centroids(np.asarray(self._vectors[start:end]), centroids)
+
+        self._centroids = centroids
+        self._trained_rows = len(live)
+        if self.root_dir:
+            self._centroids_file = f"centroids-{self._generation}-{len(live)}.npy"
+            with open(self._path(self._centroids_file), 'wb') as f:
+                np.save(f, centroids)
+        self._dirty = True
+        self._snapshot_needed = True
+        print(f"✅ Trained vector index: {num_lists} lists over {len(live)} rows")
+
+    def _drop(self, user_id: str) -> bool:
+        user = self._users.pop(user_id, None)
+        if user is None:
+            return False
+        self._row_users[user['start']:user['start'] + len(user['files'])] = -1
+        self._codes[user['code']] = None
+        self._tombstones += len(user['files'])
+        self._dirty = True
+        return True
+
+    def _apply_add(self, user_id: str, start: int, files: List[str], updated_at: float):
+        """Point a user at rows start..start+len(files), whose vectors are already written"""
+        self._drop(user_id)
+        end = start + len(files)
+        user = {"start": start, "files": list(files), "updated_at": updated_at, "code": len(self._codes)}
+        self._codes.append((user_id, start, user['files']))
+        self._row_users[start:end] = user['code']
+        self._users[user_id] = user
+        self._num_rows = max(self._num_rows, end)
+        self._dirty = True
+
+    def add_user(self, user_id: str, files: List[str], embeddings: np.ndarray, updated_at: float = 0.0):
+        """Replace a user's rows with the given reference embeddings"""
+        vectors = normalize_rows(embeddings)
+        if len(vectors) != len(files):
+            raise ValueError(f"Got {len(vectors)} embeddings for {len(files)} files")
+
+        with self._write():
+            if not files:
+                self.remove_user(user_id)
+                return
+            self._drop(user_id)
+            self._ensure_capacity(self._num_rows + len(files))
+
+            start = self._num_rows
+            end = start + len(files)
+            # Rows are written before the log entry that makes them visible to other processes
+            self._vectors[start:end] = vectors
+            if self._centroids is not None:
+                self._assignments[start:end] = nearest_centroids(vectors, self._centroids)
+            self._apply_add(user_id, start, files, updated_at)
+            self._pending_log.append({"op": "add", "user_id": user_id, "start": start,
+                                      "files": list(files), "updated_at": updated_at})
+            self._maybe_train()
+
+    def remove_user(self, user_id: str):
+        with self._write():
+            if self._drop(user_id):
+                self._pending_log.append({"op": "remove", "user_id": user_id})
+
+    def user_versions(self) -> Dict[str, float]:
+        """updated_at of every indexed user, to detect entries that are stale against the gallery"""
+        with self._lock:
+            self._refresh()
+            return {user_id: user['updated_at'] for user_id, user in self._users.items()}
+
+    def _scan(self, queries: np.ndarray, vectors, row_users: np.ndarray, rows: Optional[np.ndarray],
+              num_rows: int, keep: int):
+        """Top keep (scores, rows) per query over rows (or every row below num_rows), one block at a time"""
+        best_scores = np.empty((len(queries), 0), dtype=np.float32)
+        best_rows = np.empty((len(queries), 0), dtype=np.int64)
+        total = num_rows if rows is None else len(rows)
+
+        for start in range(0, total, self.block_rows):
+            end = min(start + self.block_rows, total)
+            if rows is None:
+                block_rows = np.arange(start, end)
+                block = vectors[start:end]
+            else:
+                block_rows = rows[start:end]
+                block = vectors[block_rows]
+            scores = queries @ np.asarray(block).T
+            scores[:, row_users[block_rows] < 0] = -np.inf
+
+            best_scores = np.concatenate([best_scores, scores], axis=1)
+            best_rows = np.concatenate([best_rows, np.broadcast_to(block_rows, scores.shape)], axis=1)
+            if best_scores.shape[1] > keep:
+                top = np.argpartition(-best_scores, keep - 1, axis=1)[:, :keep]
+                best_scores = np.take_along_axis(best_scores, top, axis=1)
+                best_rows = np.take_along_axis(best_rows, top, axis=1)
+        return best_scores, best_rows
+
+    def _probe_lists(self):
+        """
+        Rows of every IVF list as (order, offsets, base_rows): list i holds
+        order[offsets[i]:offsets[i + 1]]. Built once per training or generation;
+        rows appended since (base_rows on) are matched against the probes at
+        search time until they outgrow a quarter of the indexed rows.
+        """
+        key = (self._generation, self._centroids_file, id(self._centroids))
+        if self._ivf_lists is not None and self._ivf_lists[0] == key:
+            _, order, offsets, base_rows = self._ivf_lists
+            if self._num_rows - base_rows <= max(self.block_rows, base_rows // 4):
+                return order, offsets, base_rows
+
+        base_rows = self._num_rows
+        assignments = np.asarray(self._assignments[:base_rows])
+        live = np.flatnonzero((self._row_users[:base_rows] >= 0) & (assignments >= 0))
+        order = live[np.argsort(assignments[live], kind='stable')]
+        offsets = np.searchsorted(assignments[order], np.arange(len(self._centroids) + 1))
+        self._ivf_lists = (key, order, offsets, base_rows)
+        return order, offsets, base_rows
+
+    def search(self, queries: np.ndarray, top_k: int = 5) -> List[List[Dict[str, Any]]]:
+        """
+        Best top_k distinct users per query as {user_id, score, file}, where
+        score is the cosine similarity to that user's closest reference
+        """
+        queries = normalize_rows(queries)
+        with self._lock:
+            self._refresh()
+            # Arrays are only replaced, never shrunk in place, so a snapshot stays valid outside the lock
+            vectors, row_users, assignments = self._vectors, self._row_users, self._assignments
+            centroids, codes, num_rows = self._centroids, self._codes, self._num_rows
+            max_files = max((len(user['files']) for user in self._users.values()), default=0)
+            if centroids is not None and max_files:
+                order, offsets, base_rows = self._probe_lists()
+
+        results = [[] for _ in range(len(queries))]
+        if max_files == 0 or top_k < 1:
+            return results
+        # Enough rows to cover top_k users even if the best ones match on every reference
+        keep = top_k * max_files
+
+        scanned = 0
+        if centroids is None:
+            all_scores, all_rows = self._scan(queries, vectors, row_users, None, num_rows, keep)
+            scanned = num_rows * len(queries)
+        else:
+            probes = np.argsort(-(queries @ centroids.T), axis=1)[:, :self.nprobe]
+            tail_assignments = np.asarray(assignments[base_rows:num_rows])
+            all_scores, all_rows = [], []
+            for query, probe in zip(queries, probes):
+                rows = np.concatenate([order[offsets[p]:offsets[p + 1]] for p in probe] +
+                                      [base_rows + np.flatnonzero(np.isin(tail_assignments, probe))])
+                # Sorted rows keep memory-mapped reads sequential; removed users are masked in _scan
+                rows.sort()
+                scores, found = self._scan(query[None, :], vectors, row_users, rows, num_rows, keep)
+                all_scores.append(scores[0])
+                all_rows.append(found[0])
+                scanned += len(rows)
+
+        for result, scores, rows in zip(results, all_scores, all_rows):
+            for i in np.argsort(-scores):
+                code = row_users[rows[i]]
+                if not np.isfinite(scores[i]) or code < 0 or codes[code] is None:
+                    continue
+                user_id, start, files = codes[code]
+                if any(match['user_id'] == user_id for match in result):
+                    continue
+                result.append({"user_id": user_id, "score": float(scores[i]), "file": files[rows[i] - start]})
+                if len(result) >= top_k:
+                    break
+
+        with self._lock:
+            self.searches += len(queries)
+            self.rows_scanned += scanned
+        return results
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._refresh()
+            return self._num_rows - self._tombstones
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._refresh()
+            return {
+                "users": len(self._users),
+                "rows": self._num_rows - self._tombstones,
+                "tombstones": self._tombstones,
+                "capacity": self._capacity,
+                "mode": "ivf" if self._centroids is not None else "exact",
+                "lists": len(self._centroids) if self._centroids is not None else None,
+                "nprobe": self.nprobe if self._centroids is not None else None,
+                "searches": self.searches,
+                "rows_scanned_per_query": round(self.rows_scanned / self.searches, 1) if self.searches else None,
+                "persistent": self.root_dir is not None
+            }
@@ -0,0 +1,10 @@
+"""
+WSGI entry point for production serving.
+
+The model is loaded once at import time; with gunicorn's preload_app the
+master imports this module before forking, so workers share the (memory-mapped)
+weights copy-on-write. Per-worker warm-up happens in gunicorn.conf.py.
+"""
+from face_auth_api import app, initialize_model
+
+initialize_model()
@@ -0,0 +1,87 @@
+import time
+import random
+import argparse
+import functools
+import numpy as np
+
+from transformer import CustomTransforms, CustomCompose, BatchTransforms, BatchCompose
+
+def build_custom_pipeline():
+    return CustomCompose([
+        lambda x: CustomTransforms.random_horizontal_flip(x, p=0.5),
+        lambda x: CustomTransforms.random_rotation(x, degrees=10),
+        lambda x: CustomTransforms.color_jitter(x, brightness=0.2, contrast=0.2, saturation=0.2, hue=0.1),
+        lambda x: CustomTransforms.to_tensor(x),
+        lambda x: CustomTransforms.normalize(x, mean=[0.5, 0.5, 0.5], std=[0.5, 0.5, 0.5])
+    ])
+
+def build_fused_pipeline():
+    return CustomCompose([
+        lambda x: CustomTransforms.random_horizontal_flip(x, p=0.5),
+        lambda x: CustomTransforms.random_rotation(x, degrees=10),
+        lambda x: CustomTransforms.color_jitter(x, brightness=0.2, contrast=0.2, saturation=0.2, hue=0.1),
+        CustomTransforms.to_tensor,
+        functools.partial(CustomTransforms.normalize, mean=[0.5, 0.5, 0.5], std=[0.5, 0.5, 0.5])
+    ])
+
+def build_batch_pipeline(batch_size, size, seed):
+    # Scratch buffers are allocated once and reused for every batch
+    rotated = np.empty((batch_size, size, size, 3), dtype=np.uint8)
+    work = np.empty((batch_size, size, size, 3), dtype=np.float32)
+    tensors = np.empty((batch_size, 3, size, size), dtype=np.float32)
+
+    return BatchCompose([
+        lambda x, rng: BatchTransforms.random_horizontal_flip(x, p=0.5, rng=rng),
+        lambda x, rng: BatchTransforms.random_rotation(x, degrees=10, rng=rng, out=rotated[:len(x)]),
+        lambda x, rng: BatchTransforms.color_jitter(x, brightness=0.2, contrast=0.2, saturation=0.2, hue=0.1,
+                                                    rng=rng, work=work[:len(x)]),
+        lambda x: BatchTransforms.to_tensor_normalize(x, mean=[0.5, 0.5, 0.5], std=[0.5, 0.5, 0.5],
+                                                      out=tensors[:len(x)])
+    ], seed=seed)
+
+def benchmark(name, run, num_images, repeats):
+    best = float('inf')
+    for _ in range(repeats):
+        started = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - started)
+    print(f"{name:<28} {num_images / best:10.1f} images/sec  ({best * 1000:.1f} ms for {num_images} images)")
+    return num_images / best
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare CustomCompose against the batched transform pipeline")
+    parser.add_argument("--num_images", type=int, default=512, help="Images per run (default: 512)")
+    parser.add_argument("--batch_size", type=int, default=64, help="Batch size for the batched pipeline (default: 64)")
+    parser.add_argument("--size", type=int, default=160, help="Image side length (default: 160)")
+    parser.add_argument("--repeats", type=int, default=3, help="Runs per pipeline, best is reported (default: 3)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed (default: 0)")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    images = np.random.default_rng(args.seed).integers(0, 256, (args.num_images, args.size, args.size, 3), dtype=np.uint8)
+
+    custom = build_custom_pipeline()
+    fused = build_fused_pipeline()
+    fused_out = np.empty((args.num_images, 3, args.size, args.size), dtype=np.float32)
+    batched = build_batch_pipeline(args.batch_size, args.size, args.seed)
+
+    def run_custom():
+        for image in images:
+            custom(image)
+
+    def run_fused():
+        for i, image in enumerate(images):
+            fused(image, out=fused_out[i])
+
+    def run_batched():
+        for start in range(0, args.num_images, args.batch_size):
+            batched(images[start:start + args.batch_size].copy())
+
+    print(f"Transforming {args.num_images} images of {args.size}x{args.size} (batch size {args.batch_size})")
+    custom_rate = benchmark("CustomCompose (per image)", run_custom, args.num_images, args.repeats)
+    benchmark("CustomCompose (fused, out=)", run_fused, args.num_images, args.repeats)
+    batched_rate = benchmark("BatchCompose (batched)", run_batched, args.num_images, args.repeats)
+    print(f"Speedup: {batched_rate / custom_rate:.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -1,90 +1,343 @@
 import os
+import json
+import heapq
+import hashlib
 import random
 import shutil
 import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 import sys
 
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.tif', '.webp'}
+
+def iter_image_files(folder_path):
+    """
+    Yield image files from a folder one at a time. os.scandir reports the entry
+    type from the directory listing, so no per-file stat is needed.
+    """
+    with os.scandir(folder_path) as entries:
+        for entry in entries:
+            if os.path.splitext(entry.name)[1].lower() in IMAGE_EXTENSIONS and entry.is_file():
+                yield Path(entry.path)
+
 def get_image_files(folder_path):
     """
     Get all image files from a folder
     """
-    image_extensions = {'.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.tif', '.webp'}
-    image_files = []
+    return list(iter_image_files(folder_path))
+
+class ReservoirSampler:
+    """
+    Streaming uniform sample of k items that never holds more than k of them.
     
-    for file_path in Path(folder_path).iterdir():
-        if file_path.is_file() and file_path.suffix.lower() in image_extensions:
-            image_files.append(file_path)
+    Every item gets a pseudo-random priority and the k smallest are kept
+    (bottom-k sampling, equivalent to a reservoir). With a seed the priority is
+    a hash of (seed, key), so the sample is reproducible no matter in which
+    order the filesystem lists the directory.
+    """
     
-    return image_files
+    def __init__(self, k, seed=None):
+        self.k = k
+        self.seed = seed
+        self.seen = 0
+        self._heap = []
+    
+    def _priority(self, key):
+        if self.seed is None:
+            return random.random()
+        digest = hashlib.blake2b(f"{self.seed}:{key}".encode(), digest_size=8).digest()
+        return int.from_bytes(digest, 'big') / 2 ** 64
+    
+    def add(self, item, key=None):
+        self.seen += 1
+        if self.k <= 0:
+            return
+        
+        # Max-heap on priority via negation: the root is the first item to evict
+        priority = -self._priority(key if key is not None else item)
+        entry = (priority, str(key if key is not None else item), item)
+        if len(self._heap) < self.k:
+            heapq.heappush(self._heap, entry)
+        elif priority > self._heap[0][0]:
+            heapq.heapreplace(self._heap, entry)
+    
+    def sample(self):
+        """Sampled items, ordered by priority"""
+        return [item for _, _, item in sorted(self._heap, reverse=True)]
 
-def sample_images(input_folder, output_folder, num_images=None, min_images=100, max_images=200):
+def sample_image_files(folder_path, k, seed=None, report_every=10000):
     """
-    Randomly sample images from input folder and copy to output folder
+    Reservoir-sample up to k image files from a folder while streaming the listing
     
-    Args:
-        input_folder: Path to folder containing all images
-        output_folder: Path to output folder for sampled images
-        num_images: Exact number of images to sample (if None, random between min_images and max_images)
-        min_images: Minimum number of images to sample
-        max_images: Maximum number of images to sample
+    Returns:
+        Tuple of (sampled paths, number of image files seen)
+    """
+    sampler = ReservoirSampler(k, seed)
+    for image_path in iter_image_files(folder_path):
+        sampler.add(image_path, key=image_path.name)
+        if report_every and sampler.seen % report_every == 0:
+            print(f"Scanned {sampler.seen} image files...")
+    return sampler.sample(), sampler.seen
+
+MANIFEST_NAME = ".sampling_manifest.json"
+FICLONE = 0x40049409  # _IOW(0x94, 9, int) from linux/fs.h
+
+def reflink_file(src, dst):
+    """
+    Copy-on-write clone of src at dst (btrfs, XFS, overlayfs on those).
+    Raises OSError when the filesystem or platform does not support it.
     """
+    import fcntl
     
-    # Get all image files
-    print(f"Scanning folder: {input_folder}")
-    image_files = get_image_files(input_folder)
+    with open(src, 'rb') as src_file, open(dst, 'wb') as dst_file:
+        try:
+            fcntl.ioctl(dst_file.fileno(), FICLONE, src_file.fileno())
+        except OSError:
+            dst_file.close()
+            os.remove(dst)
+            raise
+    shutil.copystat(src, dst)
+
+def transfer_file(src, dst, link_mode="copy"):
+    """
+    Place src at dst by copying, hardlinking or reflinking. Links fall back to a
+    plain copy when source and destination are on different filesystems or the
+    filesystem does not support them. The file only appears at dst once complete.
     
-    if not image_files:
-        print("No image files found in the input folder!")
-        return
+    Returns:
+        The mode that was actually used
+    """
+    tmp_path = dst.with_name(f".{dst.name}.partial")
+    if tmp_path.exists():
+        tmp_path.unlink()
+    
+    used_mode = link_mode
+    try:
+        if link_mode == "hardlink":
+            os.link(src, tmp_path)
+        elif link_mode == "reflink":
+            reflink_file(src, tmp_path)
+        else:
+            shutil.copy2(src, tmp_path)
+    except (OSError, ImportError):
+        if link_mode == "copy":
+            raise
+        used_mode = "copy"
+        shutil.copy2(src, tmp_path)
+    
+    os.replace(tmp_path, dst)
+    return used_mode
+
+def sampling_parameters(num_images, min_images, max_images, seed, deduplicator):
+    """Settings that decide the selection; a manifest written with other settings is not reused"""
+    return {
+        "num_images": num_images,
+        "min_images": None if num_images is not None else min_images,
+        "max_images": None if num_images is not None else max_images,
+        "seed": seed,
+        "dedup": None if deduplicator is None else {
+            "max_distance": deduplicator.max_distance,
+            "algorithm": deduplicator.algorithm
+        }
+    }
+
+def discard_selection(output_path, selected):
+    """Remove the images placed for a previous selection, so a new one does not mix with them"""
+    removed = 0
+    for _, name in selected:
+        try:
+            (output_path / name).unlink()
+            removed += 1
+        except FileNotFoundError:
+            pass
+    if removed:
+        print(f"Removed {removed} images of the previous selection")
+
+def load_manifest(output_path, input_folder, parameters=None):
+    """
+    Return the previously selected (source, destination name) pairs for this
+    input folder and sampling parameters, or None when there is no usable
+    manifest. A selection made with different parameters is discarded.
+    """
+    manifest_path = output_path / MANIFEST_NAME
+    if not manifest_path.exists():
+        return None
+    
+    try:
+        with open(manifest_path, 'r') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Ignoring unreadable manifest {manifest_path}: {e}")
+        return None
+    
+    if manifest.get("input_folder") != str(Path(input_folder).resolve()):
+        print(f"Manifest in {output_path} was written for {manifest.get('input_folder')}, sampling again")
+        return None
+    
+    selected = [(Path(src), name) for src, name in manifest["selected"]]
+    if parameters is not None and "parameters" not in manifest:
+        print(f"Manifest in {output_path} does not record its sampling settings, reusing it; delete it to resample")
+    elif parameters is not None and manifest["parameters"] != parameters:
+        changed = sorted(key for key in parameters if (manifest["parameters"] or {}).get(key) != parameters[key])
+        print(f"Sampling settings changed since the manifest in {output_path} was written ({', '.join(changed)}), sampling again")
+        discard_selection(output_path, selected)
+        return None
+    return selected
+
+def save_manifest(output_path, input_folder, selected, parameters=None):
+    manifest = {
+        "input_folder": str(Path(input_folder).resolve()),
+        "parameters": parameters,
+        "selected": [[str(src), name] for src, name in selected]
+    }
+    tmp_path = output_path / (MANIFEST_NAME + ".tmp")
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, output_path / MANIFEST_NAME)
+
+def plan_sample(input_folder, output_folder, num_images=None, min_images=100, max_images=200, seed=None,
+                deduplicator=None, oversample=3):
+    """
+    Choose which images to sample and where they go. The selection is stored in a
+    manifest in the output folder together with the sampling settings, so an
+    interrupted run resumes with the same images instead of drawing a new
+    sample. Changing num_images, min/max_images, seed or the deduplication
+    settings replaces the previous selection; delete the manifest to resample
+    with the same settings.
+    
+    With a deduplicator (image_dedup.ImageDeduplicator), oversample times the
+    target is drawn and near-duplicate frames are dropped before taking the
+    target count, so the sample covers more distinct poses.
+    
+    Returns:
+        List of (source path, destination path) pairs, or None if there is nothing to sample
+    """
+    output_path = Path(output_folder)
+    output_path.mkdir(parents=True, exist_ok=True)
     
-    print(f"Found {len(image_files)} image files")
+    parameters = sampling_parameters(num_images, min_images, max_images, seed, deduplicator)
+    selected = load_manifest(output_path, input_folder, parameters)
+    if selected is not None:
+        print(f"Resuming from manifest: {len(selected)} images selected previously")
+        return [(src, output_path / name) for src, name in selected]
     
-    # Determine number of images to sample
+    # Determine number of images to sample; folders with fewer files give all of them
     if num_images is None:
         # Random number between min and max
-        target_count = random.randint(min_images, min(max_images, len(image_files)))
+        target_count = random.randint(min_images, max_images)
     else:
-        target_count = min(num_images, len(image_files))
+        target_count = num_images
     
-    print(f"Sampling {target_count} images...")
+    # Randomly sample images while streaming the folder listing
+    print(f"Scanning folder: {input_folder}")
+    draw_count = target_count * oversample if deduplicator is not None else target_count
+    sampled_images, seen = sample_image_files(input_folder, draw_count, seed)
     
-    # Randomly sample images
-    sampled_images = random.sample(image_files, target_count)
+    if not sampled_images:
+        print("No image files found in the input folder!")
+        return None
     
-    # Create output directory
-    output_path = Path(output_folder)
-    output_path.mkdir(parents=True, exist_ok=True)
+    print(f"Found {seen} image files")
+    
+    if deduplicator is not None:
+        candidates = len(sampled_images)
+        sampled_images = deduplicator.select(sampled_images, limit=target_count)
+        print(f"Kept {len(sampled_images)} distinct images from {candidates} candidates "
+              f"(hamming distance > {deduplicator.max_distance})")
+    print(f"Sampling {len(sampled_images)} images...")
     
-    # Copy sampled images
-    copied_count = 0
-    failed_count = 0
+    # Sequential numbering for the new filenames
+    selected = [(image_path, f"img_{i+1:03d}{image_path.suffix}") for i, image_path in enumerate(sampled_images)]
+    save_manifest(output_path, input_folder, selected, parameters)
+    
+    return [(src, output_path / name) for src, name in selected]
+
+def transfer_files(jobs, workers=1, link_mode="copy"):
+    """
+    Copy or link (source, destination) pairs using a thread pool. Destinations that
+    already exist with the source's size are skipped.
+    
+    Returns:
+        Dict with copied, skipped and failed counts plus per-destination success
+    """
+    results = {"copied": 0, "skipped": 0, "failed": 0, "fallbacks": 0, "succeeded": set()}
+    pending = []
     
-    for i, image_path in enumerate(sampled_images):
+    for src, dst in jobs:
         try:
-            # Create new filename with sequential numbering
-            new_filename = f"img_{i+1:03d}{image_path.suffix}"
-            output_file_path = output_path / new_filename
-            
-            # Copy file
-            shutil.copy2(image_path, output_file_path)
-            copied_count += 1
-            
-            if copied_count % 20 == 0:
-                print(f"Copied {copied_count}/{target_count} images...")
+            if dst.exists() and dst.stat().st_size == src.stat().st_size:
+                results["skipped"] += 1
+                results["succeeded"].add(dst)
+                continue
+        except OSError:
+            pass
+        pending.append((src, dst))
+    
+    if results["skipped"]:
+        print(f"Skipping {results['skipped']} images already in place")
+    
+    if not pending:
+        return results
+    
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = {executor.submit(transfer_file, src, dst, link_mode): (src, dst) for src, dst in pending}
+        
+        for future in as_completed(futures):
+            src, dst = futures[future]
+            try:
+                used_mode = future.result()
+                results["copied"] += 1
+                results["succeeded"].add(dst)
+                if used_mode != link_mode:
+                    results["fallbacks"] += 1
                 
-        except Exception as e:
-            print(f"Failed to copy {image_path}: {e}")
-            failed_count += 1
+                if results["copied"] % 20 == 0:
+                    print(f"Copied {results['copied']}/{len(pending)} images...")
+                    
+            except Exception as e:
+                print(f"Failed to copy {src}: {e}")
+                results["failed"] += 1
+    
+    if results["fallbacks"]:
+        print(f"{link_mode} not supported for {results['fallbacks']} files, copied them instead")
+    
+    return results
+
+def sample_images(input_folder, output_folder, num_images=None, min_images=100, max_images=200,
+                  workers=1, link_mode="copy", seed=None, deduplicator=None):
+    """
+    Randomly sample images from input folder and copy to output folder
+    
+    Args:
+        input_folder: Path to folder containing all images
+        output_folder: Path to output folder for sampled images
+        num_images: Exact number of images to sample (if None, random between min_images and max_images)
+        min_images: Minimum number of images to sample
+        max_images: Maximum number of images to sample
+        workers: Number of threads copying files
+        link_mode: "copy", "hardlink" or "reflink"
+        seed: Seed making the selection reproducible (None for a fresh random sample)
+        deduplicator: Optional image_dedup.ImageDeduplicator dropping near-duplicate frames
+    """
+    
+    jobs = plan_sample(input_folder, output_folder, num_images, min_images, max_images, seed, deduplicator)
+    if not jobs:
+        return 0
+    
+    results = transfer_files(jobs, workers, link_mode)
     
     print(f"\nSampling completed!")
-    print(f"Successfully copied: {copied_count} images")
-    print(f"Failed to copy: {failed_count} images")
+    print(f"Successfully copied: {results['copied']} images")
+    if results["skipped"]:
+        print(f"Already present: {results['skipped']} images")
+    print(f"Failed to copy: {results['failed']} images")
     print(f"Output folder: {output_folder}")
     
-    return copied_count
+    return results["copied"] + results["skipped"]
 
-def sample_multiple_folders(base_input_folder, base_output_folder, num_images=None, min_images=100, max_images=200):
+def sample_multiple_folders(base_input_folder, base_output_folder, num_images=None, min_images=100, max_images=200,
+                            workers=1, link_mode="copy", seed=None, deduplicator=None):
     """
     Sample images from multiple subfolders (useful for multiple people)
     
@@ -94,6 +347,10 @@ def sample_multiple_folders(base_input_folder, base_output_folder, num_images=No
         num_images: Exact number of images to sample per person
         min_images: Minimum number of images to sample per person
         max_images: Maximum number of images to sample per person
+        workers: Number of threads copying files, shared across all person folders
+        link_mode: "copy", "hardlink" or "reflink"
+        seed: Seed making the selection reproducible (None for a fresh random sample)
+        deduplicator: Optional image_dedup.ImageDeduplicator dropping near-duplicate frames
     """
     
     base_input_path = Path(base_input_folder)
@@ -104,16 +361,19 @@ def sample_multiple_folders(base_input_folder, base_output_folder, num_images=No
         return
     
     # Get all subdirectories
-    subdirs = [d for d in base_input_path.iterdir() if d.is_dir()]
+    subdirs = sorted((d for d in base_input_path.iterdir() if d.is_dir()), key=lambda d: d.name)
     
     if not subdirs:
         print("No subdirectories found. Processing as single folder...")
-        sample_images(base_input_folder, base_output_folder, num_images, min_images, max_images)
+        sample_images(base_input_folder, base_output_folder, num_images, min_images, max_images, workers, link_mode, seed,
+                      deduplicator)
         return
     
     print(f"Found {len(subdirs)} person folders: {[d.name for d in subdirs]}")
     
-    total_sampled = 0
+    # Selection runs in order so seeded runs stay reproducible; the copies of
+    # every person then share one pool
+    jobs_by_person = {}
     
     for person_folder in subdirs:
         person_name = person_folder.name
@@ -122,18 +382,33 @@ def sample_multiple_folders(base_input_folder, base_output_folder, num_images=No
         
         print(f"\n--- Processing {person_name} ---")
         
-        sampled_count = sample_images(
+        jobs = plan_sample(
             input_person_folder, 
             output_person_folder, 
             num_images, 
             min_images, 
-            max_images
+            max_images,
+            None if seed is None else f"{seed}:{person_name}",
+            deduplicator
         )
         
-        total_sampled += sampled_count
+        if jobs:
+            jobs_by_person[person_name] = jobs
+    
+    all_jobs = [job for jobs in jobs_by_person.values() for job in jobs]
+    print(f"\nTransferring {len(all_jobs)} images with {workers} workers ({link_mode})...")
+    results = transfer_files(all_jobs, workers, link_mode)
+    
+    total_sampled = len(results["succeeded"])
     
     print(f"\n=== SUMMARY ===")
+    for person_name, jobs in jobs_by_person.items():
+        done = sum(1 for _, dst in jobs if dst in results["succeeded"])
+        if done < len(jobs):
+            print(f"{person_name}: {done}/{len(jobs)} images (incomplete, re-run to resume)")
     print(f"Total images sampled across all people: {total_sampled}")
+    if results["failed"]:
+        print(f"Failed to copy: {results['failed']} images")
     print(f"Output base folder: {base_output_folder}")
 
 def main():
@@ -167,10 +442,32 @@ def main():
                        type=int, 
                        help="Random seed for reproducible sampling")
     
+    parser.add_argument("--workers", "-w", 
+                       type=int, 
+                       default=8, 
+                       help="Number of threads copying files (default: 8)")
+    
+    parser.add_argument("--link_mode", 
+                       choices=["copy", "hardlink", "reflink"], 
+                       default="copy", 
+                       help="Copy files, or hardlink/reflink them when input and output share a filesystem (default: copy)")
+    
+    parser.add_argument("--dedup_distance", 
+                       type=int, 
+                       help="Drop near-duplicate frames within this perceptual hash hamming distance (e.g. 6; off by default)")
+    
+    parser.add_argument("--hash_algorithm", 
+                       choices=["dhash", "phash"], 
+                       default="dhash", 
+                       help="Perceptual hash used for deduplication (default: dhash)")
+    
+    parser.add_argument("--hash_cache", 
+                       help="Hash cache file reused across runs (default: <output_folder>/.image_hashes.json)")
+    
     args = parser.parse_args()
     
     # Set random seed if provided
-    if args.seed:
+    if args.seed is not None:
         random.seed(args.seed)
         print(f"Using random seed: {args.seed}")
     
@@ -199,6 +496,14 @@ def main():
     
     print()
     
+    deduplicator = None
+    if args.dedup_distance is not None:
+        from image_dedup import ImageDeduplicator
+        
+        cache_path = args.hash_cache or os.path.join(args.output_folder, ".image_hashes.json")
+        deduplicator = ImageDeduplicator(args.dedup_distance, args.hash_algorithm, cache_path, args.workers)
+        print(f"Deduplicating with {args.hash_algorithm}, max distance {args.dedup_distance}")
+    
     # Process images
     if args.multiple_people:
         sample_multiple_folders(
@@ -206,7 +511,11 @@ def main():
             args.output_folder, 
             args.num_images, 
             args.min_images, 
-            args.max_images
+            args.max_images,
+            args.workers,
+            args.link_mode,
+            args.seed,
+            deduplicator
         )
     else:
         sample_images(
@@ -214,8 +523,17 @@ def main():
             args.output_folder, 
             args.num_images, 
             args.min_images, 
-            args.max_images
+            args.max_images,
+            args.workers,
+            args.link_mode,
+            args.seed,
+            deduplicator
         )
+    
+    if deduplicator is not None:
+        deduplicator.save()
+        stats = deduplicator.stats
+        print(f"Hashes computed: {stats['hashed']}, from cache: {stats['cached']}, near-duplicates dropped: {stats['duplicates']}")
 
 # Quick function for simple usage without command line
 def quick_sample(input_folder, output_folder, target_images=150):
@@ -0,0 +1,282 @@
+"""
+Multi-process training loader for CustomCompose pipelines.
+
+Usage:
+    from data_loader import load_face_dataset, SharedMemoryLoader
+
+    image_paths, labels, class_names = load_face_dataset("./indep_data")
+    with SharedMemoryLoader(image_paths, labels, train_transform, batch_size=32, num_workers=4) as loader:
+        for epoch in range(num_epochs):
+            for images, batch_labels in loader:
+                ...
+
+    # Shards written by pack_dataset.py skip decoding entirely
+    dataset = PackedFaceDataset("./packed_data")
+    loader = SharedMemoryLoader(dataset, dataset.labels, train_transform, batch_size=32)
+
+Workers decode and augment whole batches and write them into shared memory
+slots, so only indices and slot numbers cross process boundaries. Each batch is
+augmented with a seed derived from (seed, epoch, batch index), which makes the
+output independent of the number of workers and of scheduling order. A batch
+that fails raises in the training process with the worker's traceback, and a
+worker that dies without reporting (e.g. OOM-killed) raises instead of hanging.
+"""
+import os
+import queue
+import random
+import traceback
+import multiprocessing as mp
+from multiprocessing import shared_memory
+import numpy as np
+import torch
+from PIL import Image
+
+from transformer import CustomCompose
+
+# How long the parent waits on results before checking that every worker is still alive
+WORKER_POLL_INTERVAL_S = 1.0
+
+def load_face_dataset(data_dir):
+    image_paths = []
+    labels = []
+    class_names = []
+
+    for idx, person_folder in enumerate(sorted(os.listdir(data_dir))):
+        person_path = os.path.join(data_dir, person_folder)
+        if os.path.isdir(person_path):
+            class_names.append(person_folder)
+            for img_file in sorted(os.listdir(person_path)):
+                if img_file.lower().endswith(('.png', '.jpg', '.jpeg')):
+                    image_paths.append(os.path.join(person_path, img_file))
+                    labels.append(idx)
+
+    return image_paths, labels, class_names
+
+def batch_seed(seed, epoch, batch_index):
+    return int(np.random.SeedSequence([seed, epoch, batch_index]).generate_state(1)[0])
+
+def _slot_views(image_shm, label_shm, batch_size, sample_shape):
+    images = np.ndarray((batch_size,) + tuple(sample_shape), dtype=np.float32, buffer=image_shm.buf)
+    labels = np.ndarray((batch_size,), dtype=np.int64, buffer=label_shm.buf)
+    return images, labels
+
+def _load_image(path):
+    with Image.open(path) as img:
+        return img.convert('RGB')
+
+def _worker_loop(worker_id, image_paths, labels, transform, slot_names, batch_size, sample_shape,
+                 seed, task_queue, result_queue):
+    torch.set_num_threads(1)
+    handles = [(shared_memory.SharedMemory(name=image_name), shared_memory.SharedMemory(name=label_name))
+               for image_name, label_name in slot_names]
+    slot_images, slot_labels = zip(*[_slot_views(image_shm, label_shm, batch_size, sample_shape)
+                                     for image_shm, label_shm in handles])
+    fused = isinstance(transform, CustomCompose)
+    # Packed datasets (pack_dataset.PackedFaceDataset) serve decoded pixels directly
+    if hasattr(image_paths, 'load_image'):
+        load_image = image_paths.load_image
+    else:
+        load_image = lambda index: _load_image(image_paths[index])
+
+    try:
+        while True:
+            task = task_queue.get()
+            if task is None:
+                break
+            epoch, batch_index, slot, indices = task
+
+            try:
+                # CustomTransforms draws from the global RNGs
+                random.seed(batch_seed(seed, epoch, batch_index))
+                np.random.seed(batch_seed(seed, epoch, batch_index))
+
+                for row, index in enumerate(indices):
+                    image = load_image(index)
+                    if fused:
+                        transform(image, out=slot_images[slot][row])
+                    else:
+                        slot_images[slot][row] = transform(image)
+                    slot_labels[slot][row] = labels[index]
+
+                result_queue.put((batch_index, slot, len(indices), None))
+            except Exception:
+                result_queue.put((batch_index, slot, 0, f"worker {worker_id}: {traceback.format_exc()}"))
+    finally:
+        del slot_images, slot_labels
+        for image_shm, label_shm in handles:
+            image_shm.close()
+            label_shm.close()
+
+class SharedMemoryLoader:
+    """
+    Iterates (images, labels) batches as torch tensors backed by shared memory.
+    The yielded tensors are only valid until the next batch is requested; copy
+    them (or move them to the GPU) before advancing the iterator.
+    """
+
+    def __init__(self, image_paths, labels, transform, batch_size=32, num_workers=4, prefetch=2,
+                 shuffle=True, drop_last=False, seed=0, sample_shape=(3, 160, 160)):
+        if len(image_paths) != len(labels):
+            raise ValueError("image_paths and labels must have the same length")
+
+        # Either a list of image files or a dataset exposing load_image(index)
+        self.image_paths = image_paths if hasattr(image_paths, 'load_image') else list(image_paths)
+        self.labels = list(labels)
+        self.transform = transform
+        self.batch_size = batch_size
+        self.num_workers = max(1, num_workers)
+        self.prefetch = max(1, prefetch)
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+        self.seed = seed
+        self.sample_shape = tuple(sample_shape)
+        self.epoch = 0
+
+        self._workers = []
+        self._shm = []
+        self._closed = False
+        self._start()
+
+    def _start(self):
+        num_slots = self.num_workers * self.prefetch
+        image_bytes = self.batch_size * int(np.prod(self.sample_shape)) * 4
+        label_bytes = self.batch_size * 8
+
+        slot_names = []
+        self._slot_images, self._slot_labels = [], []
+        for _ in range(num_slots):
+            image_shm = shared_memory.SharedMemory(create=True, size=image_bytes)
+            label_shm = shared_memory.SharedMemory(create=True, size=label_bytes)
+            self._shm.extend([image_shm, label_shm])
+            slot_names.append((image_shm.name, label_shm.name))
+            images, labels = _slot_views(image_shm, label_shm, self.batch_size, self.sample_shape)
+            self._slot_images.append(images)
+            self._slot_labels.append(labels)
+        self._free_slots = list(range(num_slots))
+
+        # fork lets lambda-based CustomCompose pipelines reach the workers without pickling
+        context = mp.get_context('fork' if 'fork' in mp.get_all_start_methods() else None)
+        self._task_queues = [context.SimpleQueue() for _ in range(self.num_workers)]
+        # A Queue rather than a SimpleQueue so waits can time out and notice dead workers
+        self._result_queue = context.Queue()
+        for worker_id in range(self.num_workers):
+            worker = context.Process(
+                target=_worker_loop,
+                args=(worker_id, self.image_paths, self.labels, self.transform, slot_names, self.batch_size,
+                      self.sample_shape, self.seed, self._task_queues[worker_id], self._result_queue),
+                daemon=True
+            )
+            worker.start()
+            self._workers.append(worker)
+
+    def __len__(self):
+        if self.drop_last:
+            return len(self.image_paths) // self.batch_size
+        return (len(self.image_paths) + self.batch_size - 1) // self.batch_size
+
+    def _next_result(self):
+        """Next (batch_index, slot, count, error) from the workers, or None once a worker has died"""
+        while True:
+            try:
+                return self._result_queue.get(timeout=WORKER_POLL_INTERVAL_S)
+            except queue.Empty:
+                if any(not worker.is_alive() for worker in self._workers):
+                    return None
+
+    def _dead_workers(self):
+        return ', '.join(f"worker {worker_id} (exit code {worker.exitcode})"
+                         for worker_id, worker in enumerate(self._workers) if not worker.is_alive())
+
+    def _epoch_batches(self, epoch):
+        order = np.arange(len(self.image_paths))
+        if self.shuffle:
+            np.random.default_rng([self.seed, epoch]).shuffle(order)
+        return [order[i * self.batch_size:(i + 1) * self.batch_size].tolist() for i in range(len(self))]
+
+    def __iter__(self):
+        if self._closed:
+            raise RuntimeError("SharedMemoryLoader is closed")
+
+        epoch = self.epoch
+        self.epoch += 1
+        batches = self._epoch_batches(epoch)
+        submitted = 0
+        received = 0
+        ready = {}
+        current_slot = None
+
+        def submit():
+            nonlocal submitted
+            while self._free_slots and submitted < len(batches):
+                slot = self._free_slots.pop()
+                # Batches are sharded round-robin across workers
+                self._task_queues[submitted % self.num_workers].put((epoch, submitted, slot, batches[submitted]))
+                submitted += 1
+
+        try:
+            submit()
+            for batch_index in range(len(batches)):
+                while batch_index not in ready:
+                    result = self._next_result()
+                    if result is None:
+                        raise RuntimeError(f"Data loader worker exited unexpectedly: {self._dead_workers()}")
+                    done_index, slot, count, error = result
+                    received += 1
+                    if error:
+                        self._free_slots.append(slot)
+                        raise RuntimeError(f"Data loader worker failed on batch {done_index}:\n{error}")
+                    ready[done_index] = (slot, count)
+
+                # The previous batch has been consumed, so its slot can be refilled
+                if current_slot is not None:
+                    self._free_slots.append(current_slot)
+                current_slot, count = ready.pop(batch_index)
+                submit()
+
+                yield (torch.from_numpy(self._slot_images[current_slot][:count]),
+                       torch.from_numpy(self._slot_labels[current_slot][:count]))
+        finally:
+            # Reclaim every slot, waiting for batches still in flight, so the next epoch starts clean
+            while received < submitted:
+                result = self._next_result()
+                if result is None:
+                    # Batches given to a dead worker never come back, so the loader cannot be reused
+                    self.close()
+                    break
+                received += 1
+                self._free_slots.append(result[1])
+            self._free_slots.extend(slot for slot, _ in ready.values())
+            if current_slot is not None:
+                self._free_slots.append(current_slot)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        for queue in self._task_queues:
+            queue.put(None)
+        for worker in self._workers:
+            worker.join(timeout=5)
+            if worker.is_alive():
+                worker.terminate()
+        self._slot_images, self._slot_labels = [], []
+        for shm in self._shm:
+            try:
+                shm.close()
+            except BufferError:
+                # A yielded tensor still references the slot; the mapping goes away with it
+                pass
+            shm.unlink()
+        self._shm = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
@@ -0,0 +1,233 @@
+"""
+Perceptual hashing and near-duplicate removal for sampled image sets.
+
+Usage:
+    python image_dedup.py ./indep_data/loknar --max_distance 6
+
+Frames extracted from video are often almost identical. Each image gets a
+64-bit perceptual hash (dHash or pHash); images whose hashes are within
+max_distance bits of an image already kept are dropped. Hashes are cached on
+disk keyed by path, size and mtime, so re-runs only hash new or changed files.
+"""
+import os
+import sys
+import json
+import argparse
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from PIL import Image
+
+HASH_SIZE = 8
+
+def _load_gray(path, size):
+    with Image.open(path) as img:
+        if img.format == 'JPEG':
+            # Hashes only need a thumbnail; let libjpeg decode at reduced scale
+            img.draft('L', (size[0] * 4, size[1] * 4))
+        return np.asarray(img.convert('L').resize(size, Image.LANCZOS), dtype=np.float32)
+
+def _bits_to_int(bits):
+    value = 0
+    for bit in bits.ravel():
+        value = (value << 1) | int(bit)
+    return value
+
+def dhash(path, hash_size=HASH_SIZE):
+    """Difference hash: sign of the horizontal gradient on a (hash_size + 1) x hash_size thumbnail"""
+    pixels = _load_gray(path, (hash_size + 1, hash_size))
+    return _bits_to_int(pixels[:, 1:] > pixels[:, :-1])
+
+def _dct_matrix(n):
+    k = np.arange(n)[:, None]
+    matrix = np.cos(np.pi * (2 * np.arange(n)[None, :] + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    matrix[0] /= np.sqrt(2.0)
+    return matrix.astype(np.float32)
+
+DCT_32 = _dct_matrix(HASH_SIZE * 4)
+
+def phash(path, hash_size=HASH_SIZE):
+    """DCT hash: low-frequency coefficients of a 32x32 thumbnail compared against their median"""
+    size = hash_size * 4
+    dct = DCT_32 if size == DCT_32.shape[0] else _dct_matrix(size)
+    pixels = _load_gray(path, (size, size))
+    low = (dct @ pixels @ dct.T)[:hash_size, :hash_size]
+    return _bits_to_int(low > np.median(low.ravel()[1:]))
+
+HASH_FUNCTIONS = {"dhash": dhash, "phash": phash}
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count("1")
+
+class BKTree:
+    """Burkhard-Keller tree over hamming distance for radius queries on 64-bit hashes"""
+
+    def __init__(self):
+        self.root = None
+        self.size = 0
+
+    def add(self, hash_value, item):
+        self.size += 1
+        node = [hash_value, item, {}]
+        if self.root is None:
+            self.root = node
+            return
+
+        current = self.root
+        while True:
+            distance = hamming_distance(hash_value, current[0])
+            child = current[2].get(distance)
+            if child is None:
+                current[2][distance] = node
+                return
+            current = child
+
+    def search(self, hash_value, radius):
+        """All (distance, item) pairs within radius of hash_value"""
+        if self.root is None:
+            return []
+
+        matches = []
+        stack = [self.root]
+        while stack:
+            node_hash, item, children = stack.pop()
+            distance = hamming_distance(hash_value, node_hash)
+            if distance <= radius:
+                matches.append((distance, item))
+            # Triangle inequality: only children at distance d +/- radius can match
+            for child_distance, child in children.items():
+                if distance - radius <= child_distance <= distance + radius:
+                    stack.append(child)
+        return matches
+
+class HashCache:
+    """JSON file mapping "algorithm:absolute path" -> [size, mtime_ns, hash]"""
+
+    def __init__(self, cache_path=None):
+        self.cache_path = cache_path
+        self.entries = {}
+        self.dirty = False
+        if cache_path and os.path.exists(cache_path):
+            try:
+                with open(cache_path, 'r') as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Ignoring unreadable hash cache {cache_path}: {e}")
+
+    def get(self, path, stat, algorithm):
+        entry = self.entries.get(f"{algorithm}:{path}")
+        if entry and entry[0] == stat.st_size and entry[1] == stat.st_mtime_ns:
+            return int(entry[2], 16)
+        return None
+
+    def put(self, path, stat, algorithm, hash_value):
+        self.entries[f"{algorithm}:{path}"] = [stat.st_size, stat.st_mtime_ns, f"{hash_value:016x}"]
+        self.dirty = True
+
+    def save(self):
+        if not self.cache_path or not self.dirty:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.cache_path)), exist_ok=True)
+        tmp_path = self.cache_path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.entries, f)
+        os.replace(tmp_path, self.cache_path)
+        self.dirty = False
+
+class ImageDeduplicator:
+    """
+    Greedy near-duplicate filter: images are considered in the given order and
+    kept unless a kept image lies within max_distance bits.
+    """
+
+    def __init__(self, max_distance=6, algorithm="dhash", cache_path=None, workers=8):
+        if algorithm not in HASH_FUNCTIONS:
+            raise ValueError(f"Unknown hash algorithm '{algorithm}', expected one of {sorted(HASH_FUNCTIONS)}")
+        self.max_distance = max_distance
+        self.algorithm = algorithm
+        self.workers = workers
+        self.cache = HashCache(cache_path)
+        self.stats = {"hashed": 0, "cached": 0, "failed": 0, "duplicates": 0}
+
+    def _hash_one(self, path):
+        path = Path(path).resolve()
+        try:
+            stat = path.stat()
+            cached = self.cache.get(path, stat, self.algorithm)
+            if cached is not None:
+                return cached, True
+            return (HASH_FUNCTIONS[self.algorithm](path), stat), False
+        except Exception as e:
+            print(f"Failed to hash {path}: {e}")
+            return None, False
+
+    def compute_hashes(self, paths):
+        """Hash images in parallel; returns a list aligned with paths (None for unreadable files)"""
+        with ThreadPoolExecutor(max_workers=max(1, self.workers)) as executor:
+            results = list(executor.map(self._hash_one, paths))
+
+        hashes = []
+        for path, (result, from_cache) in zip(paths, results):
+            if result is None:
+                self.stats["failed"] += 1
+                hashes.append(None)
+            elif from_cache:
+                self.stats["cached"] += 1
+                hashes.append(result)
+            else:
+                hash_value, stat = result
+                self.cache.put(Path(path).resolve(), stat, self.algorithm, hash_value)
+                self.stats["hashed"] += 1
+                hashes.append(hash_value)
+        return hashes
+
+    def select(self, paths, limit=None):
+        """
+        Keep paths (in order) that are not near-duplicates of an earlier kept path,
+        stopping once limit images are kept
+        """
+        tree = BKTree()
+        kept = []
+        for path, hash_value in zip(paths, self.compute_hashes(paths)):
+            if hash_value is None:
+                continue
+            if tree.search(hash_value, self.max_distance):
+                self.stats["duplicates"] += 1
+                continue
+            tree.add(hash_value, path)
+            kept.append(path)
+            if limit is not None and len(kept) >= limit:
+                break
+        return kept
+
+    def save(self):
+        self.cache.save()
+
+def main():
+    parser = argparse.ArgumentParser(description="Report near-duplicate images in a folder")
+    parser.add_argument("folder", help="Folder containing images")
+    parser.add_argument("--max_distance", type=int, default=6, help="Hamming distance counted as duplicate (default: 6)")
+    parser.add_argument("--algorithm", choices=sorted(HASH_FUNCTIONS), default="dhash", help="Hash function (default: dhash)")
+    parser.add_argument("--hash_cache", help="Hash cache file (default: <folder>/.image_hashes.json)")
+    parser.add_argument("--workers", type=int, default=8, help="Hashing threads (default: 8)")
+    args = parser.parse_args()
+
+    from condensing_images import get_image_files
+
+    if not os.path.isdir(args.folder):
+        print(f"Error: Folder '{args.folder}' does not exist")
+        sys.exit(1)
+
+    paths = sorted(get_image_files(args.folder))
+    cache_path = args.hash_cache or os.path.join(args.folder, ".image_hashes.json")
+    deduplicator = ImageDeduplicator(args.max_distance, args.algorithm, cache_path, args.workers)
+    kept = deduplicator.select(paths)
+    deduplicator.save()
+
+    print(f"Images: {len(paths)}")
+    print(f"Unique at distance <= {args.max_distance}: {len(kept)}")
+    print(f"Near-duplicates: {deduplicator.stats['duplicates']}")
+    print(f"Hashed: {deduplicator.stats['hashed']}, from cache: {deduplicator.stats['cached']}, failed: {deduplicator.stats['failed']}")
+
+if __name__ == "__main__":
+    main()
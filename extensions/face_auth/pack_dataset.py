@@ -0,0 +1,179 @@
+"""
+Decode, face-crop and resize a face dataset once into packed uint8 shards.
+
+Usage:
+    python pack_dataset.py ./indep_data ./packed_data --face_crop
+
+The input has one folder per person (the layout load_face_dataset expects).
+The output holds one <class>.npy of shape (N, 160, 160, 3) per person plus
+index.json with the labels, counts and source files of every shard.
+PackedFaceDataset memory-maps the shards, so training jobs read 160x160
+pixels straight from the page cache instead of re-decoding JPEGs each epoch.
+"""
+import os
+import sys
+import json
+import argparse
+import threading
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+
+from data_loader import load_face_dataset
+
+INDEX_FILE = "index.json"
+
+class FaceCropper:
+    """Crops the most confident MTCNN face with a margin; falls back to the full image"""
+
+    def __init__(self, margin=0.2):
+        from facenet_pytorch import MTCNN
+
+        self.detector = MTCNN(keep_all=False, device='cpu')
+        self.margin = margin
+        # MTCNN is not safe to call from several threads at once
+        self.lock = threading.Lock()
+
+    def __call__(self, image):
+        with self.lock:
+            boxes, probs = self.detector.detect(image)
+        if boxes is None or len(boxes) == 0:
+            return image, False
+
+        x1, y1, x2, y2 = boxes[int(np.argmax(probs))]
+        pad_x = (x2 - x1) * self.margin
+        pad_y = (y2 - y1) * self.margin
+        box = (
+            max(0, int(x1 - pad_x)),
+            max(0, int(y1 - pad_y)),
+            min(image.width, int(x2 + pad_x)),
+            min(image.height, int(y2 + pad_y))
+        )
+        return image.crop(box), True
+
+def load_packed_image(path, size=(160, 160), cropper=None):
+    with Image.open(path) as img:
+        if img.format == 'JPEG':
+            # Decode at a reduced scale; keep extra resolution when a face crop follows
+            img.draft('RGB', (size[0] * 4, size[1] * 4) if cropper else size)
+        image = img.convert('RGB')
+
+    face_found = False
+    if cropper is not None:
+        image, face_found = cropper(image)
+    return np.asarray(image.resize(size, Image.LANCZOS), dtype=np.uint8), face_found
+
+def pack_dataset(data_dir, output_dir, size=(160, 160), face_crop=False, workers=8):
+    image_paths, labels, class_names = load_face_dataset(data_dir)
+    if not image_paths:
+        print(f"No images found in {data_dir}")
+        return None
+
+    os.makedirs(output_dir, exist_ok=True)
+    cropper = FaceCropper() if face_crop else None
+    print(f"Packing {len(image_paths)} images across {len(class_names)} people into {output_dir}")
+
+    def process(path):
+        try:
+            return load_packed_image(path, size, cropper)
+        except Exception as e:
+            print(f"Failed to process {path}: {e}")
+            return None, False
+
+    shards = []
+    faces_found = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for label, class_name in enumerate(class_names):
+            class_paths = [path for path, path_label in zip(image_paths, labels) if path_label == label]
+            results = list(executor.map(process, class_paths))
+
+            sources = [os.path.relpath(path, data_dir) for path, (array, _) in zip(class_paths, results) if array is not None]
+            arrays = [array for array, _ in results if array is not None]
+            faces_found += sum(1 for array, found in results if array is not None and found)
+
+            shard_file = f"{class_name}.npy"
+            packed = np.stack(arrays) if arrays else np.empty((0, size[1], size[0], 3), dtype=np.uint8)
+            np.save(os.path.join(output_dir, shard_file), packed)
+            shards.append({
+                "class_name": class_name,
+                "label": label,
+                "file": shard_file,
+                "count": len(arrays),
+                "sources": sources
+            })
+            print(f"  {class_name}: {len(arrays)}/{len(class_paths)} images")
+
+    index = {
+        "image_size": [size[1], size[0], 3],
+        "face_crop": face_crop,
+        "class_names": class_names,
+        "total_images": sum(shard["count"] for shard in shards),
+        "shards": shards
+    }
+    with open(os.path.join(output_dir, INDEX_FILE), 'w') as f:
+        json.dump(index, f, indent=2)
+
+    if face_crop:
+        print(f"Faces detected in {faces_found}/{index['total_images']} images")
+    print(f"✅ Packed {index['total_images']} images to {output_dir}")
+    return index
+
+class PackedFaceDataset:
+    """
+    Read-only view over a pack_dataset output directory. Images come back as
+    (160, 160, 3) uint8 arrays backed by the memory-mapped shards; transforms
+    that modify their input in place must copy first.
+    """
+
+    def __init__(self, pack_dir, transform=None):
+        with open(os.path.join(pack_dir, INDEX_FILE), 'r') as f:
+            self.index = json.load(f)
+
+        self.transform = transform
+        self.class_names = self.index["class_names"]
+        self.shards = [
+            np.load(os.path.join(pack_dir, shard["file"]), mmap_mode='r') if shard["count"] else None
+            for shard in self.index["shards"]
+        ]
+
+        shard_ids, offsets, labels = [], [], []
+        for shard_id, shard in enumerate(self.index["shards"]):
+            shard_ids.extend([shard_id] * shard["count"])
+            offsets.extend(range(shard["count"]))
+            labels.extend([shard["label"]] * shard["count"])
+        self.shard_ids = np.asarray(shard_ids, dtype=np.int32)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.labels = labels
+
+    def __len__(self):
+        return len(self.labels)
+
+    def load_image(self, idx):
+        return self.shards[self.shard_ids[idx]][self.offsets[idx]]
+
+    def __getitem__(self, idx):
+        image = self.load_image(idx)
+        label = self.labels[idx]
+
+        if self.transform:
+            image = self.transform(image)
+
+        return image, label
+
+def main():
+    parser = argparse.ArgumentParser(description="Pack a face dataset into memory-mappable uint8 shards")
+    parser.add_argument("data_dir", help="Dataset directory with one folder per person")
+    parser.add_argument("output_dir", help="Directory for the packed shards and index.json")
+    parser.add_argument("--size", type=int, default=160, help="Output image side length (default: 160)")
+    parser.add_argument("--face_crop", action="store_true", help="Crop to the detected face with MTCNN before resizing")
+    parser.add_argument("--workers", type=int, default=8, help="Decode threads (default: 8)")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.data_dir):
+        print(f"Error: Dataset directory '{args.data_dir}' does not exist!")
+        sys.exit(1)
+
+    pack_dataset(args.data_dir, args.output_dir, (args.size, args.size), args.face_crop, args.workers)
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,9 @@
+import random
+import inspect
+import functools
+import numpy as np
+from PIL import Image, ImageEnhance
+
 class CustomTransforms:
     def __init__(self):
         pass
@@ -73,9 +79,9 @@ class CustomTransforms:
         return pil_img
     
     @staticmethod
-    def to_tensor(image):
+    def _chw_uint8(image):
         if isinstance(image, Image.Image):
-            image = np.array(image)
+            image = np.asarray(image)
         
         if image.dtype != np.uint8:
             if image.max() <= 1.0:
@@ -84,31 +90,244 @@ class CustomTransforms:
                 image = image.astype(np.uint8)
 
         if len(image.shape) == 3:
-            tensor = image.transpose(2, 0, 1).astype(np.float32) / 255.0
-        else:
-            tensor = image.astype(np.float32) / 255.0
-            tensor = np.expand_dims(tensor, axis=0)
-        
-        return tensor
+            return image.transpose(2, 0, 1)
+        return image[None]
+
+    @staticmethod
+    def to_tensor(image, out=None):
+        image = CustomTransforms._chw_uint8(image)
+        if out is None:
+            out = np.empty(image.shape, dtype=np.float32)
+        np.multiply(image, np.float32(1.0 / 255.0), out=out)
+        return out
     
     @staticmethod
-    def normalize(tensor, mean=[0.5, 0.5, 0.5], std=[0.5, 0.5, 0.5]):
-        mean = np.array(mean).reshape(-1, 1, 1)
-        std = np.array(std).reshape(-1, 1, 1)
+    def normalize(tensor, mean=[0.5, 0.5, 0.5], std=[0.5, 0.5, 0.5], out=None):
+        mean = np.asarray(mean, dtype=np.float32).reshape(-1, 1, 1)
+        std = np.asarray(std, dtype=np.float32).reshape(-1, 1, 1)
         
         if tensor.shape[0] == 1 and len(mean) == 3:
             mean = mean[0:1]
             std = std[0:1]
         
-        normalized = (tensor - mean) / std
-        return normalized
+        if out is None:
+            out = np.empty(tensor.shape, dtype=np.float32)
+        np.subtract(tensor, mean, out=out)
+        out /= std
+        return out
 
 class CustomCompose:
+    """
+    Applies transforms in order. When the list ends in CustomTransforms.to_tensor,
+    optionally followed by CustomTransforms.normalize (passed directly or via
+    functools.partial rather than wrapped in a lambda), the tail is compiled
+    into one uint8 -> float32 multiply-add that writes straight into out,
+    e.g. a slot of a reusable batch tensor.
+    """
+
     def __init__(self, transforms_list):
         self.transforms = transforms_list
+        self.augmentations, self.tensor_params = self._compile(transforms_list)
     
-    def __call__(self, image):
-        for transform in self.transforms:
+    @staticmethod
+    def _resolve(transform):
+        if isinstance(transform, functools.partial) and not transform.args:
+            return transform.func, transform.keywords
+        return transform, {}
+
+    @staticmethod
+    def _compile(transforms_list):
+        steps = list(transforms_list)
+        mean, std = [0.0, 0.0, 0.0], [1.0, 1.0, 1.0]
+
+        if steps and CustomCompose._resolve(steps[-1])[0] is CustomTransforms.normalize:
+            if len(steps) < 2 or CustomCompose._resolve(steps[-2]) != (CustomTransforms.to_tensor, {}):
+                return steps, None
+            kwargs = CustomCompose._resolve(steps.pop())[1]
+            mean = kwargs.get('mean', [0.5, 0.5, 0.5])
+            std = kwargs.get('std', [0.5, 0.5, 0.5])
+
+        if not steps or CustomCompose._resolve(steps[-1]) != (CustomTransforms.to_tensor, {}):
+            return steps, None
+        steps.pop()
+
+        # Fold /255, -mean and /std into a single scale and bias per channel
+        mean = np.asarray(mean, dtype=np.float32)
+        std = np.asarray(std, dtype=np.float32)
+        scale = (1.0 / (255.0 * std)).reshape(-1, 1, 1)
+        bias = (-mean / std).reshape(-1, 1, 1)
+        return steps, (scale, bias)
+
+    def __call__(self, image, out=None):
+        for transform in self.augmentations:
             image = transform(image)
-        return image
 
+        if self.tensor_params is None:
+            if out is not None:
+                np.copyto(out, image)
+                return out
+            return image
+
+        image = CustomTransforms._chw_uint8(image)
+        scale, bias = self.tensor_params
+        if image.shape[0] == 1:
+            scale, bias = scale[0:1], bias[0:1]
+        if out is None:
+            out = np.empty(image.shape, dtype=np.float32)
+        np.multiply(image, scale, out=out)
+        out += bias
+        return out
+
+GRAY_WEIGHTS = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+RGB_TO_YIQ = np.array([
+    [0.299, 0.587, 0.114],
+    [0.596, -0.274, -0.322],
+    [0.211, -0.523, 0.312]
+], dtype=np.float32)
+YIQ_TO_RGB = np.linalg.inv(RGB_TO_YIQ).astype(np.float32)
+
+class BatchTransforms:
+    """
+    Batch-first counterparts of CustomTransforms for (N, H, W, C) uint8 arrays.
+    Random parameters are drawn per sample from a numpy Generator; flips and
+    color jitter modify the batch in place.
+    """
+
+    @staticmethod
+    def resize(images, size=(160, 160), out=None):
+        n, channels = images.shape[0], images.shape[3]
+        if images.shape[1:3] == (size[1], size[0]):
+            return images
+        if out is None:
+            out = np.empty((n, size[1], size[0], channels), dtype=np.uint8)
+        for i in range(n):
+            out[i] = np.asarray(Image.fromarray(images[i]).resize(size, Image.LANCZOS))
+        return out
+
+    @staticmethod
+    def random_horizontal_flip(images, p=0.5, rng=None):
+        rng = rng if rng is not None else np.random.default_rng()
+        flip = rng.random(images.shape[0]) < p
+        if flip.any():
+            images[flip] = images[flip, :, ::-1]
+        return images
+
+    @staticmethod
+    def random_rotation(images, degrees=10, rng=None, fill=0, out=None):
+        """Rotate every image by its own random angle (nearest neighbour, like PIL's rotate)"""
+        rng = rng if rng is not None else np.random.default_rng()
+        n, height, width = images.shape[:3]
+        theta = np.deg2rad(rng.uniform(-degrees, degrees, n)).astype(np.float32)
+        cos = np.cos(theta)[:, None, None]
+        sin = np.sin(theta)[:, None, None]
+
+        center_y, center_x = height / 2.0, width / 2.0
+        ys, xs = np.mgrid[0:height, 0:width].astype(np.float32)
+        ys = ys + 0.5 - center_y
+        xs = xs + 0.5 - center_x
+
+        # Inverse mapping: for each output pixel, find the source pixel
+        src_x = np.floor(cos * xs - sin * ys + center_x).astype(np.intp)
+        src_y = np.floor(sin * xs + cos * ys + center_y).astype(np.intp)
+        valid = (src_x >= 0) & (src_x < width) & (src_y >= 0) & (src_y < height)
+        np.clip(src_x, 0, width - 1, out=src_x)
+        np.clip(src_y, 0, height - 1, out=src_y)
+
+        flat_index = (np.arange(n, dtype=np.intp)[:, None, None] * height + src_y) * width + src_x
+        if out is None:
+            out = np.empty_like(images)
+        np.take(np.ascontiguousarray(images).reshape(-1, images.shape[3]), flat_index, axis=0, out=out)
+        out[~valid] = fill
+        return out
+
+    @staticmethod
+    def color_jitter(images, brightness=0.2, contrast=0.2, saturation=0.2, hue=0.1, rng=None, work=None):
+        """
+        Brightness/contrast/saturation/hue jitter with per-sample factors, applied
+        in the same order as CustomTransforms.color_jitter. Hue is a rotation of
+        the chroma plane in YIQ space by up to hue * 360 degrees.
+        """
+        rng = rng if rng is not None else np.random.default_rng()
+        n = images.shape[0]
+        if work is None:
+            work = np.empty(images.shape, dtype=np.float32)
+        np.copyto(work, images, casting='unsafe')
+
+        if brightness > 0:
+            factors = rng.uniform(max(0, 1 - brightness), 1 + brightness, n).astype(np.float32)
+            work *= factors[:, None, None, None]
+            np.clip(work, 0, 255, out=work)
+
+        if contrast > 0:
+            factors = rng.uniform(max(0, 1 - contrast), 1 + contrast, n).astype(np.float32)[:, None, None, None]
+            means = (work @ GRAY_WEIGHTS).mean(axis=(1, 2))[:, None, None, None]
+            work -= means
+            work *= factors
+            work += means
+            np.clip(work, 0, 255, out=work)
+
+        if saturation > 0:
+            factors = rng.uniform(max(0, 1 - saturation), 1 + saturation, n).astype(np.float32)[:, None, None, None]
+            gray = (work @ GRAY_WEIGHTS)[..., None]
+            work -= gray
+            work *= factors
+            work += gray
+            np.clip(work, 0, 255, out=work)
+
+        if hue > 0:
+            angles = rng.uniform(-hue, hue, n).astype(np.float32) * 2 * np.pi
+            cos, sin = np.cos(angles), np.sin(angles)
+            rotations = np.zeros((n, 3, 3), dtype=np.float32)
+            rotations[:, 0, 0] = 1
+            rotations[:, 1, 1] = cos
+            rotations[:, 1, 2] = -sin
+            rotations[:, 2, 1] = sin
+            rotations[:, 2, 2] = cos
+            matrices = YIQ_TO_RGB @ rotations @ RGB_TO_YIQ
+            work[...] = np.einsum('nhwc,ndc->nhwd', work, matrices, optimize=True)
+            np.clip(work, 0, 255, out=work)
+
+        np.rint(work, out=work)
+        np.copyto(images, work, casting='unsafe')
+        return images
+
+    @staticmethod
+    def to_tensor_normalize(images, mean=(0.5, 0.5, 0.5), std=(0.5, 0.5, 0.5), out=None):
+        """Fused to_tensor + normalize: (N, H, W, C) uint8 -> (N, C, H, W) float32"""
+        n, height, width, channels = images.shape
+        mean = np.asarray(mean, dtype=np.float32)[:channels]
+        std = np.asarray(std, dtype=np.float32)[:channels]
+        scale = (1.0 / (255.0 * std)).reshape(1, channels, 1, 1)
+        bias = (-mean / std).reshape(1, channels, 1, 1)
+
+        if out is None:
+            out = np.empty((n, channels, height, width), dtype=np.float32)
+        np.multiply(images.transpose(0, 3, 1, 2), scale, out=out)
+        out += bias
+        return out
+
+def _accepts_rng(transform):
+    try:
+        parameters = inspect.signature(transform).parameters.values()
+    except (TypeError, ValueError):
+        return False
+    return any(parameter.name == 'rng' or parameter.kind is inspect.Parameter.VAR_KEYWORD for parameter in parameters)
+
+class BatchCompose:
+    """
+    Applies batch transforms in order, sharing one seeded numpy Generator.
+    Transforms that take an rng argument are called as
+    transform(images, rng=generator), the rest as transform(images), so any
+    BatchTransforms method can be listed directly; non-default arguments go
+    through a lambda or functools.partial.
+    """
+
+    def __init__(self, transforms_list, seed=None):
+        self.transforms = transforms_list
+        self.rng = np.random.default_rng(seed)
+        self._takes_rng = [_accepts_rng(transform) for transform in transforms_list]
+
+    def __call__(self, images):
+        for transform, takes_rng in zip(self.transforms, self._takes_rng):
+            images = transform(images, rng=self.rng) if takes_rng else transform(images)
+        return images
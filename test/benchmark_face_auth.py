@@ -0,0 +1,398 @@
+"""
+Load test and benchmark for the face verification API.
+
+Usage:
+    # 1. Synthetic storage fixture (one folder per user in the images bucket)
+    python benchmark_face_auth.py prepare ./bench_storage --users 20 --images_per_user 8
+
+    # 2. Serve it as Supabase storage and point the API at it
+    python storage_stub.py ./bench_storage --port 8000 --latency_ms 20
+    SUPABASE_URL=http://127.0.0.1:8000 gunicorn --config gunicorn.conf.py
+
+    # 3. Drive load and write a result file
+    python benchmark_face_auth.py run ./bench_storage --concurrency 8 --duration 60 \\
+        --mix compare=0.5,batch_compare=0.2,verify_user=0.3 --output results.json
+
+    # 4. Diff against a run from another commit (non-zero exit on regression)
+    python benchmark_face_auth.py compare results_main.json results.json --tolerance 0.1
+
+run also accepts --serve_storage to start the storage stub in-process. Load
+is closed-loop: each of the concurrency threads sends its next request as soon
+as the previous one returns, so throughput is what the server sustains at that
+concurrency. Requests during --warmup seconds are sent but not recorded.
+"""
+import os
+import sys
+import json
+import time
+import base64
+import random
+import argparse
+import platform
+import subprocess
+import threading
+from typing import Dict, List, Any, Optional, Tuple
+
+import numpy as np
+import requests
+from PIL import Image
+
+BUCKET_NAME = "images"
+ENDPOINTS = ("compare", "batch_compare", "verify_user")
+DEFAULT_MIX = "compare=0.5,batch_compare=0.2,verify_user=0.3"
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+# Compared between result files; throughput is higher-is-better, latencies lower-is-better
+COMPARED_METRICS = ("p50_ms", "p95_ms", "p99_ms", "throughput_rps")
+
+def parse_size(text: str) -> Tuple[int, int]:
+    width, height = text.lower().split('x')
+    return int(width), int(height)
+
+def parse_mix(text: str) -> Dict[str, float]:
+    mix = {}
+    for part in text.split(','):
+        name, weight = part.split('=')
+        if name not in ENDPOINTS:
+            raise ValueError(f"Unknown endpoint '{name}' in mix, expected one of {ENDPOINTS}")
+        mix[name] = float(weight)
+    if sum(mix.values()) <= 0:
+        raise ValueError("Mix weights must add up to more than zero")
+    return mix
+
+def synthetic_face_photo(rng: np.random.Generator, size: Tuple[int, int], base: np.ndarray) -> Image.Image:
+    """
+    Smooth camera-like frame: a per-user low-frequency pattern plus per-shot
+    lighting and noise, so JPEGs compress and decode like photos rather than
+    flat test cards
+    """
+    shot = base * rng.uniform(0.8, 1.2) + rng.normal(0, 12, base.shape)
+    small = Image.fromarray(np.clip(shot, 0, 255).astype(np.uint8))
+    return small.resize(size, Image.BICUBIC)
+
+def prepare_storage(storage_dir: str, users: int, images_per_user: int, sizes: List[Tuple[int, int]],
+                    source_dir: Optional[str] = None, seed: int = 0, quality: int = 90):
+    """Write <storage_dir>/images/<user>/<n>.jpg, from source_dir (one folder per person) or synthetic photos"""
+    rng = np.random.default_rng(seed)
+    bucket_dir = os.path.join(storage_dir, BUCKET_NAME)
+
+    sources = []
+    if source_dir:
+        for person in sorted(os.listdir(source_dir)):
+            person_dir = os.path.join(source_dir, person)
+            if os.path.isdir(person_dir):
+                files = [os.path.join(person_dir, name) for name in sorted(os.listdir(person_dir))
+                         if name.lower().endswith(IMAGE_EXTENSIONS)]
+                if files:
+                    sources.append(files)
+        if not sources:
+            print(f"⚠️ No images found in {source_dir}, using synthetic photos")
+
+    total = 0
+    for user_index in range(users):
+        user_dir = os.path.join(bucket_dir, f"bench_user_{user_index:04d}")
+        os.makedirs(user_dir, exist_ok=True)
+        base = rng.uniform(30, 220, (24, 32, 3))
+        for image_index in range(images_per_user):
+            size = sizes[(user_index + image_index) % len(sizes)]
+            if sources:
+                files = sources[user_index % len(sources)]
+                with Image.open(files[image_index % len(files)]) as img:
+                    image = img.convert('RGB').resize(size, Image.BICUBIC)
+            else:
+                image = synthetic_face_photo(rng, size, base)
+            image.save(os.path.join(user_dir, f"{image_index:03d}.jpg"), quality=quality)
+            total += 1
+
+    print(f"✅ Wrote {total} images for {users} users to {bucket_dir}")
+
+def load_fixture(storage_dir: str, max_users: int = 200) -> Dict[str, List[str]]:
+    """Base64 payloads per user, encoded once up front so the client does not compete for CPU"""
+    bucket_dir = os.path.join(storage_dir, BUCKET_NAME)
+    payloads = {}
+    for user_id in sorted(os.listdir(bucket_dir))[:max_users]:
+        user_dir = os.path.join(bucket_dir, user_id)
+        if not os.path.isdir(user_dir):
+            continue
+        images = []
+        for name in sorted(os.listdir(user_dir)):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                with open(os.path.join(user_dir, name), 'rb') as f:
+                    images.append(base64.b64encode(f.read()).decode())
+        if images:
+            payloads[user_id] = images
+    return payloads
+
+class RequestFactory:
+    """Builds (endpoint, payload) requests from the fixture images"""
+
+    def __init__(self, payloads: Dict[str, List[str]], batch_pairs: int = 16, verify_images: int = 1,
+                 min_verification_images: int = 4):
+        self.payloads = payloads
+        self.user_ids = sorted(payloads)
+        self.all_images = [image for user_id in self.user_ids for image in payloads[user_id]]
+        self.batch_pairs = batch_pairs
+        self.verify_images = verify_images
+        self.min_verification_images = min_verification_images
+
+    def _pair(self, rng: random.Random) -> Dict[str, str]:
+        # Half genuine pairs (same user), half impostor pairs
+        if rng.random() < 0.5:
+            images = self.payloads[rng.choice(self.user_ids)]
+            return {"image1": rng.choice(images), "image2": rng.choice(images)}
+        return {"image1": rng.choice(self.all_images), "image2": rng.choice(self.all_images)}
+
+    def build(self, endpoint: str, rng: random.Random) -> Dict[str, Any]:
+        if endpoint == "compare":
+            return self._pair(rng)
+        if endpoint == "batch_compare":
+            return {"pairs": [self._pair(rng) for _ in range(self.batch_pairs)]}
+        user_id = rng.choice(self.user_ids)
+        images = self.payloads[user_id]
+        return {
+            "userId": user_id,
+            "images": [rng.choice(images) for _ in range(self.verify_images)],
+            "min_verification_images": min(self.min_verification_images, len(images))
+        }
+
+def percentile(sorted_values: List[float], q: float) -> Optional[float]:
+    """Linear-interpolated percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    position = (len(sorted_values) - 1) * q / 100.0
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+def summarize(samples: List[Tuple[float, int, bool]], elapsed_s: float) -> Dict[str, Any]:
+    """Latency percentiles over successful requests, throughput and error counts"""
+    latencies = sorted(latency for latency, _, ok in samples if ok)
+    statuses = {}
+    for _, status, _ in samples:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    errors = len(samples) - len(latencies)
+    rounded = lambda value: round(value, 2) if value is not None else None
+    return {
+        "requests": len(samples),
+        "errors": errors,
+        "error_rate": round(errors / len(samples), 4) if samples else 0.0,
+        "statuses": statuses,
+        "throughput_rps": round(len(latencies) / elapsed_s, 2) if elapsed_s > 0 else 0.0,
+        "mean_ms": rounded(sum(latencies) / len(latencies)) if latencies else None,
+        "p50_ms": rounded(percentile(latencies, 50)),
+        "p95_ms": rounded(percentile(latencies, 95)),
+        "p99_ms": rounded(percentile(latencies, 99)),
+        "max_ms": rounded(latencies[-1]) if latencies else None
+    }
+
+def run_load(base_url: str, factory: RequestFactory, mix: Dict[str, float], concurrency: int,
+             duration_s: float, warmup_s: float, max_requests: Optional[int] = None,
+             timeout: float = 60.0, seed: int = 0) -> Tuple[Dict[str, List[Tuple[float, int, bool]]], float]:
+    """Closed-loop load: every thread sends its next request when the previous one returns"""
+    endpoints = list(mix)
+    weights = [mix[name] for name in endpoints]
+    samples = {name: [] for name in endpoints}
+    samples_lock = threading.Lock()
+    recorded = [0]
+
+    started = time.perf_counter()
+    measure_from = started + warmup_s
+    stop_at = measure_from + duration_s
+
+    def worker(worker_id: int):
+        rng = random.Random(seed * 1000 + worker_id)
+        session = requests.Session()
+        while time.perf_counter() < stop_at:
+            endpoint = rng.choices(endpoints, weights)[0]
+            payload = factory.build(endpoint, rng)
+            request_started = time.perf_counter()
+            try:
+                response = session.post(f"{base_url}/{endpoint}", json=payload, timeout=timeout)
+                status = response.status_code
+                ok = status == 200
+            except requests.RequestException:
+                status, ok = 0, False
+            latency_ms = (time.perf_counter() - request_started) * 1000.0
+
+            if request_started < measure_from:
+                continue
+            with samples_lock:
+                if max_requests is not None and recorded[0] >= max_requests:
+                    return
+                recorded[0] += 1
+                samples[endpoint].append((latency_ms, status, ok))
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    elapsed_s = max(1e-9, min(time.perf_counter(), stop_at) - measure_from)
+    return samples, elapsed_s
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except Exception:
+        return None
+
+def server_info(base_url: str) -> Dict[str, Any]:
+    """Serving configuration from /health, recorded so result files are comparable"""
+    try:
+        health = requests.get(f"{base_url}/health", timeout=10).json()
+    except Exception as e:
+        return {"error": str(e)}
+    keys = ("inference_backend", "model_artifact", "device", "torch_threads", "pytorch_version")
+    info = {key: health.get(key) for key in keys}
+    info["micro_batching"] = health.get("inference_batcher") is not None
+    info["face_detection"] = (health.get("face_detection") or {}).get("enabled")
+    return info
+
+def compare_results(baseline: Dict[str, Any], current: Dict[str, Any], tolerance: float) -> List[str]:
+    """Print a per-endpoint diff and return the regressions beyond tolerance"""
+    regressions = []
+    for key in ("concurrency", "mix", "batch_pairs", "verify_images", "server"):
+        if baseline["meta"].get(key) != current["meta"].get(key):
+            print(f"⚠️ Runs differ in {key}: {baseline['meta'].get(key)} vs {current['meta'].get(key)}")
+    print(f"{'endpoint':<15} {'metric':<15} {'baseline':>10} {'current':>10} {'change':>9}")
+    for endpoint in sorted(set(baseline["endpoints"]) & set(current["endpoints"])):
+        for metric in COMPARED_METRICS:
+            old = baseline["endpoints"][endpoint].get(metric)
+            new = current["endpoints"][endpoint].get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            worse = -change if metric == "throughput_rps" else change
+            flag = ""
+            if worse > tolerance:
+                flag = " ❌"
+                regressions.append(f"{endpoint} {metric}: {old} -> {new} ({change:+.1%})")
+            print(f"{endpoint:<15} {metric:<15} {old:>10} {new:>10} {change:>+8.1%}{flag}")
+    return regressions
+
+def print_report(results: Dict[str, Any]):
+    print(f"{'endpoint':<15} {'requests':>8} {'errors':>7} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    rows = list(results["endpoints"].items()) + [("overall", results["overall"])]
+    for name, stats in rows:
+        cells = [stats[key] if stats[key] is not None else '-' for key in ("p50_ms", "p95_ms", "p99_ms", "max_ms")]
+        print(f"{name:<15} {stats['requests']:>8} {stats['errors']:>7} {stats['throughput_rps']:>8} "
+              f"{cells[0]:>9} {cells[1]:>9} {cells[2]:>9} {cells[3]:>9}")
+
+def run_benchmark(args) -> int:
+    base_url = args.url.rstrip('/')
+    stub = None
+    if args.serve_storage:
+        from storage_stub import start_storage_stub
+        stub = start_storage_stub(args.storage_dir, args.storage_port, args.storage_latency_ms)
+        print(f"Storage stub serving {args.storage_dir} on http://127.0.0.1:{stub.server_address[1]}")
+
+    try:
+        payloads = load_fixture(args.storage_dir, args.max_users)
+        if not payloads:
+            print(f"Error: no fixture images in {args.storage_dir}; run 'prepare' first")
+            return 1
+
+        mix = parse_mix(args.mix)
+        factory = RequestFactory(payloads, args.batch_pairs, args.verify_images)
+        print(f"Benchmarking {base_url}: concurrency {args.concurrency}, {args.duration}s after {args.warmup}s warm-up, mix {mix}")
+
+        samples, elapsed_s = run_load(base_url, factory, mix, args.concurrency, args.duration, args.warmup,
+                                      args.requests, args.timeout, args.seed)
+    finally:
+        if stub is not None:
+            stub.shutdown()
+
+    results = {
+        "meta": {
+            "timestamp": time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            "git_commit": git_commit(),
+            "url": base_url,
+            "concurrency": args.concurrency,
+            "duration_s": round(elapsed_s, 2),
+            "warmup_s": args.warmup,
+            "mix": mix,
+            "batch_pairs": args.batch_pairs,
+            "verify_images": args.verify_images,
+            "fixture_users": len(payloads),
+            "seed": args.seed,
+            "client": {"python": platform.python_version(), "host": platform.node()},
+            "server": server_info(base_url)
+        },
+        "endpoints": {name: summarize(endpoint_samples, elapsed_s) for name, endpoint_samples in samples.items()},
+        "overall": summarize([sample for endpoint_samples in samples.values() for sample in endpoint_samples], elapsed_s)
+    }
+
+    print_report(results)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        print(f"\nCompared with {args.baseline} (commit {baseline['meta'].get('git_commit')}):")
+        regressions = compare_results(baseline, results, args.tolerance)
+        if regressions:
+            print(f"\n❌ {len(regressions)} regressions beyond {args.tolerance:.0%}")
+            return 1
+    return 0
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test and benchmark the face verification API")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    prepare = subparsers.add_parser("prepare", help="Write a storage fixture for the storage stub")
+    prepare.add_argument("storage_dir", help="Fixture root; images go to <storage_dir>/images/<user>/")
+    prepare.add_argument("--users", type=int, default=20, help="Number of users (default: 20)")
+    prepare.add_argument("--images_per_user", type=int, default=8, help="Images per user (default: 8)")
+    prepare.add_argument("--sizes", default="640x480,1280x960", help="Image sizes, cycled (default: 640x480,1280x960)")
+    prepare.add_argument("--source_dir", help="Real photos, one folder per person, instead of synthetic images")
+    prepare.add_argument("--seed", type=int, default=0, help="Random seed (default: 0)")
+
+    run = subparsers.add_parser("run", help="Drive load against a running API")
+    run.add_argument("storage_dir", help="Fixture written by 'prepare' (also the source of request images)")
+    run.add_argument("--url", default="http://localhost:9002", help="API base URL (default: http://localhost:9002)")
+    run.add_argument("--concurrency", type=int, default=4, help="Concurrent clients (default: 4)")
+    run.add_argument("--duration", type=float, default=30.0, help="Measured seconds (default: 30)")
+    run.add_argument("--warmup", type=float, default=5.0, help="Unrecorded warm-up seconds (default: 5)")
+    run.add_argument("--requests", type=int, help="Stop after this many recorded requests")
+    run.add_argument("--mix", default=DEFAULT_MIX, help=f"Endpoint weights (default: {DEFAULT_MIX})")
+    run.add_argument("--batch_pairs", type=int, default=16, help="Pairs per /batch_compare request (default: 16)")
+    run.add_argument("--verify_images", type=int, default=1, help="Probe images per /verify_user request (default: 1)")
+    run.add_argument("--max_users", type=int, default=200, help="Fixture users to draw from (default: 200)")
+    run.add_argument("--timeout", type=float, default=60.0, help="Per-request timeout in seconds (default: 60)")
+    run.add_argument("--seed", type=int, default=0, help="Random seed for the request sequence (default: 0)")
+    run.add_argument("--output", help="Write results as JSON to this file")
+    run.add_argument("--baseline", help="Result file to compare against; exits non-zero on regression")
+    run.add_argument("--tolerance", type=float, default=0.10, help="Allowed relative slowdown (default: 0.10)")
+    run.add_argument("--serve_storage", action="store_true", help="Serve storage_dir with the storage stub in-process")
+    run.add_argument("--storage_port", type=int, default=8000, help="Port for --serve_storage (default: 8000)")
+    run.add_argument("--storage_latency_ms", type=float, default=0.0, help="Stub latency per request (default: 0)")
+
+    compare = subparsers.add_parser("compare", help="Diff two result files")
+    compare.add_argument("baseline", help="Earlier result file")
+    compare.add_argument("current", help="Newer result file")
+    compare.add_argument("--tolerance", type=float, default=0.10, help="Allowed relative slowdown (default: 0.10)")
+
+    args = parser.parse_args()
+
+    if args.command == "prepare":
+        prepare_storage(args.storage_dir, args.users, args.images_per_user,
+                        [parse_size(size) for size in args.sizes.split(',')], args.source_dir, args.seed)
+    elif args.command == "run":
+        sys.exit(run_benchmark(args))
+    else:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        with open(args.current, 'r') as f:
+            current = json.load(f)
+        regressions = compare_results(baseline, current, args.tolerance)
+        if regressions:
+            print(f"\n❌ {len(regressions)} regressions beyond {args.tolerance:.0%}")
+            sys.exit(1)
+        print("\n✅ No regressions")
+
+if __name__ == "__main__":
+    main()
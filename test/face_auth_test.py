@@ -81,6 +81,26 @@ class APITester:
         except Exception as e:
             self.log_test("Model Info", False, f"Exception: {str(e)}")
     
+    def test_metrics_endpoint(self):
+        """Test the /metrics endpoint"""
+        try:
+            response = self.session.get(f"{self.base_url}/metrics", timeout=10)
+            
+            if response.status_code == 200:
+                required_metrics = ['face_auth_requests_total', 'face_auth_stage_duration_seconds']
+                missing_metrics = [name for name in required_metrics if f"# TYPE {name}" not in response.text]
+                
+                if not missing_metrics:
+                    samples = [line for line in response.text.splitlines() if line and not line.startswith('#')]
+                    self.log_test("Metrics", True, f"{len(samples)} samples exported")
+                else:
+                    self.log_test("Metrics", False, f"Missing metrics: {missing_metrics}")
+            else:
+                self.log_test("Metrics", False, f"Status code: {response.status_code}", response.text)
+                
+        except Exception as e:
+            self.log_test("Metrics", False, f"Exception: {str(e)}")
+    
     def test_compare_endpoint(self):
         """Test the /compare endpoint"""
         try:
@@ -115,6 +135,37 @@ class APITester:
         except Exception as e:
             self.log_test("Compare Faces", False, f"Exception: {str(e)}")
     
+    def test_compare_multipart_endpoint(self):
+        """Test the /compare endpoint with raw image uploads (multipart/form-data)"""
+        try:
+            img1 = base64.b64decode(self.create_test_image((640, 480), (255, 0, 0)).split(',')[1])
+            img2 = base64.b64decode(self.create_test_image((640, 480), (0, 255, 0)).split(',')[1])
+            
+            files = {
+                "image1": ("image1.png", img1, "image/png"),
+                "image2": ("image2.png", img2, "image/png")
+            }
+            response = self.session.post(f"{self.base_url}/compare", 
+                                       files=files, data={"threshold": "0.6"}, timeout=30)
+            
+            if response.status_code == 200:
+                data = response.json()
+                required_fields = ['match', 'similarity_score', 'confidence', 'model_type']
+                missing_fields = [field for field in required_fields if field not in data]
+                
+                if not missing_fields:
+                    self.log_test("Compare Faces (multipart)", True, 
+                                f"Match: {data.get('match')}, Score: {data.get('similarity_score'):.3f}")
+                else:
+                    self.log_test("Compare Faces (multipart)", False, f"Missing fields: {missing_fields}", data)
+            elif response.status_code == 503:
+                self.log_test("Compare Faces (multipart)", False, "Model not loaded (503)", response.json())
+            else:
+                self.log_test("Compare Faces (multipart)", False, f"Status code: {response.status_code}", response.text)
+                
+        except Exception as e:
+            self.log_test("Compare Faces (multipart)", False, f"Exception: {str(e)}")
+    
     def test_compare_invalid_data(self):
         """Test /compare endpoint with invalid data"""
         try:
@@ -200,8 +251,62 @@ class APITester:
         except Exception as e:
             self.log_test("Verify User", False, f"Exception: {str(e)}")
     
+    def test_enroll_endpoint(self):
+        """Test the /enroll endpoint (will likely fail without proper setup)"""
+        try:
+            payload = {
+                "userId": "test_user_123",
+                "max_references": 5,
+                "min_references": 1
+            }
+            
+            response = self.session.post(f"{self.base_url}/enroll", 
+                                       json=payload, timeout=60)
+            
+            if response.status_code == 200:
+                data = response.json()
+                self.log_test("Enroll User", True, 
+                            f"Selected {data['references_selected']} references, rejected {len(data['rejected_files'])}")
+            elif response.status_code == 404:
+                self.log_test("Enroll User", True, 
+                            "Expected failure - no usable reference images found (404)")
+            elif response.status_code == 503:
+                self.log_test("Enroll User", False, "Service unavailable (503)", response.json())
+            else:
+                self.log_test("Enroll User", False, f"Status code: {response.status_code}", response.text)
+                
+        except Exception as e:
+            self.log_test("Enroll User", False, f"Exception: {str(e)}")
+    
+    def test_identify_endpoint(self):
+        """Test the /identify endpoint (needs enrolled users in the gallery)"""
+        try:
+            payload = {
+                "image": self.create_test_image(),
+                "top_k": 3
+            }
+            
+            response = self.session.post(f"{self.base_url}/identify", 
+                                       json=payload, timeout=30)
+            
+            if response.status_code == 200:
+                data = response.json()
+                candidates = data['results'][0]['candidates'] if data['results'] else []
+                self.log_test("Identify Face", True, 
+                            f"Identified: {data['identified_user']}, {len(candidates)} candidates from {data['index']['users']} users")
+            elif response.status_code == 404:
+                self.log_test("Identify Face", True, 
+                            "Expected failure - no enrolled users in the index (404)")
+            elif response.status_code == 503:
+                self.log_test("Identify Face", False, "Service unavailable (503)", response.json())
+            else:
+                self.log_test("Identify Face", False, f"Status code: {response.status_code}", response.text)
+                
+        except Exception as e:
+            self.log_test("Identify Face", False, f"Exception: {str(e)}")
+    
     def test_performance(self):
-        """Test API response times"""
+        """Test API response times (single-request smoke check; see benchmark_face_auth.py for load tests)"""
         try:
             start_time = time.time()
             response = self.session.get(f"{self.base_url}/health", timeout=5)
@@ -248,11 +353,13 @@ class APITester:
         print("-" * 30)
         self.test_health_endpoint()
         self.test_model_info_endpoint()
+        self.test_metrics_endpoint()
         
         # Core functionality tests
         print("🧠 CORE FUNCTIONALITY TESTS")
         print("-" * 30)
         self.test_compare_endpoint()
+        self.test_compare_multipart_endpoint()
         self.test_batch_compare_endpoint()
         
         # Error handling tests
@@ -263,7 +370,9 @@ class APITester:
         # Integration tests (may fail without proper setup)
         print("🔗 INTEGRATION TESTS")
         print("-" * 30)
+        self.test_enroll_endpoint()
         #self.test_verify_user_endpoint()
+        self.test_identify_endpoint()
         
         # Performance tests
         print("⚡ PERFORMANCE TESTS")
@@ -303,7 +412,7 @@ def main():
     parser = argparse.ArgumentParser(description='Test Face Verification API')
     parser.add_argument('--url', default='http://localhost:9002', 
                        help='Base URL of the API (default: http://localhost:9002)')
-    parser.add_argument('--test', choices=['health', 'compare', 'batch', 'verify', 'all'],
+    parser.add_argument('--test', choices=['health', 'compare', 'batch', 'verify', 'enroll', 'identify', 'all'],
                        default='all', help='Specific test to run')
     
     args = parser.parse_args()
@@ -314,10 +423,11 @@ def main():
         tester.run_all_tests()
     elif args.test == 'health':
         tester.test_health_endpoint()
+        tester.test_metrics_endpoint()
         tester.print_summary()
     elif args.test == 'compare':
         tester.test_compare_endpoint()
-        tester.test_direct_compare_endpoint()
+        tester.test_compare_multipart_endpoint()
         tester.print_summary()
     elif args.test == 'batch':
         tester.test_batch_compare_endpoint()
@@ -325,6 +435,12 @@ def main():
     elif args.test == 'verify':
         tester.test_verify_user_endpoint()
         tester.print_summary()
+    elif args.test == 'enroll':
+        tester.test_enroll_endpoint()
+        tester.print_summary()
+    elif args.test == 'identify':
+        tester.test_identify_endpoint()
+        tester.print_summary()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,123 @@
+import os
+import json
+import time
+import hashlib
+import argparse
+import threading
+from datetime import datetime, timezone
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import unquote
+
+class StorageStubHandler(BaseHTTPRequestHandler):
+    """
+    Minimal stand-in for the Supabase storage API, serving buckets from a local directory.
+    Layout: <root>/<bucket>/<folder>/<file>. Implements the two calls the face
+    auth API makes: POST /storage/v1/object/list/<bucket> and
+    GET /storage/v1/object/<bucket>/<path>.
+    """
+
+    root_dir = "."
+    latency_ms = 0.0
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _simulate_latency(self):
+        if self.latency_ms > 0:
+            time.sleep(self.latency_ms / 1000.0)
+
+    def do_POST(self):
+        prefix = "/storage/v1/object/list/"
+        if not self.path.startswith(prefix):
+            self._send_json({"error": "not found"}, 404)
+            return
+
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        bucket = unquote(self.path[len(prefix):])
+        folder = os.path.join(self.root_dir, bucket, body.get("prefix", "").strip("/"))
+
+        self._simulate_latency()
+        if not os.path.isdir(folder):
+            self._send_json([])
+            return
+
+        entries = []
+        for entry in sorted(os.scandir(folder), key=lambda e: e.name):
+            if entry.is_dir():
+                entries.append({"name": entry.name, "id": None, "updated_at": None, "metadata": None})
+                continue
+            stat = entry.stat()
+            modified = datetime.fromtimestamp(stat.st_mtime, tz=timezone.utc).isoformat()
+            entries.append({
+                "name": entry.name,
+                "id": hashlib.md5(entry.path.encode()).hexdigest(),
+                "updated_at": modified,
+                "created_at": modified,
+                "metadata": {
+                    "eTag": f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"',
+                    "size": stat.st_size,
+                    "lastModified": modified
+                }
+            })
+
+        offset = int(body.get("offset", 0))
+        limit = int(body.get("limit", 100))
+        self._send_json(entries[offset:offset + limit])
+
+    def do_GET(self):
+        prefix = "/storage/v1/object/"
+        if not self.path.startswith(prefix):
+            self._send_json({"error": "not found"}, 404)
+            return
+
+        file_path = os.path.normpath(os.path.join(self.root_dir, unquote(self.path[len(prefix):])))
+        if not file_path.startswith(os.path.abspath(self.root_dir)) or not os.path.isfile(file_path):
+            self._send_json({"error": "Object not found"}, 404)
+            return
+
+        self._simulate_latency()
+        with open(file_path, "rb") as f:
+            data = f.read()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+def start_storage_stub(root_dir: str, port: int = 0, latency_ms: float = 0.0) -> ThreadingHTTPServer:
+    """Start the stub in a background thread; the bound port is server.server_address[1]"""
+    handler = type("ConfiguredStorageStubHandler", (StorageStubHandler,), {
+        "root_dir": os.path.abspath(root_dir),
+        "latency_ms": latency_ms
+    })
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for Supabase storage")
+    parser.add_argument("root_dir", help="Directory containing one subdirectory per bucket")
+    parser.add_argument("--port", type=int, default=8000, help="Port to listen on (default: 8000)")
+    parser.add_argument("--latency_ms", type=float, default=0.0, help="Artificial latency per request (default: 0)")
+    args = parser.parse_args()
+
+    server = start_storage_stub(args.root_dir, args.port, args.latency_ms)
+    print(f"Storage stub serving {args.root_dir} on http://127.0.0.1:{server.server_address[1]}")
+    print("Point the API at it with SUPABASE_URL=http://127.0.0.1:<port>")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,18 @@
+"""
+Unit tests for the face_auth modules; run with `python -m pytest test/unit`.
+Every persistent directory of the API is pointed at a scratch location
+before face_auth_api is imported, so the tests never touch /app/config.
+"""
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+FACE_AUTH_DIR = os.path.join(ROOT, 'extensions', 'face_auth')
+sys.path.insert(0, FACE_AUTH_DIR)
+sys.path.insert(0, os.path.join(FACE_AUTH_DIR, 'API'))
+
+_scratch = tempfile.mkdtemp(prefix='face_auth_unit_')
+os.environ.setdefault('FACE_AUTH_GALLERY_DIR', os.path.join(_scratch, 'gallery'))
+os.environ.setdefault('FACE_AUTH_INDEX_DIR', os.path.join(_scratch, 'vector_index'))
+os.environ.setdefault('FACE_AUTH_MICRO_BATCHING', '0')
@@ -0,0 +1,55 @@
+import json
+from PIL import Image
+from condensing_images import plan_sample, transfer_files, MANIFEST_NAME
+from image_dedup import ImageDeduplicator
+
+def make_images(folder, count):
+    folder.mkdir()
+    for i in range(count):
+        Image.new('RGB', (8, 8), (i * 10 % 256, 0, 0)).save(folder / f"frame_{i:03d}.png")
+    return folder
+
+def run(input_folder, output_folder, **kwargs):
+    jobs = plan_sample(input_folder, output_folder, **kwargs)
+    transfer_files(jobs)
+    return jobs
+
+def test_rerun_with_same_settings_resumes_selection(tmp_path):
+    input_folder = make_images(tmp_path / 'in', 20)
+    first = run(input_folder, tmp_path / 'out', num_images=5, seed=1)
+    # Without a seed a fresh draw would differ; the manifest keeps the first selection
+    assert run(input_folder, tmp_path / 'out', num_images=5, seed=1) == first
+
+def test_changed_settings_resample(tmp_path):
+    input_folder = make_images(tmp_path / 'in', 20)
+    output_folder = tmp_path / 'out'
+    run(input_folder, output_folder, num_images=5, seed=1)
+
+    jobs = run(input_folder, output_folder, num_images=8, seed=1)
+    assert len(jobs) == 8
+    assert len([path for path in output_folder.iterdir() if path.suffix == '.png']) == 8
+    with open(output_folder / MANIFEST_NAME) as f:
+        assert json.load(f)['parameters']['num_images'] == 8
+
+    jobs = run(input_folder, output_folder, num_images=3, seed=2)
+    assert len(jobs) == 3
+    assert len([path for path in output_folder.iterdir() if path.suffix == '.png']) == 3
+
+def test_changed_dedup_settings_resample(tmp_path):
+    input_folder = make_images(tmp_path / 'in', 10)
+    output_folder = tmp_path / 'out'
+    run(input_folder, output_folder, num_images=4, seed=1)
+    run(input_folder, output_folder, num_images=4, seed=1, deduplicator=ImageDeduplicator(max_distance=0))
+    with open(output_folder / MANIFEST_NAME) as f:
+        assert json.load(f)['parameters']['dedup'] == {"max_distance": 0, "algorithm": "dhash"}
+
+def test_manifest_without_settings_is_reused(tmp_path):
+    input_folder = make_images(tmp_path / 'in', 10)
+    output_folder = tmp_path / 'out'
+    first = run(input_folder, output_folder, num_images=4, seed=1)
+    with open(output_folder / MANIFEST_NAME) as f:
+        manifest = json.load(f)
+    del manifest['parameters']
+    with open(output_folder / MANIFEST_NAME, 'w') as f:
+        json.dump(manifest, f)
+    assert run(input_folder, output_folder, num_images=6, seed=3) == first
@@ -0,0 +1,93 @@
+import os
+import functools
+import numpy as np
+import pytest
+from PIL import Image
+from data_loader import SharedMemoryLoader
+from transformer import CustomCompose, CustomTransforms
+
+SAMPLE_SHAPE = (3, 16, 16)
+
+def make_images(folder, count):
+    rng = np.random.default_rng(0)
+    paths = []
+    for i in range(count):
+        path = os.path.join(folder, f"{i:03d}.png")
+        Image.fromarray(rng.integers(0, 256, (20, 24, 3), dtype=np.uint8)).save(path)
+        paths.append(path)
+    return paths, [i % 3 for i in range(count)]
+
+def augment(extra=None):
+    steps = [
+        functools.partial(CustomTransforms.resize, size=(16, 16)),
+        CustomTransforms.random_horizontal_flip,
+        CustomTransforms.random_rotation,
+        CustomTransforms.to_tensor,
+        CustomTransforms.normalize
+    ]
+    if extra is not None:
+        steps.insert(0, extra)
+    return CustomCompose(steps)
+
+def read_epoch(loader):
+    return [(images.numpy().copy(), labels.numpy().copy()) for images, labels in loader]
+
+def test_batches_do_not_depend_on_worker_count(tmp_path):
+    paths, labels = make_images(str(tmp_path), 10)
+    epochs = []
+    for num_workers in (1, 3):
+        with SharedMemoryLoader(paths, labels, augment(), batch_size=4, num_workers=num_workers,
+                                seed=11, sample_shape=SAMPLE_SHAPE) as loader:
+            epochs.append(read_epoch(loader))
+
+    single, multi = epochs
+    assert [len(batch[1]) for batch in single] == [4, 4, 2]
+    for (images_a, labels_a), (images_b, labels_b) in zip(single, multi):
+        assert np.array_equal(images_a, images_b)
+        assert np.array_equal(labels_a, labels_b)
+
+def test_early_break_reclaims_slots_and_close_releases_memory(tmp_path):
+    paths, labels = make_images(str(tmp_path), 12)
+    loader = SharedMemoryLoader(paths, labels, augment(), batch_size=2, num_workers=2, prefetch=1,
+                                seed=0, sample_shape=SAMPLE_SHAPE)
+    num_slots = len(loader._free_slots)
+    for _ in loader:
+        break
+    assert sorted(loader._free_slots) == list(range(num_slots))
+    assert len(read_epoch(loader)) == 6
+
+    names = [shm.name for shm in loader._shm]
+    loader.close()
+    assert all(not worker.is_alive() for worker in loader._workers)
+    assert all(not os.path.exists(os.path.join('/dev/shm', name.lstrip('/'))) for name in names)
+    with pytest.raises(RuntimeError):
+        iter(loader).__next__()
+
+def test_worker_exception_is_raised_in_the_parent(tmp_path):
+    paths, labels = make_images(str(tmp_path), 8)
+    Image.new('RGB', (20, 24)).save(paths[5])
+
+    def reject_blank(image):
+        if not np.asarray(image).any():
+            raise ValueError("blank image")
+        return image
+
+    with SharedMemoryLoader(paths, labels, augment(reject_blank), batch_size=2, num_workers=2,
+                            shuffle=False, sample_shape=SAMPLE_SHAPE) as loader:
+        with pytest.raises(RuntimeError, match="failed on batch 2(.|\n)*blank image"):
+            read_epoch(loader)
+        # Only that batch failed, so the loader stays usable
+        with pytest.raises(RuntimeError, match="failed on batch 2"):
+            read_epoch(loader)
+
+def test_dead_worker_raises_instead_of_hanging(tmp_path):
+    paths, labels = make_images(str(tmp_path), 8)
+
+    def die(image):
+        os._exit(3)
+
+    loader = SharedMemoryLoader(paths, labels, augment(die), batch_size=2, num_workers=2,
+                                sample_shape=SAMPLE_SHAPE)
+    with pytest.raises(RuntimeError, match="exit code 3"):
+        read_epoch(loader)
+    assert loader._closed
@@ -0,0 +1,87 @@
+import os
+import json
+import numpy as np
+from embedding_cache import DiskEmbeddingStore, EmbeddingCache
+
+def vector(value):
+    return np.full(512, value, dtype=np.float32)
+
+def test_puts_are_logged_without_rewriting_the_snapshot(tmp_path):
+    store = DiskEmbeddingStore(str(tmp_path), capacity=100)
+    store.flush_every = 4
+    snapshot = os.stat(store.index_path).st_mtime_ns
+    for i in range(10):
+        store.put(f"key{i}", vector(i))
+    store.flush()
+    assert os.stat(store.index_path).st_mtime_ns == snapshot
+
+    reopened = DiskEmbeddingStore(str(tmp_path), capacity=100)
+    assert len(reopened) == 10
+    assert reopened.get('key7')[0] == 7
+
+def test_ring_reuse_and_compaction(tmp_path):
+    store = DiskEmbeddingStore(str(tmp_path), capacity=8)
+    store.flush_every = 3
+    for i in range(20):
+        store.put(f"key{i}", vector(i))
+    store.flush()
+    # The log never grows past one snapshot's worth of slots
+    with open(store.log_path) as f:
+        assert len(f.readlines()) < 8
+
+    reopened = DiskEmbeddingStore(str(tmp_path), capacity=8)
+    assert len(reopened) == 8
+    assert reopened.get('key11') is None
+    assert reopened.get('key19')[0] == 19
+    reopened.put('key20', vector(20))
+    reopened.flush()
+    assert DiskEmbeddingStore(str(tmp_path), capacity=8).get('key12') is None
+
+def test_partial_log_line_is_dropped(tmp_path):
+    store = DiskEmbeddingStore(str(tmp_path), capacity=100)
+    store.put('a', vector(1))
+    store.flush()
+    with open(store.log_path, 'a') as f:
+        f.write('[5, "tru')
+
+    reopened = DiskEmbeddingStore(str(tmp_path), capacity=100)
+    assert len(reopened) == 1
+    reopened.put('b', vector(2))
+    reopened.flush()
+    assert DiskEmbeddingStore(str(tmp_path), capacity=100).get('b')[0] == 2
+
+def test_namespace_change_starts_empty(tmp_path):
+    store = DiskEmbeddingStore(str(tmp_path), capacity=100, namespace='model-a:draft')
+    store.put('a', vector(1))
+    store.flush()
+    assert len(DiskEmbeddingStore(str(tmp_path), capacity=100, namespace='model-a')) == 0
+    with open(os.path.join(tmp_path, 'index.json')) as f:
+        assert json.load(f)['namespace'] == 'model-a'
+
+def test_cache_spills_to_disk_and_bounds_memory(tmp_path):
+    cache = EmbeddingCache(max_entries=2, disk_dir=str(tmp_path), namespace='draft')
+    for i in range(4):
+        cache.put(f"key{i}", vector(i))
+    assert cache.stats()['entries'] == 2
+    assert cache.get('key0')[0] == 0
+    assert cache.stats()['disk_hits'] == 1
+    cache.flush()
+
+    restarted = EmbeddingCache(disk_dir=str(tmp_path), namespace='draft')
+    assert restarted.get('key3')[0] == 3
+    restarted.set_namespace('aligned+draft')
+    assert restarted.get('key3') is None
+
+def test_reused_slot_is_released_before_its_row_is_overwritten(tmp_path):
+    store = DiskEmbeddingStore(str(tmp_path), capacity=4)
+    for i in range(4):
+        store.put(f"key{i}", vector(i))
+    store.flush()
+
+    # Reuses key0's slot; the process then dies without flushing the new owner
+    store.put('key4', vector(4))
+    reopened = DiskEmbeddingStore(str(tmp_path), capacity=4)
+    assert reopened.get('key0') is None
+    assert reopened.get('key4') is None
+    assert reopened.get('key1')[0] == 1
+    assert len(reopened) == 3
@@ -0,0 +1,62 @@
+import json
+import numpy as np
+import enroll_all
+from enroll_all import EnrollmentCheckpoint, pre_embed_users
+
+def test_checkpoint_round_trip(tmp_path):
+    path = str(tmp_path / 'checkpoint.json')
+    checkpoint = EnrollmentCheckpoint(path, 'references', save_every=2)
+    checkpoint.record('alice', 'enrolled', references=5)
+    checkpoint.record('bob', 'failed', error='timeout')
+    # save_every reached, so the file already exists without an explicit save
+    with open(path) as f:
+        assert set(json.load(f)['users']) == {'alice', 'bob'}
+
+    resumed = EnrollmentCheckpoint(path, 'references')
+    assert resumed.is_finished('alice')
+    assert resumed.is_finished('bob')
+    assert not resumed.is_finished('bob', retry_failed=True)
+    assert not resumed.is_finished('carol')
+    assert resumed.counts() == {'enrolled': 1, 'failed': 1}
+
+def test_checkpoint_from_other_mode_or_unreadable_starts_over(tmp_path):
+    path = str(tmp_path / 'checkpoint.json')
+    checkpoint = EnrollmentCheckpoint(path, 'references')
+    checkpoint.record('alice', 'enrolled', references=5)
+    checkpoint.save()
+    assert EnrollmentCheckpoint(path, 'select').users == {}
+
+    with open(path, 'w') as f:
+        f.write('{not json')
+    assert EnrollmentCheckpoint(path, 'references').users == {}
+
+def prepared_user(user_id, names, cached_names):
+    infos = [{'name': name, 'updated_at': '1', 'metadata': {'eTag': name, 'size': 1}} for name in names]
+    return {
+        "user_id": user_id,
+        "selected_infos": infos,
+        "cached": {name: np.ones(512, dtype=np.float32) for name in cached_names},
+        "downloaded": {},
+        "total_files_found": len(names),
+        "timings_ms": {}
+    }
+
+def test_failed_downloads_are_not_recorded_as_current(tmp_path, monkeypatch):
+    names = [f"{i}.jpg" for i in range(5)]
+    prepared = {
+        'current_user': prepared_user('current_user', names, names),
+        # Two references missing and neither downloaded, three cached: below min_images
+        'short_user': prepared_user('short_user', names, names[:3]),
+        # One reference missing and not downloaded, four cached: still enough
+        'partial_user': prepared_user('partial_user', names, names[:4])
+    }
+    monkeypatch.setattr(enroll_all.api, 'prepare_user_references', lambda user_id, *args: prepared[user_id])
+
+    checkpoint = EnrollmentCheckpoint(str(tmp_path / 'checkpoint.json'), 'references')
+    pre_embed_users(list(prepared), checkpoint, min_images=4, max_images=5)
+
+    assert checkpoint.users['current_user']['status'] == 'current'
+    assert checkpoint.users['short_user']['status'] == 'failed'
+    assert not checkpoint.is_finished('short_user', retry_failed=True)
+    assert checkpoint.users['partial_user']['status'] == 'enrolled'
+    assert checkpoint.users['partial_user']['references'] == 4
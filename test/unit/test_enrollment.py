@@ -0,0 +1,59 @@
+from io import BytesIO
+import numpy as np
+import torch
+from PIL import Image
+import face_auth_api as api
+import reference_selection
+
+class CountingAligner:
+    """Stands in for MTCNN: every image has a centred face; counts detector calls"""
+
+    def __init__(self):
+        self.detected = []
+
+    def detect(self, images):
+        self.detected.extend(images)
+        return [{"box": [0.0, 0.0, float(image.width), float(image.height)], "probability": 0.99,
+                 "landmarks": [[10.0, 20.0], [30.0, 20.0]]} for image in images]
+
+    def is_face(self, detection):
+        return detection is not None
+
+    def align(self, image, detection, output_size=(160, 160)):
+        return image.resize(output_size)
+
+    def face_probabilities(self, images):
+        return [detection["probability"] for detection in self.detect(images)]
+
+class ConstantModel:
+    def get_embeddings(self, batch):
+        return torch.ones(batch.shape[0], 512)
+
+def jpeg(seed):
+    pixels = np.random.default_rng(seed).integers(60, 190, (64, 64, 3), dtype=np.uint8)
+    buffer = BytesIO()
+    Image.fromarray(pixels).save(buffer, format='JPEG')
+    return buffer.getvalue()
+
+def test_enrollment_detects_each_candidate_once(monkeypatch):
+    names = [f"{i}.jpg" for i in range(5)]
+    images = {name: jpeg(i) for i, name in enumerate(names)}
+    aligner = CountingAligner()
+    stored = {}
+
+    monkeypatch.setattr(api, 'FACE_DETECTION', True)
+    monkeypatch.setattr(api, 'embedding_cache', None)
+    monkeypatch.setattr(api, 'model', ConstantModel())
+    monkeypatch.setattr(api, 'device', torch.device('cpu'))
+    monkeypatch.setattr(api, 'get_face_aligner', lambda: aligner)
+    monkeypatch.setattr(reference_selection, 'get_face_aligner', lambda: aligner)
+    monkeypatch.setattr(api, 'list_file_objects_in_supabase_folder', lambda bucket, folder: [
+        {'name': name, 'updated_at': '1', 'metadata': {'eTag': name, 'size': 1}} for name in names])
+    monkeypatch.setattr(api, 'download_user_images', lambda bucket, folder, filenames: dict(images))
+    monkeypatch.setattr(api, 'store_gallery_entry', lambda user_id, files, *args, **kwargs: stored.update({user_id: files}))
+
+    result = api.enroll_user_references('alice', max_references=3, min_references=2, check_faces=True)
+
+    assert len(result['selected']) == 3 and stored['alice'] == result['selected']
+    assert all(entry['face_probability'] == 0.99 for entry in result['scores'].values())
+    assert len(aligner.detected) == len(names)
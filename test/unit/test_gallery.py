@@ -0,0 +1,64 @@
+import os
+import numpy as np
+from gallery import EmbeddingGallery
+
+def file_info(name, etag='a'):
+    return {'name': name, 'updated_at': '2024-01-01', 'metadata': {'eTag': etag, 'size': 10}}
+
+def embeddings(count, value=1.0):
+    return np.full((count, 512), value, dtype=np.float32)
+
+def test_entries_persist_and_lookup_by_signature(tmp_path):
+    gallery = EmbeddingGallery(str(tmp_path), variant='draft')
+    infos = [file_info('a.jpg'), file_info('b.jpg')]
+    gallery.put('alice', ['a.jpg', 'b.jpg'], [gallery.signature(info) for info in infos], embeddings(2))
+
+    reopened = EmbeddingGallery(str(tmp_path), variant='draft')
+    cached, missing = reopened.lookup('alice', [file_info('a.jpg'), file_info('b.jpg', etag='changed')])
+    assert list(cached) == ['a.jpg']
+    assert [info['name'] for info in missing] == ['b.jpg']
+
+    # Another preprocessing variant treats every cached embedding as stale
+    cached, missing = EmbeddingGallery(str(tmp_path), variant='full').lookup('alice', infos)
+    assert not cached and len(missing) == 2
+
+def test_entry_rewritten_by_another_process_is_reloaded(tmp_path):
+    worker = EmbeddingGallery(str(tmp_path))
+    job = EmbeddingGallery(str(tmp_path))
+    names = ['a.jpg', 'b.jpg', 'c.jpg']
+    job.put('alice', names, ['s'] * 3, embeddings(3), selection={"selected": ['a.jpg', 'b.jpg']})
+    assert worker.selected_files('alice') == ['a.jpg', 'b.jpg']
+
+    job.put('alice', names, ['s'] * 3, embeddings(3, 2.0), selection={"selected": ['c.jpg']})
+    assert worker.selected_files('alice') == ['c.jpg']
+    assert worker.get('alice')['embeddings'][0, 0] == 2.0
+    assert worker.user_versions()['alice'] == job.get('alice')['updated_at']
+
+def test_entry_removed_on_disk_is_dropped(tmp_path):
+    gallery = EmbeddingGallery(str(tmp_path))
+    gallery.put('alice', ['a.jpg'], ['s'], embeddings(1))
+    assert gallery.get('alice') is not None
+
+    for name in os.listdir(tmp_path):
+        os.remove(tmp_path / name)
+    assert gallery.get('alice') is None
+
+def test_memory_only_gallery(tmp_path):
+    gallery = EmbeddingGallery(None)
+    gallery.put('alice', ['a.jpg'], ['s'], embeddings(1), selection={"selected": ['a.jpg']})
+    assert gallery.selected_files('alice') == ['a.jpg']
+    assert set(gallery.user_versions()) == {'alice'}
+
+def test_least_recently_used_entries_are_evicted_and_reloaded(tmp_path):
+    gallery = EmbeddingGallery(str(tmp_path), max_users=2)
+    for value, user_id in enumerate(['alice', 'bob', 'carol']):
+        gallery.put(user_id, ['a.jpg'], ['s'], embeddings(1, value))
+    assert gallery.stats()['users_in_memory'] == 2
+    assert gallery.stats()['evictions'] == 1
+
+    # Reading bob makes carol the least recently used
+    assert gallery.get('bob') is not None
+    assert gallery.get('alice')['embeddings'][0, 0] == 0
+    assert set(gallery._entries) == {'bob', 'alice'}
+    assert gallery.get('carol')['embeddings'][0, 0] == 2
+    assert set(gallery.user_versions()) == {'alice', 'bob', 'carol'}
@@ -0,0 +1,97 @@
+import os
+import random
+import numpy as np
+import pytest
+from PIL import Image
+from condensing_images import plan_sample
+from image_dedup import BKTree, ImageDeduplicator, dhash, phash, hamming_distance
+
+def frame(seed):
+    """Smooth random scene, like a video frame"""
+    small = np.random.default_rng(seed).integers(0, 256, (8, 8, 3), dtype=np.uint8)
+    return np.asarray(Image.fromarray(small).resize((96, 96), Image.BICUBIC), dtype=np.int16)
+
+def save(path, pixels, **kwargs):
+    Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).save(path, **kwargs)
+    return str(path)
+
+def make_frames(folder):
+    """Three scenes, each with an exact copy and a slightly brighter, noisier, re-encoded copy"""
+    folder.mkdir(exist_ok=True)
+    noise = np.random.default_rng(99)
+    paths = []
+    for scene in range(3):
+        pixels = frame(scene)
+        paths.append(save(folder / f"scene{scene}_a.png", pixels))
+        paths.append(save(folder / f"scene{scene}_b.png", pixels))
+        paths.append(save(folder / f"scene{scene}_c.jpg", pixels + 3 + noise.integers(-2, 3, pixels.shape), quality=90))
+    return paths
+
+@pytest.mark.parametrize('hash_function', [dhash, phash])
+def test_near_identical_frames_hash_close_and_distinct_scenes_far(tmp_path, hash_function):
+    paths = make_frames(tmp_path / 'frames')
+    hashes = [hash_function(path) for path in paths]
+    for scene in range(3):
+        a, b, c = hashes[scene * 3:scene * 3 + 3]
+        assert a == b
+        assert hamming_distance(a, c) <= 6
+    assert min(hamming_distance(hashes[i], hashes[j]) for i in (0, 3, 6) for j in (0, 3, 6) if i < j) > 6
+
+@pytest.mark.parametrize('algorithm', ['dhash', 'phash'])
+def test_duplicates_are_collapsed(tmp_path, algorithm):
+    paths = make_frames(tmp_path / 'frames')
+    deduplicator = ImageDeduplicator(max_distance=6, algorithm=algorithm, workers=2)
+    assert deduplicator.select(paths) == [paths[0], paths[3], paths[6]]
+    assert deduplicator.stats['duplicates'] == 6
+    assert ImageDeduplicator(max_distance=6, algorithm=algorithm).select(paths, limit=2) == [paths[0], paths[3]]
+
+def test_sampling_with_dedup_keeps_one_frame_per_scene(tmp_path):
+    make_frames(tmp_path / 'frames')
+    jobs = plan_sample(tmp_path / 'frames', tmp_path / 'out', num_images=5, seed=0,
+                       deduplicator=ImageDeduplicator(max_distance=6))
+    assert len(jobs) == 3
+    scenes = {source.name.split('_')[0] for source, _ in jobs}
+    assert scenes == {'scene0', 'scene1', 'scene2'}
+
+def test_bk_tree_radius_search_matches_brute_force():
+    rng = random.Random(0)
+    values = [rng.getrandbits(64) for _ in range(300)]
+    # Close neighbours of a few values, so small radii have matches
+    values += [value ^ (1 << rng.randrange(64)) ^ (1 << rng.randrange(64)) for value in values[:30]]
+    tree = BKTree()
+    for index, value in enumerate(values):
+        tree.add(value, index)
+    assert tree.size == len(values)
+    assert BKTree().search(0, 10) == []
+
+    for query in values[:40] + [rng.getrandbits(64) for _ in range(10)]:
+        for radius in (0, 2, 6, 24):
+            expected = sorted((hamming_distance(query, value), index) for index, value in enumerate(values)
+                              if hamming_distance(query, value) <= radius)
+            assert sorted(tree.search(query, radius)) == expected
+
+def test_cached_hashes_are_reused_until_the_file_changes(tmp_path):
+    paths = make_frames(tmp_path / 'frames')[:3]
+    cache_path = str(tmp_path / 'hashes.json')
+    first = ImageDeduplicator(cache_path=cache_path)
+    hashes = first.compute_hashes(paths)
+    first.save()
+    assert first.stats['hashed'] == 3
+
+    second = ImageDeduplicator(cache_path=cache_path)
+    assert second.compute_hashes(paths) == hashes
+    assert second.stats == {"hashed": 0, "cached": 3, "failed": 0, "duplicates": 0}
+    # Another algorithm has its own entries
+    other = ImageDeduplicator(cache_path=cache_path, algorithm='phash')
+    other.compute_hashes(paths)
+    assert other.stats['hashed'] == 3
+
+    # Same size, new mtime
+    stat = os.stat(paths[0])
+    os.utime(paths[0], ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    # New content, so a new size
+    save(paths[2], frame(7), quality=50)
+    third = ImageDeduplicator(cache_path=cache_path)
+    updated = third.compute_hashes(paths)
+    assert third.stats['hashed'] == 2 and third.stats['cached'] == 1
+    assert updated[0] == hashes[0] and updated[2] != hashes[2]
@@ -0,0 +1,50 @@
+import json
+from metrics import MetricsRegistry
+
+def build_registry(shared_dir=None):
+    registry = MetricsRegistry(shared_dir)
+    requests = registry.counter('requests_total', 'Requests', ('endpoint', 'status'))
+    latency = registry.histogram('latency_seconds', 'Latency', ('endpoint',), buckets=(0.1, 1.0))
+    return registry, requests, latency
+
+def test_render_counter_and_cumulative_histogram():
+    registry, requests, latency = build_registry()
+    requests.inc(endpoint='compare', status=200)
+    requests.inc(2, endpoint='compare', status=200)
+    for value in (0.05, 0.5, 3.0):
+        latency.observe(value, endpoint='compare')
+
+    lines = registry.render().splitlines()
+    assert 'requests_total{endpoint="compare",status="200"} 3' in lines
+    assert 'latency_seconds_bucket{endpoint="compare",le="0.1"} 1' in lines
+    assert 'latency_seconds_bucket{endpoint="compare",le="1"} 2' in lines
+    assert 'latency_seconds_bucket{endpoint="compare",le="+Inf"} 3' in lines
+    assert 'latency_seconds_sum{endpoint="compare"} 3.55' in lines
+    assert 'latency_seconds_count{endpoint="compare"} 3' in lines
+
+def test_collect_sums_snapshots_of_every_worker(tmp_path):
+    worker, worker_requests, worker_latency = build_registry(str(tmp_path))
+    worker_requests.inc(endpoint='compare', status=200)
+    worker_latency.observe(0.05, endpoint='compare')
+    worker.write_snapshot(force=True)
+    # A second worker publishes under its own pid
+    snapshot_path = tmp_path / 'metrics-0.json'
+    snapshot_path.write_text(json.dumps(worker.snapshot()))
+
+    merged = worker.collect()
+    assert merged['requests_total'] == {json.dumps(['compare', '200']): 2.0}
+    assert merged['latency_seconds'][json.dumps(['compare'])] == [2, 0, 0, 0.1]
+
+    worker.clear_shared_dir()
+    assert not list(tmp_path.glob('metrics-*.json'))
+
+def test_replacement_worker_with_a_reused_pid_keeps_the_dead_workers_totals(tmp_path):
+    dead, dead_requests, _ = build_registry(str(tmp_path))
+    dead_requests.inc(5, endpoint='compare', status=200)
+    dead.write_snapshot(force=True)
+
+    # Same pid as the dead worker, as when the kernel recycles it
+    replacement, replacement_requests, _ = build_registry(str(tmp_path))
+    replacement_requests.inc(endpoint='compare', status=200)
+    assert replacement.collect()['requests_total'] == {json.dumps(['compare', '200']): 6.0}
+    assert len(list(tmp_path.glob('metrics-*.json'))) == 2
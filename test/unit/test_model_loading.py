@@ -0,0 +1,61 @@
+import pytest
+import torch
+import face_auth_api as api
+from face_auth_api import RealVGGFace2Model, load_vggface2_model
+
+def save_vggface2_checkpoint(path, num_classes=3):
+    """Checkpoint shaped like one trained from pretrained='vggface2' (with the 8631-way logits layer)"""
+    torch.manual_seed(0)
+    model = RealVGGFace2Model(num_classes=num_classes, pretrained=None)
+    state_dict = model.state_dict()
+    state_dict['backbone.logits.weight'] = torch.randn(8631, 512)
+    state_dict['backbone.logits.bias'] = torch.randn(8631)
+    torch.save({
+        'model_state_dict': state_dict,
+        'num_classes': num_classes,
+        'class_names': [f"class_{i}" for i in range(num_classes)]
+    }, path)
+    return model.eval()
+
+def test_loads_checkpoint_with_vggface2_logits(tmp_path):
+    path = str(tmp_path / 'face_ver.pth')
+    reference = save_vggface2_checkpoint(path)
+
+    model, class_names = load_vggface2_model(path)
+
+    assert model is not None
+    assert class_names == ['class_0', 'class_1', 'class_2']
+    assert not any(p.is_meta for p in model.parameters())
+    assert not any(b.is_meta for b in model.buffers())
+
+    batch = torch.randn(2, 3, 160, 160)
+    expected = reference.get_embeddings(batch)
+    actual = model.get_embeddings(batch.to(api.device)).cpu()
+    assert torch.allclose(actual, expected, atol=1e-5)
+
+def test_exported_artifacts_match_eager_model(tmp_path):
+    from export_model import EmbeddingExportWrapper, export_torchscript, export_onnx, write_metadata
+    from inference_backends import TorchScriptBackend, OnnxRuntimeBackend
+
+    path = str(tmp_path / 'face_ver.pth')
+    reference = save_vggface2_checkpoint(path)
+    model, class_names = load_vggface2_model(path)
+    wrapper = EmbeddingExportWrapper(model.cpu().eval()).eval()
+    example = torch.randn(2, 3, 160, 160)
+    batch = torch.randn(3, 3, 160, 160)
+    expected = reference.get_embeddings(batch)
+
+    torchscript_path = str(tmp_path / 'face_ver.torchscript.pt')
+    export_torchscript(wrapper, example, torchscript_path)
+    write_metadata(torchscript_path, model, class_names, 'torchscript')
+    backend = TorchScriptBackend(torchscript_path, torch.device('cpu'))
+    assert backend.metadata['class_names'] == class_names
+    assert torch.allclose(backend.get_embeddings(batch), expected, atol=1e-4)
+
+    pytest.importorskip('onnxruntime')
+    onnx_path = str(tmp_path / 'face_ver.onnx')
+    export_onnx(wrapper, example, onnx_path)
+    backend = OnnxRuntimeBackend(onnx_path)
+    # No session (and no ONNX Runtime thread pool) until first use, so a preloading master can fork safely
+    assert backend.session is None
+    assert torch.allclose(backend.get_embeddings(batch), expected, atol=1e-4)
@@ -0,0 +1,38 @@
+import json
+import numpy as np
+from PIL import Image
+from pack_dataset import pack_dataset, PackedFaceDataset, INDEX_FILE
+
+def make_dataset(root):
+    rng = np.random.default_rng(0)
+    pixels = {}
+    for person, count in (('alice', 2), ('bob', 3), ('carol', 0)):
+        folder = root / person
+        folder.mkdir(parents=True)
+        for i in range(count):
+            array = rng.integers(0, 256, (16, 16, 3), dtype=np.uint8)
+            Image.fromarray(array).save(folder / f"{i}.png")
+            pixels[f"{person}/{i}.png"] = array
+    (root / 'bob' / 'broken.jpg').write_bytes(b'not an image')
+    return pixels
+
+def test_packed_dataset_round_trips_pixels_and_labels(tmp_path):
+    pixels = make_dataset(tmp_path / 'data')
+    index = pack_dataset(str(tmp_path / 'data'), str(tmp_path / 'packed'), size=(16, 16), workers=2)
+    assert index['total_images'] == 5
+    with open(tmp_path / 'packed' / INDEX_FILE) as f:
+        assert json.load(f) == index
+    assert [shard['count'] for shard in index['shards']] == [2, 3, 0]
+
+    dataset = PackedFaceDataset(str(tmp_path / 'packed'))
+    assert len(dataset) == 5
+    assert dataset.class_names == ['alice', 'bob', 'carol']
+    sources = [source for shard in index['shards'] for source in shard['sources']]
+    for idx, source in enumerate(sources):
+        image, label = dataset[idx]
+        assert image.dtype == np.uint8 and image.shape == (16, 16, 3)
+        assert np.array_equal(image, pixels[source])
+        assert label == dataset.class_names.index(source.split('/')[0])
+
+    flipped = PackedFaceDataset(str(tmp_path / 'packed'), transform=lambda image: image[:, ::-1])
+    assert np.array_equal(flipped[4][0], pixels[sources[4]][:, ::-1])
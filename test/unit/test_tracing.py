@@ -0,0 +1,28 @@
+from tracing import RequestTrace, trace_requested
+
+def test_trace_summary_and_chrome_export(tmp_path):
+    trace = RequestTrace('compare', explicit=True)
+    start = trace.started
+    trace.add_span('decode', start, start + 0.002)
+    trace.add_span('decode', start + 0.002, start + 0.003)
+    trace.add_span('forward', start + 0.003, start + 0.010, {'batch': 2})
+
+    summary = trace.summary()
+    assert summary['stages']['decode'] == {'count': 2, 'total_ms': 3.0}
+    assert summary['torch_profile'] is None
+
+    events = trace.chrome_trace()['traceEvents']
+    forward = next(event for event in events if event['name'] == 'forward')
+    assert forward['ph'] == 'X' and forward['args'] == {'batch': 2}
+    assert abs(forward['dur'] - 7000.0) < 1e-6
+
+    paths = [RequestTrace('compare', explicit=False).write(str(tmp_path), max_files=2) for _ in range(3)]
+    assert all(paths)
+    assert len(list(tmp_path.glob('trace-*.json'))) == 2
+
+def test_trace_request_needs_the_shared_secret_when_configured():
+    assert trace_requested({'X-Face-Auth-Trace': '1'}, {})
+    assert not trace_requested({}, {'trace': 'no'})
+    assert not trace_requested({'X-Face-Auth-Trace': '1'}, {}, token='secret')
+    assert not trace_requested({'X-Face-Auth-Trace': '1', 'X-Face-Auth-Trace-Token': 'guess'}, {}, token='secret')
+    assert trace_requested({'X-Face-Auth-Trace-Token': 'secret'}, {'trace': 'true'}, token='secret')
@@ -0,0 +1,76 @@
+import functools
+import numpy as np
+from transformer import BatchCompose, BatchTransforms, CustomCompose, CustomTransforms
+
+def make_batch(seed=0):
+    return np.random.default_rng(seed).integers(0, 256, (6, 32, 32, 3), dtype=np.uint8)
+
+def test_batch_compose_accepts_transforms_directly():
+    pipeline = BatchCompose([BatchTransforms.random_horizontal_flip, BatchTransforms.random_rotation], seed=3)
+    out = pipeline(make_batch())
+    assert out.shape == (6, 32, 32, 3) and out.dtype == np.uint8
+
+def test_batch_compose_mixes_random_and_deterministic_transforms():
+    pipeline = BatchCompose([
+        functools.partial(BatchTransforms.resize, size=(16, 16)),
+        BatchTransforms.random_horizontal_flip,
+        BatchTransforms.to_tensor_normalize
+    ], seed=5)
+    out = pipeline(make_batch())
+    assert out.shape == (6, 3, 16, 16) and out.dtype == np.float32
+    assert out.min() >= -1.0 and out.max() <= 1.0
+
+def test_batch_compose_is_reproducible_with_a_seed():
+    def build():
+        return BatchCompose([
+            BatchTransforms.random_horizontal_flip,
+            functools.partial(BatchTransforms.to_tensor_normalize, mean=[0.5] * 3, std=[0.5] * 3)
+        ], seed=7)
+    first, second = build()(make_batch()), build()(make_batch())
+    assert first.shape == (6, 3, 32, 32)
+    assert np.array_equal(first, second)
+
+def test_random_horizontal_flip_mirrors_selected_images():
+    images = make_batch()
+    original = images.copy()
+    flipped = BatchTransforms.random_horizontal_flip(images, p=1.0, rng=np.random.default_rng(0))
+    assert np.array_equal(flipped, original[:, :, ::-1])
+
+def test_fused_tensor_tail_matches_the_unfused_chain():
+    image = make_batch()[0]
+    fused = CustomCompose([CustomTransforms.to_tensor, CustomTransforms.normalize])
+    assert fused.tensor_params is not None
+    expected = CustomTransforms.normalize(CustomTransforms.to_tensor(image))
+    assert np.array_equal(fused(image), expected)
+
+    # Other statistics fold into one scale and bias, so results may differ in the last bit
+    mean, std = [0.485, 0.456, 0.406], [0.229, 0.224, 0.225]
+    fused = CustomCompose([CustomTransforms.to_tensor, functools.partial(CustomTransforms.normalize, mean=mean, std=std)])
+    expected = CustomTransforms.normalize(CustomTransforms.to_tensor(image), mean=mean, std=std)
+    assert fused.tensor_params is not None
+    np.testing.assert_allclose(fused(image), expected, rtol=0, atol=1e-6)
+
+    # A lambda hides the tail, which then runs unfused
+    unfused = CustomCompose([CustomTransforms.to_tensor, lambda x: CustomTransforms.normalize(x)])
+    assert unfused.tensor_params is None
+    assert np.array_equal(unfused(image), CustomTransforms.normalize(CustomTransforms.to_tensor(image)))
+
+def test_out_buffers_are_written_in_place():
+    image = make_batch()[0]
+    batch = np.zeros((2, 3, 32, 32), dtype=np.float32)
+    pipeline = CustomCompose([CustomTransforms.random_horizontal_flip, CustomTransforms.to_tensor, CustomTransforms.normalize])
+    slot = batch[1]
+    assert pipeline(image, out=slot) is slot
+    assert batch[1].any() and not batch[0].any()
+
+    buffer = np.empty((3, 32, 32), dtype=np.float32)
+    pipeline = CustomCompose([functools.partial(CustomTransforms.resize, size=(32, 32)), CustomTransforms.to_tensor,
+                              CustomTransforms.normalize])
+    assert pipeline(image, out=buffer) is buffer
+    assert np.array_equal(buffer, CustomTransforms.normalize(CustomTransforms.to_tensor(image)))
+
+    tensor = np.empty((3, 32, 32), dtype=np.float32)
+    assert CustomTransforms.to_tensor(image, out=tensor) is tensor
+    normalized = np.empty_like(tensor)
+    assert CustomTransforms.normalize(tensor, out=normalized) is normalized
+    assert np.array_equal(normalized, buffer)
@@ -0,0 +1,109 @@
+import os
+import numpy as np
+import vector_index
+from vector_index import VectorIndex, INDEX_FILE
+
+def user_embeddings(rng, centre, count=4, noise=0.05):
+    return centre + noise * rng.standard_normal((count, 512)).astype(np.float32)
+
+def make_users(count, seed=0):
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((count, 512)).astype(np.float32)
+    return rng, centres, {f"user_{i}": user_embeddings(rng, centre) for i, centre in enumerate(centres)}
+
+def files_for(embeddings):
+    return [f"{i}.jpg" for i in range(len(embeddings))]
+
+def test_exact_search_finds_user(tmp_path):
+    rng, centres, users = make_users(20)
+    index = VectorIndex(str(tmp_path))
+    for user_id, embeddings in users.items():
+        index.add_user(user_id, files_for(embeddings), embeddings, updated_at=1.0)
+
+    results = index.search(centres[[3, 7]], top_k=3)
+    assert [result[0]['user_id'] for result in results] == ['user_3', 'user_7']
+    assert len({match['user_id'] for match in results[0]}) == 3
+    assert index.stats()['mode'] == 'exact'
+
+def test_second_instance_sees_changes_without_search(tmp_path):
+    rng, centres, users = make_users(5)
+    serving = VectorIndex(str(tmp_path))
+    writer = VectorIndex(str(tmp_path))
+    assert len(serving) == 0
+
+    for user_id, embeddings in users.items():
+        writer.add_user(user_id, files_for(embeddings), embeddings)
+    assert len(serving) == 20
+    assert serving.stats()['users'] == 5
+
+    writer.remove_user('user_0')
+    assert len(serving) == 16
+    assert serving.search(centres[:1], top_k=1)[0][0]['user_id'] != 'user_0'
+
+def test_single_user_changes_append_to_log(tmp_path):
+    rng, centres, users = make_users(3)
+    index = VectorIndex(str(tmp_path))
+    index.add_user('user_0', files_for(users['user_0']), users['user_0'])
+    snapshot = os.stat(tmp_path / INDEX_FILE).st_mtime_ns
+
+    index.add_user('user_1', files_for(users['user_1']), users['user_1'])
+    index.add_user('user_0', files_for(users['user_0']), users['user_0'] + 0.01)
+    index.remove_user('user_1')
+    assert os.stat(tmp_path / INDEX_FILE).st_mtime_ns == snapshot
+
+    reopened = VectorIndex(str(tmp_path))
+    assert set(reopened.user_versions()) == {'user_0'}
+    assert len(reopened) == 4
+    assert reopened.search(centres[:1], top_k=1)[0][0]['user_id'] == 'user_0'
+
+def test_log_is_compacted_into_snapshot(tmp_path, monkeypatch):
+    monkeypatch.setattr(vector_index, 'LOG_COMPACT_MIN_ENTRIES', 4)
+    rng, centres, users = make_users(12)
+    index = VectorIndex(str(tmp_path))
+    for user_id, embeddings in users.items():
+        index.add_user(user_id, files_for(embeddings), embeddings)
+
+    logs = [name for name in os.listdir(tmp_path) if name.endswith('.log')]
+    assert len(logs) == 1
+    with open(tmp_path / logs[0]) as f:
+        assert len(f.readlines()) <= 12
+
+    reopened = VectorIndex(str(tmp_path))
+    assert len(reopened) == 48
+    assert reopened.search(centres[[11]], top_k=1)[0][0]['user_id'] == 'user_11'
+
+def test_partial_log_line_is_ignored_and_overwritten(tmp_path):
+    rng, centres, users = make_users(2)
+    index = VectorIndex(str(tmp_path))
+    index.add_user('user_0', files_for(users['user_0']), users['user_0'])
+    log_name = next(name for name in os.listdir(tmp_path) if name.endswith('.log'))
+    with open(tmp_path / log_name, 'a') as f:
+        f.write('{"op": "add", "user_id": "tru')
+
+    reader = VectorIndex(str(tmp_path))
+    assert set(reader.user_versions()) == {'user_0'}
+    reader.add_user('user_1', files_for(users['user_1']), users['user_1'])
+    assert set(VectorIndex(str(tmp_path)).user_versions()) == {'user_0', 'user_1'}
+
+def test_ivf_search_matches_exact(tmp_path):
+    rng, centres, users = make_users(60)
+    exact = VectorIndex(None)
+    ivf = VectorIndex(str(tmp_path), ivf_min_rows=200, nprobe=4)
+    for user_id, embeddings in users.items():
+        exact.add_user(user_id, files_for(embeddings), embeddings)
+        ivf.add_user(user_id, files_for(embeddings), embeddings)
+    assert ivf.stats()['mode'] == 'ivf'
+    ivf.search(centres[:1], top_k=1)
+
+    # Users added and replaced after training are found through the unindexed tail
+    extra = user_embeddings(rng, centres[5])
+    ivf.add_user('user_5', files_for(extra), extra)
+    exact.add_user('user_5', files_for(extra), extra)
+
+    queries = centres + 0.05 * rng.standard_normal(centres.shape).astype(np.float32)
+    assert ([r[0]['user_id'] for r in ivf.search(queries, top_k=1)] ==
+            [r[0]['user_id'] for r in exact.search(queries, top_k=1)])
+    assert ivf.stats()['rows_scanned_per_query'] < len(ivf)
+
+    reopened = VectorIndex(str(tmp_path), ivf_min_rows=200, nprobe=4)
+    assert [r[0]['user_id'] for r in reopened.search(queries[:10], top_k=1)] == [f"user_{i}" for i in range(10)]